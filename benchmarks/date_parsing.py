@@ -0,0 +1,72 @@
+# Micro-benchmark for the date helpers used on every /tasks and every rendered
+# view: the previous jdatetime-based parsing and conversions (reproduced here)
+# against src/dates.py.
+#
+#   python -m benchmarks.date_parsing [--iterations 20000]
+import argparse
+import re
+import time
+from datetime import datetime
+
+import jdatetime
+from src import dates
+
+TEXTS = [
+    "1404-07-01\nتمرین ورزشی\nخرید",
+    "01/07/1404 مطالعه",
+    "2025-09-23\nجلسه",
+    "تمرین ورزشی\nخرید مواد غذایی",
+]
+
+def legacy_parse(text):
+    for pattern in (r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})', r'(\d{1,2}[/-]\d{1,2}[/-]\d{4})'):
+        match = re.search(pattern, text)
+        if match:
+            parts = re.split('[/-]', match.group(1))
+            if len(parts[0]) == 4:
+                year, month, day = int(parts[0]), int(parts[1]), int(parts[2])
+            else:
+                day, month, year = int(parts[0]), int(parts[1]), int(parts[2])
+            if year >= 1300:
+                converted = jdatetime.date(year, month, day).strftime("%Y-%m-%d")
+            else:
+                converted = jdatetime.date.fromgregorian(date=datetime(year, month, day).date()).strftime("%Y-%m-%d")
+            return converted, re.sub(pattern, '', text).strip()
+    return None, text
+
+def legacy_date_to_day(date):
+    return jdatetime.datetime.strptime(date, "%Y-%m-%d").date().togregorian().toordinal()
+
+def legacy_day_to_date(day):
+    return jdatetime.date.fromgregorian(date=datetime.fromordinal(day).date()).strftime("%Y-%m-%d")
+
+def legacy_display(date):
+    return jdatetime.datetime.strptime(date, "%Y-%m-%d").strftime("%Y/%m/%d")
+
+def timed(name, func, inputs, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(inputs[i % len(inputs)])
+    elapsed = time.perf_counter() - start
+    return f"{name:>12}: {elapsed / iterations * 1e6:7.2f}us/call"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    days = list(range(739000, 739000 + 400))
+    date_strings = [dates.day_to_date(day) for day in days]
+    cases = [
+        ("parse", legacy_parse, dates.parse_date, TEXTS),
+        ("date->day", legacy_date_to_day, dates.date_to_day, date_strings),
+        ("day->date", legacy_day_to_date, dates.day_to_date, days),
+        ("display", legacy_display, dates.display_date, date_strings),
+    ]
+    for name, before, after, inputs in cases:
+        print(f"{name}:")
+        print(timed("jdatetime", before, inputs, args.iterations))
+        print(timed("dates.py", after, inputs, args.iterations))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# Minimal stand-in for the Telegram Bot API, used to load-test the bot without
+# touching Telegram. Point the bot at it with BOT_API_BASE_URL=http://host:port/bot.
+# Serves queued synthetic updates (messages and button taps) through getUpdates,
+# answers the send/edit methods with plausible objects and counts every call.
+# Optionally delays every answer (latency + up to jitter seconds) and answers a
+# fraction of the send/edit calls with a 429 "retry after", like Telegram's flood
+# control.
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, deque
+
+import tornado.web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "TrackMe", "username": "trackme_bot"}
+
+# Methods that answer a user; on_send sees every successful call to them
+RESPONSE_METHODS = ("sendMessage", "editMessageText", "sendDocument", "answerCallbackQuery")
+
+def message_update(update_id, user_id, text):
+    command = text.split()[0]
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+        "text": text,
+    }
+    if command.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+def callback_update(update_id, user_id, message, data):
+    # A tap on an inline button of `message` (as returned by sendMessage)
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "chat_instance": str(user_id),
+            "message": message,
+            "data": data,
+        },
+    }
+
+class FakeBotApi:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1):
+        self.updates = deque()
+        self.calls = Counter()
+        self.sent = Counter()
+        self.rate_limited = Counter()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.new_updates = asyncio.Event()
+        # on_send(method, params, result) for every successful RESPONSE_METHODS call
+        self.on_send = None
+        self.closed = False
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+
+    def push(self, user_id, text):
+        update_id = next(self.update_ids)
+        self.updates.append(message_update(update_id, user_id, text))
+        self.new_updates.set()
+        return update_id
+
+    def push_callback(self, user_id, message, data):
+        update_id = next(self.update_ids)
+        self.updates.append(callback_update(update_id, user_id, message, data))
+        self.new_updates.set()
+        return update_id
+
+    def close(self):
+        # Releases long-polling getUpdates calls so the server can shut down cleanly
+        self.closed = True
+        self.new_updates.set()
+
+    def message(self, params):
+        message = {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+        if "reply_markup" in params:
+            message["reply_markup"] = params["reply_markup"]
+        return message
+
+    async def get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates and not self.closed:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self.updates, int(params.get("limit") or 100)))
+
+    async def call(self, method, params):
+        # Returns (ok, result); result is the retry_after seconds when not ok
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return True, await self.get_updates(params)
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+        if method == "getMe":
+            return True, BOT_USER
+        if method in RESPONSE_METHODS:
+            if self.error_rate and random.random() < self.error_rate:
+                self.rate_limited[method] += 1
+                return False, self.retry_after
+            if method == "answerCallbackQuery":
+                result = True
+            else:
+                self.sent[int(params.get("chat_id", 0))] += 1
+                result = self.message(params)
+                if method == "editMessageText":
+                    result["message_id"] = int(params.get("message_id", 0))
+            if self.on_send:
+                self.on_send(method, params, result)
+            return True, result
+        return True, True
+
+    def app(self):
+        # No access log: the injected 429s would otherwise be logged one by one
+        return tornado.web.Application(
+            [(r"/bot[^/]+/(\w+)", _MethodHandler, {"api": self})], log_function=lambda handler: None
+        )
+
+class _MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, api):
+        self.api = api
+
+    def params(self):
+        if self.request.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(self.request.body or b"{}")
+        params = {}
+        for name in self.request.body_arguments:
+            value = self.get_body_argument(name)
+            try:
+                params[name] = json.loads(value)
+            except ValueError:
+                params[name] = value
+        return params
+
+    async def post(self, method):
+        ok, result = await self.api.call(method, self.params())
+        self.set_header("Content-Type", "application/json")
+        if ok:
+            self.write(json.dumps({"ok": True, "result": result}))
+        else:
+            self.set_status(429)
+            self.write(json.dumps({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {result}",
+                "parameters": {"retry_after": result},
+            }))
+
+    get = post
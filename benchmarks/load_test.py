@@ -0,0 +1,217 @@
+# Load generator: runs the real bot (`python -m src.main`, long polling) against the
+# fake Bot API (benchmarks/fake_bot_api.py) and drives thousands of synthetic
+# users through it. Each user is a closed loop that waits for the bot's answer
+# before its next step:
+#
+#   /tasks with --tasks tasks -> /today -> --toggles checkbox taps -> /last5
+#
+# An update's latency runs from the moment it is queued on the fake API until the
+# bot's answer arrives there: the task list for /tasks and /today, the edited list
+# for a tap (the bot runs with TOGGLE_EDIT_DELAY=0 so every tap is edited at once)
+# and the report for /last5. A step with no answer within --timeout counts as lost,
+# e.g. when the fake API answered the bot's reply with a 429.
+#
+#   python -m benchmarks.load_test [--users 2000] [--concurrency 200] [--rounds 1]
+#       [--tasks 5] [--toggles 3] [--latency 0] [--jitter 0] [--error-rate 0] [--json]
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.fake_bot_api import FakeBotApi
+from src.migrations import migrate
+
+# Notifications about teammates are not answers to the recipient's own update
+NOTIFICATION_MARKS = ("📝", "📢")
+STEPS = ("tasks", "today", "toggle", "last5")
+
+def seed_database(path, users, team_size):
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    conn.executemany(
+        'INSERT INTO users (user_id, name, team) VALUES (?, ?, ?)',
+        [(user_id, f"user{user_id}", f"team{(user_id - 1) // team_size}") for user_id in range(1, users + 1)]
+    )
+    conn.close()
+
+def bot_env(port, db_file, workers=1):
+    return dict(
+        os.environ, BOT_TOKEN="123:bench", BOT_API_BASE_URL=f"http://127.0.0.1:{port}/bot",
+        DB_FILE=db_file, LOG_FILE="", SHARD_COUNT=str(workers), TOGGLE_EDIT_DELAY="0",
+    )
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def toggle_buttons(reply_markup):
+    return [
+        row[0]["callback_data"] for row in reply_markup["inline_keyboard"]
+        if len(row) == 1 and row[0]["text"][:1] in ("✅", "⬜")
+    ]
+
+class LoadTest:
+    def __init__(self, api, timeout):
+        self.api = api
+        self.timeout = timeout
+        self.waiting = {}
+        self.latencies = defaultdict(list)
+        self.lost = defaultdict(int)
+        api.on_send = self.on_send
+
+    def on_send(self, method, params, result):
+        chat_id = params.get("chat_id")
+        waiter = self.waiting.get(int(chat_id)) if chat_id is not None else None
+        if waiter is None or waiter[1].done():
+            return
+        accept, future = waiter
+        if accept(method, params, result):
+            future.set_result(dict(result, reply_markup=params.get("reply_markup")))
+
+    async def step(self, name, user_id, push, accept):
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[user_id] = (accept, future)
+        start = time.perf_counter()
+        push()
+        try:
+            result = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.lost[name] += 1
+            return None
+        finally:
+            del self.waiting[user_id]
+        self.latencies[name].append(time.perf_counter() - start)
+        return result
+
+    async def user(self, user_id, rounds, tasks, toggles):
+        def task_list(method, params, result):
+            return method == "sendMessage" and params.get("reply_markup") is not None
+
+        def report(method, params, result):
+            return method == "sendMessage" and not str(params.get("text", "")).startswith(NOTIFICATION_MARKS)
+
+        lines = "\n".join(f"task {i}" for i in range(tasks))
+        for _ in range(rounds):
+            await self.step("tasks", user_id, lambda: self.api.push(user_id, f"/tasks\n{lines}"), task_list)
+            message = await self.step("today", user_id, lambda: self.api.push(user_id, "/today"), task_list)
+            for tap in range(toggles if message else 0):
+                buttons = toggle_buttons(message["reply_markup"])
+                if not buttons:
+                    break
+                data, tapped = buttons[tap % len(buttons)], message
+
+                def edited(method, params, result, message_id=message["message_id"]):
+                    return method == "editMessageText" and int(params.get("message_id", 0)) == message_id
+
+                result = await self.step(
+                    "toggle", user_id, lambda: self.api.push_callback(user_id, tapped, data), edited
+                )
+                if result is None:
+                    break
+                message = dict(message, reply_markup=result["reply_markup"])
+            await self.step("last5", user_id, lambda: self.api.push(user_id, "/last5"), report)
+
+async def run(users=2000, concurrency=200, rounds=1, tasks=5, toggles=3, team_size=5, latency=0.0,
+              jitter=0.0, error_rate=0.0, retry_after=1, timeout=10.0, workers=1):
+    api = FakeBotApi(latency=latency, jitter=jitter, error_rate=error_rate, retry_after=retry_after)
+    server = api.app().listen(0, "127.0.0.1")
+    port = next(iter(server._sockets.values())).getsockname()[1]
+    db_file = os.path.join(tempfile.mkdtemp(), "load.db")
+    seed_database(db_file, users, team_size)
+    test = LoadTest(api, timeout)
+
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "src.main", env=bot_env(port, db_file, workers),
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while api.calls["getUpdates"] < 1 or api.calls["setMyCommands"] < 1:
+            if bot.returncode is not None or time.monotonic() > deadline:
+                raise RuntimeError("The bot did not start; run `python -m src.main` with the same env to see why")
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(1)
+
+        slots = asyncio.Semaphore(concurrency)
+
+        async def limited(user_id):
+            async with slots:
+                await test.user(user_id, rounds, tasks, toggles)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(limited(user_id) for user_id in range(1, users + 1)))
+        elapsed = time.perf_counter() - start
+    finally:
+        if bot.returncode is None:
+            bot.send_signal(signal.SIGTERM)
+        await bot.wait()
+        api.close()
+        await asyncio.sleep(0.1)
+        server.stop()
+
+    every = [value for step in STEPS for value in test.latencies[step]]
+    result = {
+        "updates": len(every),
+        "lost": sum(test.lost.values()),
+        "seconds": round(elapsed, 2),
+        "updates_per_sec": round(len(every) / elapsed, 1),
+        "p50_ms": round(percentile(every, 0.5) * 1000, 1) if every else None,
+        "p99_ms": round(percentile(every, 0.99) * 1000, 1) if every else None,
+        "rate_limited": sum(api.rate_limited.values()),
+        "steps": {},
+    }
+    for step in STEPS:
+        values = test.latencies[step]
+        result["steps"][step] = {
+            "count": len(values),
+            "lost": test.lost[step],
+            "p50_ms": round(percentile(values, 0.5) * 1000, 1) if values else None,
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1) if values else None,
+        }
+    return result
+
+def print_result(result):
+    print(f"{result['updates']} updates in {result['seconds']}s = {result['updates_per_sec']} updates/s, "
+          f"p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+          f"{result['lost']} lost, {result['rate_limited']} answered with 429")
+    for step, values in result["steps"].items():
+        print(f"  {step:>6}: {values['count']:6} ok {values['lost']:4} lost  "
+              f"p50 {values['p50_ms']} ms  p99 {values['p99_ms']} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="users active at the same time")
+    parser.add_argument("--rounds", type=int, default=1, help="times each user runs the script")
+    parser.add_argument("--tasks", type=int, default=5)
+    parser.add_argument("--toggles", type=int, default=3)
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake API answer delay (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay up to this (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of send/edit calls answered 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds before a step counts as lost")
+    parser.add_argument("--workers", type=int, default=1, help="SHARD_COUNT for the bot")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(
+        users=args.users, concurrency=args.concurrency, rounds=args.rounds, tasks=args.tasks,
+        toggles=args.toggles, team_size=args.team_size, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, retry_after=args.retry_after, timeout=args.timeout, workers=args.workers,
+    ))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_result(result)
+
+if __name__ == "__main__":
+    main()
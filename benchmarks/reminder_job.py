@@ -0,0 +1,63 @@
+# Times the 9:00 "no tasks yet" reminder job for a large synthetic user base:
+# the old per-user has_tasks_for_date probes against the set-based query that
+# streams recipients into the broadcast queue in chunks.
+#
+#   python -m benchmarks.reminder_job [--users 10000] [--with-tasks 0.3]
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import jdatetime
+from src import database, async_database, broadcast, notifications
+from src.config import USERS
+from src.dates import date_to_day
+
+# Count recipients instead of sending: only the selection cost is measured here
+queued = []
+broadcast.enqueue = lambda chat_id, text, **kwargs: queued.append(chat_id)
+
+def seed(users, with_tasks, today):
+    database.init_database()
+    day = date_to_day(today)
+    USERS.clear()
+    USERS.update({user_id: f"user{user_id}" for user_id in range(1, users + 1)})
+    with database.write_connection() as conn:
+        conn.executemany(
+            'INSERT INTO tasks (user_id, date, day, task_text, is_done, position) VALUES (?, ?, ?, ?, 0, 0)',
+            [(user_id, today, day, "task") for user_id in USERS if random.random() < with_tasks]
+        )
+
+async def per_user_probes(today):
+    for user_id in USERS:
+        if not await async_database.has_tasks_for_date(user_id, today):
+            broadcast.enqueue(user_id, "reminder")
+
+async def set_based(today):
+    await notifications.send_task_reminders(list(USERS), today)
+
+async def run(today):
+    for name, job in (("per-user", per_user_probes), ("set-based", set_based)):
+        queued.clear()
+        start = time.perf_counter()
+        await job(today)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>9}: {elapsed * 1000:8.1f}ms for {len(USERS)} users, {len(queued)} reminders queued")
+    await async_database.shutdown_database()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--with-tasks", type=float, default=0.3, help="fraction of users who already entered tasks")
+    args = parser.parse_args()
+
+    today = jdatetime.date.today().strftime("%Y-%m-%d")
+    seed(args.users, args.with_tasks, today)
+    asyncio.run(run(today))
+
+if __name__ == "__main__":
+    main()
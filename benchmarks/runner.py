@@ -0,0 +1,121 @@
+# Runs the load-test scenarios (benchmarks/load_test.py) and compares them with the
+# stored baselines in benchmarks/baselines.json. A scenario regresses when its
+# updates/s drops, or its p99 latency rises, by more than --tolerance, or when it
+# loses more updates than its baseline did. Baselines are only comparable on the
+# same machine; each one records where it was taken.
+#
+#   python -m benchmarks.runner [--scenario mixed,...] [--users N] [--save] [--check]
+#
+# --save replaces the baselines of the scenarios that ran; --check exits with 1 on
+# a regression (for CI or before merging a performance-sensitive change).
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks import load_test
+
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# load_test.run() arguments per scenario
+SCENARIOS = {
+    # The full user script against an instant API: the bot's own throughput
+    "mixed": {},
+    # Telegram-like answer times; the bot must keep many requests in flight
+    "api-latency": {"latency": 0.05, "jitter": 0.02},
+    # 1% of sends and edits answered with 429; steps that never get an answer are lost
+    "rate-limited": {"error_rate": 0.01, "retry_after": 1},
+}
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_baselines():
+    try:
+        with open(BASELINES, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_baselines(baselines):
+    with open(BASELINES, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def regressions(result, baseline, tolerance):
+    problems = []
+    if result["updates_per_sec"] < baseline["updates_per_sec"] * (1 - tolerance):
+        problems.append(f"updates/s {baseline['updates_per_sec']} -> {result['updates_per_sec']}")
+    if result["p99_ms"] is not None and baseline["p99_ms"] is not None \
+            and result["p99_ms"] > baseline["p99_ms"] * (1 + tolerance):
+        problems.append(f"p99 {baseline['p99_ms']} ms -> {result['p99_ms']} ms")
+    # Lost updates under injected 429s vary from run to run, so allow the same slack
+    if result["lost"] > baseline["lost"] * (1 + tolerance) + 1:
+        problems.append(f"lost {baseline['lost']} -> {result['lost']}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", default=",".join(SCENARIOS), help="comma-separated scenario names")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative change")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baselines")
+    parser.add_argument("--check", action="store_true", help="exit with 1 on a regression")
+    args = parser.parse_args()
+
+    names = [name for name in args.scenario.split(",") if name]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}")
+
+    baselines = load_baselines()
+    regressed = False
+    for name in names:
+        settings = dict(users=args.users, concurrency=args.concurrency, workers=args.workers)
+        settings.update(SCENARIOS[name])
+        print(f"== {name}: {settings}")
+        result = asyncio.run(load_test.run(**settings))
+        load_test.print_result(result)
+
+        baseline = baselines.get(name)
+        if baseline is None:
+            print("   no baseline")
+        elif baseline["settings"] != settings:
+            print(f"   baseline was taken with different settings: {baseline['settings']}")
+        else:
+            problems = regressions(result, baseline["result"], args.tolerance)
+            for problem in problems:
+                print(f"   REGRESSION: {problem}")
+            if not problems:
+                print(f"   ok against the baseline from {baseline['commit']} ({baseline['taken']})")
+            regressed = regressed or bool(problems)
+
+        if args.save:
+            baselines[name] = {
+                "settings": settings,
+                "result": result,
+                "commit": git_commit(),
+                "taken": time.strftime("%Y-%m-%d %H:%M"),
+                "machine": f"{platform.node()} {platform.machine()}, {os.cpu_count()} CPU, "
+                           f"Python {platform.python_version()}",
+            }
+
+    if args.save:
+        save_baselines(baselines)
+        print(f"Saved baselines to {BASELINES}")
+    if args.check and regressed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# /search latency on a multi-year history: seeds --users users with --years years of
+# --tasks tasks a day (words drawn from a synthetic vocabulary plus a few real
+# ones), then times result pages from the tasks_fts index against a LIKE scan of
+# one user's tasks. "تمرین" is a word in a few percent of tasks, "کلمه" the prefix
+# shared by the whole synthetic vocabulary (the worst case for prefix matching).
+#
+#   python -m benchmarks.search_latency [--users 50] [--years 3] [--tasks 6]
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from src import database, search
+from src.dates import day_to_date
+
+WORDS = ["خرید", "ورزش", "مطالعه", "جلسه", "گزارش", "كتاب", "یوگا", "تمرین"]
+QUERIES = ["خرید", "كتاب", "جلسه گزارش", "تمرین", "کلمه12", "کلمه"]
+FIRST_DAY = 739000
+
+def seed(users, years, tasks_per_day):
+    database.init_database()
+    rng = random.Random(1)
+    vocabulary = [f"کلمه{i}" for i in range(3000)] + WORDS * 20
+    with database.write_connection() as conn:
+        for user_id in range(1, users + 1):
+            conn.executemany(
+                'INSERT INTO tasks (user_id, date, day, task_text, is_done, position) VALUES (?, ?, ?, ?, ?, ?)',
+                [(user_id, day_to_date(day), day, " ".join(rng.choices(vocabulary, k=3)), rng.random() < 0.5, position)
+                 for day in range(FIRST_DAY, FIRST_DAY + years * 365) for position in range(tasks_per_day)]
+            )
+
+def timed(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+def like_scan(user_id, text):
+    with database.read_connection() as conn:
+        return conn.execute(
+            'SELECT COUNT(*) FROM tasks WHERE user_id = ? AND task_text LIKE ?', (user_id, f"%{text}%")
+        ).fetchone()[0]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--tasks", type=int, default=6, help="tasks per user and day")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    seed(args.users, args.years, args.tasks)
+    total = args.users * args.years * 365 * args.tasks
+    print(f"Seeded {total} tasks in {time.perf_counter() - start:.1f}s")
+
+    user_id = 1
+    for text in QUERIES:
+        words = search.query_words(text)
+        fts_ms, (rows, matches) = timed(lambda: database.search_tasks(user_id, words, 10), args.repeat)
+        like_ms, _ = timed(lambda: like_scan(user_id, text), args.repeat)
+        print(f"{text:>12}: {matches:6} matches  first page {fts_ms:7.2f} ms  LIKE scan {like_ms:7.2f} ms")
+    database.close_database()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# End-to-end throughput of the bot with 1..N shard workers. Starts the fake Bot API
+# (benchmarks/fake_bot_api.py), runs `python -m src.main` against it with
+# SHARD_COUNT=N, queues synthetic commands from many users and measures how fast
+# the replies come back. Every command produces exactly one reply.
+#
+# The large-team case then has --team users, all in one team, enter tasks at once:
+# every entry notifies all teammates, so for N > 1 most notifications cross shards
+# through the dispatcher in both directions (the pipes once deadlocked under this
+# load). /tasks answers with a confirmation and the task list; teammate
+# notifications are not counted. Exits 1 if any case misses replies.
+#
+#   python -m benchmarks.shard_throughput [--workers 1,2,4] [--users 200] [--updates 3000] [--team 400]
+import argparse
+import asyncio
+import itertools
+import os
+import signal
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_bot_api import FakeBotApi
+
+COMMANDS = ["/today", "/last5", "/history 7", "/date 1404-07-01"]
+
+def bot_env(workers, users, port, db_file):
+    env = dict(os.environ, BOT_TOKEN="123:bench", BOT_API_BASE_URL=f"http://127.0.0.1:{port}/bot",
+               DB_FILE=db_file, SHARD_COUNT=str(workers), ADMIN_IDS="1")
+    for i in range(1, users + 1):
+        env[f"USER{i}_ID"] = str(i)
+        env[f"USER{i}_NAME"] = f"user{i}"
+    return env
+
+async def run_once(workers, users, updates, timeout, commands=COMMANDS, replies_per_update=1):
+    expected = updates * replies_per_update
+    api = FakeBotApi()
+    server = api.app().listen(0, "127.0.0.1")
+    port = next(iter(server._sockets.values())).getsockname()[1]
+
+    replies = 0
+    done = asyncio.Event()
+    def on_send(method, params, result):
+        nonlocal replies
+        if str(params.get("text", "")).startswith("📝"):
+            return
+        replies += 1
+        if replies >= expected:
+            done.set()
+    api.on_send = on_send
+
+    db_file = os.path.join(tempfile.mkdtemp(), "bench.db")
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "src.main", env=bot_env(workers, users, port, db_file),
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        # Wait until every worker is up (shard 0 also registers the bot commands)
+        while api.calls["getUpdates"] < 1 or api.calls["setMyCommands"] < 1:
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(1)
+
+        user_ids = itertools.cycle(range(1, users + 1))
+        commands = itertools.cycle(commands)
+        start = time.perf_counter()
+        for _ in range(updates):
+            api.push(next(user_ids), next(commands))
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - start
+    finally:
+        bot.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(bot.wait(), 30)
+        except asyncio.TimeoutError:
+            # A deadlocked dispatcher never runs its signal handler; its workers stop
+            # on their own once its end of the pipes closes
+            print("   the bot did not stop within 30s, killing it")
+            bot.kill()
+            await bot.wait()
+        api.close()
+        await asyncio.sleep(0.1)
+        server.stop()
+
+    print(f"{workers:>2} worker(s): {replies}/{expected} replies in {elapsed:.2f}s = "
+          f"{replies / replies_per_update / elapsed:.0f} updates/s")
+    return replies == expected
+
+async def run(worker_counts, users, updates, timeout, team):
+    complete = True
+    for workers in worker_counts:
+        complete &= await run_once(workers, users, updates, timeout)
+    if team:
+        print(f"large team ({team} users, one /tasks each):")
+        for workers in worker_counts:
+            complete &= await run_once(workers, team, team, timeout, commands=["/tasks\ntask 1\ntask 2"],
+                                         replies_per_update=2)
+    return complete
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4", help="comma separated shard counts to try")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--team", type=int, default=400, help="users in the large-team case (0 skips it)")
+    args = parser.parse_args()
+
+    worker_counts = [int(n) for n in args.workers.split(",")]
+    if not asyncio.run(run(worker_counts, args.users, args.updates, args.timeout, args.team)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
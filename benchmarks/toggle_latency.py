@@ -0,0 +1,93 @@
+# Simulates concurrent checkbox toggles and reports handler latency when the
+# database is called synchronously on the event loop ("before") versus through
+# src.async_database ("after").
+#
+#   python -m benchmarks.toggle_latency [--users 50] [--requests 2000] [--rate 500]
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from src import database, async_database
+
+DATE = "1404-07-01"
+
+def seed(users, tasks_per_user):
+    database.init_database()
+    for user_id in range(1, users + 1):
+        database.save_daily_tasks(user_id, DATE, [f"task {i}" for i in range(tasks_per_user)])
+    return {
+        user_id: [row[0] for row in database.get_tasks_by_date(user_id, DATE)]
+        for user_id in range(1, users + 1)
+    }
+
+async def sync_handler(user_id, task_id):
+    database.toggle_task_status(task_id)
+    database.get_tasks_by_date(user_id, DATE)
+    database.get_all_task_status(user_id, DATE)
+
+async def async_handler(user_id, task_id):
+    await async_database.toggle_task_status(task_id)
+    await async_database.get_tasks_by_date(user_id, DATE)
+    await async_database.get_all_task_status(user_id, DATE)
+
+async def run(handler, task_ids, requests, rate):
+    latencies = []
+    loop_lag = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            loop_lag.append(time.perf_counter() - start - 0.001)
+
+    async def one(arrival, user_id, task_id):
+        await handler(user_id, task_id)
+        latencies.append(time.perf_counter() - arrival)
+
+    users = list(task_ids)
+    tick = asyncio.create_task(ticker())
+    pending = []
+    start = time.perf_counter()
+    for i in range(requests):
+        arrival = start + i / rate
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        user_id = users[i % len(users)]
+        ids = task_ids[user_id]
+        pending.append(asyncio.create_task(one(arrival, user_id, ids[i % len(ids)])))
+    await asyncio.gather(*pending)
+    done.set()
+    await tick
+    return latencies, loop_lag
+
+def report(name, latencies, loop_lag):
+    latencies = sorted(latencies)
+    q = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:>7}: p50={q[49] * 1000:7.2f}ms p99={q[98] * 1000:7.2f}ms "
+        f"max={latencies[-1] * 1000:7.2f}ms loop-lag max={max(loop_lag) * 1000:7.2f}ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=500, help="toggle arrivals per second")
+    args = parser.parse_args()
+
+    task_ids = seed(args.users, args.tasks)
+    print(f"db={database.DB_FILE} users={args.users} requests={args.requests} rate={args.rate}/s")
+    report("before", *asyncio.run(run(sync_handler, task_ids, args.requests, args.rate)))
+    report("after", *asyncio.run(run(async_handler, task_ids, args.requests, args.rate)))
+    asyncio.run(async_database.shutdown_database())
+
+if __name__ == "__main__":
+    main()
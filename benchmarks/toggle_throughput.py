@@ -0,0 +1,78 @@
+# Toggles/sec with one commit per tap ("write-through") versus the write-behind
+# buffer ("write-behind"), with concurrent clients tapping as fast as they can.
+# Afterwards checks that the database holds the state implied by the taps.
+#
+#   python -m benchmarks.toggle_throughput [--toggles 20000] [--clients 50] [--interval 0.05]
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("DB_FILE", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from src import database, async_database, toggle_buffer
+
+DATE = "1404-07-01"
+
+def seed(users, tasks_per_user):
+    database.init_database()
+    for user_id in range(1, users + 1):
+        database.save_daily_tasks(user_id, DATE, [f"task {i}" for i in range(tasks_per_user)])
+    with database.read_connection() as conn:
+        return [row[0] for row in conn.execute('SELECT id FROM tasks')]
+
+def done_state():
+    with database.read_connection() as conn:
+        return dict(conn.execute('SELECT id, is_done FROM tasks'))
+
+def set_interval(interval):
+    toggle_buffer.TOGGLE_WRITE_BEHIND_INTERVAL = interval
+    async_database.TOGGLE_WRITE_BEHIND_INTERVAL = interval
+
+async def run(name, interval, task_ids, toggles, clients):
+    set_interval(interval)
+    await async_database.start_write_behind()
+    before = done_state()
+    taps = [random.choice(task_ids) for _ in range(toggles)]
+    work = iter(taps)
+
+    async def client():
+        for task_id in work:
+            await async_database.toggle_task_status(task_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    await async_database.flush_toggles()
+    if async_database._flusher is not None:
+        async_database._flusher.cancel()
+        async_database._flusher = None
+
+    expected = dict(before)
+    for task_id in taps:
+        expected[task_id] ^= 1
+    ok = done_state() == expected and not database.check_daily_counters()
+    print(f"{name:>13}: {toggles / elapsed:9.0f} toggles/s ({elapsed:.2f}s), state {'ok' if ok else 'MISMATCH'}")
+
+async def main_async(args, task_ids):
+    await run("write-through", 0, task_ids, args.toggles, args.clients)
+    await run("write-behind", args.interval, task_ids, args.toggles, args.clients)
+    print(f"buffer: {toggle_buffer.stats()}")
+    await async_database.shutdown_database()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tasks", type=int, default=8)
+    parser.add_argument("--toggles", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.05, help="write-behind flush interval (s)")
+    args = parser.parse_args()
+
+    task_ids = seed(args.users, args.tasks)
+    asyncio.run(main_async(args, task_ids))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# Posts synthetic updates to a bot in webhook mode and reports how fast the webhook
+# accepts them. With --spawn it starts the bot itself (`python -m src.main` with
+# WEBHOOK_URL on a local port) against the fake Bot API (benchmarks/fake_bot_api.py)
+# and also waits for the bot to answer every update. Otherwise, start the bot with
+# WEBHOOK_URL and WEBHOOK_SECRET set (and, to avoid hitting real Telegram for the
+# replies, a stand-in Bot API), then:
+#
+#   python -m benchmarks.webhook_load --url http://127.0.0.1:8000/telegram \
+#       --users 1,2,3 --updates 5000 --concurrency 100 --secret ...
+#   python -m benchmarks.webhook_load --spawn [--users 50] [--workers 1] ...
+import argparse
+import asyncio
+import itertools
+import os
+import signal
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.load_test import seed_database, bot_env
+
+COMMANDS = ["/today", "/last5", "/history 7", "/date 1404-07-01"]
+
+def message_update(update_id, user_id, text):
+    command = text.split()[0]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+async def run(url, user_ids, updates, concurrency, secret):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    latencies = []
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    users = itertools.cycle(user_ids)
+    commands = itertools.cycle(COMMANDS)
+
+    async with httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def post(update_id, payload):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, json=payload, headers=headers)
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            post(update_id, message_update(update_id, next(users), next(commands)))
+            for update_id in range(1, updates + 1)
+        ))
+        elapsed = time.perf_counter() - start
+
+    q = statistics.quantiles(sorted(latencies), n=100)
+    print(f"{updates} updates in {elapsed:.2f}s = {updates / elapsed:.0f} updates/s")
+    print(f"POST latency p50={q[49] * 1000:.1f}ms p99={q[98] * 1000:.1f}ms")
+    print(f"responses: {dict(statuses)}")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def spawned(users, updates, concurrency, workers):
+    api = FakeBotApi()
+    server = api.app().listen(0, "127.0.0.1")
+    api_port = next(iter(server._sockets.values())).getsockname()[1]
+    db_file = os.path.join(tempfile.mkdtemp(), "webhook.db")
+    seed_database(db_file, users, team_size=1)
+    port, secret = free_port(), "bench-secret"
+    env = dict(
+        bot_env(api_port, db_file, workers), WEBHOOK_URL=f"http://127.0.0.1:{port}",
+        WEBHOOK_LISTEN="127.0.0.1", WEBHOOK_PORT=str(port), WEBHOOK_SECRET=secret,
+    )
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "src.main", env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while api.calls["setWebhook"] < 1 or api.calls["setMyCommands"] < 1:
+            if bot.returncode is not None or time.monotonic() > deadline:
+                raise RuntimeError("The bot did not start; run `python -m src.main` with the same env to see why")
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(1)
+
+        start = time.perf_counter()
+        await run(f"http://127.0.0.1:{port}/telegram", list(range(1, users + 1)), updates, concurrency, secret)
+        # Every command answers with one message
+        while sum(api.sent.values()) < updates and time.perf_counter() - start < 120:
+            await asyncio.sleep(0.05)
+        answered = sum(api.sent.values())
+        elapsed = time.perf_counter() - start
+        print(f"{answered}/{updates} answered in {elapsed:.2f}s = {answered / elapsed:.0f} updates/s end to end")
+    finally:
+        if bot.returncode is None:
+            bot.send_signal(signal.SIGTERM)
+        await bot.wait()
+        api.close()
+        await asyncio.sleep(0.1)
+        server.stop()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000/telegram")
+    parser.add_argument("--users", default="1",
+                        help="comma separated chat ids the bot knows; with --spawn, how many users to create")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--secret")
+    parser.add_argument("--spawn", action="store_true", help="start the bot against the fake Bot API")
+    parser.add_argument("--workers", type=int, default=1, help="SHARD_COUNT for a spawned bot")
+    args = parser.parse_args()
+
+    if args.spawn:
+        asyncio.run(spawned(int(args.users), args.updates, args.concurrency, args.workers))
+        return
+    user_ids = [int(uid) for uid in args.users.split(",")]
+    asyncio.run(run(args.url, user_ids, args.updates, args.concurrency, args.secret))
+
+if __name__ == "__main__":
+    main()
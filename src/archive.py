@@ -0,0 +1,49 @@
+import logging
+from datetime import datetime
+from pytz import timezone
+from .config import ARCHIVE_AFTER_DAYS, ARCHIVE_TIME, ARCHIVE_BATCH_DAYS, ARCHIVE_VACUUM_PAGES, DEFAULT_TIMEZONE
+from .async_database import archive_days, merge_search_index, enable_incremental_vacuum, incremental_vacuum
+from .dates import today_day
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Nightly tiering of old history. Completed days older than ARCHIVE_AFTER_DAYS
+# leave the tasks table for one tasks_archive row each (see database.archive_days),
+# which keeps tasks and its indexes sized by recent activity. The search index is
+# then merged and the freed pages go back to the filesystem, both in small steps
+# that are each their own write, so updates keep flowing between them. Opening an archived day for editing
+# restores it (database.restore_archived_day).
+#
+# With SHARD_COUNT > 1 only shard 0 runs the job; a toggle another shard still
+# buffers for an archived day finds no task on flush and is dropped, which needs a
+# tap on a days-old message in the same second as the job.
+
+@metrics.timed_job("archive")
+async def run_archive(context):
+    before_day = today_day() - ARCHIVE_AFTER_DAYS
+    archived = 0
+    while True:
+        count = await archive_days(before_day, ARCHIVE_BATCH_DAYS)
+        archived += count
+        if count < ARCHIVE_BATCH_DAYS:
+            break
+
+    if archived:
+        while await merge_search_index(ARCHIVE_VACUUM_PAGES):
+            pass
+
+    if await enable_incremental_vacuum():
+        logger.info("Database converted to incremental auto-vacuum")
+    steps = 0
+    while True:
+        steps += 1
+        if await incremental_vacuum(ARCHIVE_VACUUM_PAGES) == 0:
+            break
+    logger.info("Archived %s day(s) before day %s; %s vacuum step(s)", archived, before_day, steps)
+
+def setup_archive(app):
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return
+    at = datetime.strptime(ARCHIVE_TIME, "%H:%M").time().replace(tzinfo=timezone(DEFAULT_TIMEZONE))
+    app.job_queue.run_daily(run_archive, at, name="archive")
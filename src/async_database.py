@@ -0,0 +1,214 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from .config import (DB_READ_WORKERS, TOGGLE_WRITE_BEHIND_INTERVAL,
+                     TOGGLE_WRITE_BEHIND_MAX_PENDING)
+from . import database, toggle_buffer, view_cache, metrics, transfer
+
+logger = logging.getLogger(__name__)
+
+# All writes are serialized on one thread so SQLite never sees competing writers;
+# reads run on a small bounded pool. The event loop only ever awaits futures.
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_read_executor = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="db-reader")
+
+async def run_write(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _write_executor, functools.partial(metrics.timed_call(func, "write"), *args, **kwargs)
+    )
+
+async def run_read(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _read_executor, functools.partial(metrics.timed_call(func, "read"), *args, **kwargs)
+    )
+
+def queue_depths():
+    # Calls waiting for a database thread
+    return {"db_write": _write_executor._work_queue.qsize(), "db_read": _read_executor._work_queue.qsize()}
+
+_flush_lock = asyncio.Lock()
+_flusher = None
+
+@metrics.timed_job("toggle_flush")
+async def flush_toggles():
+    # Writes buffered toggles in one transaction. Writes that touch is_done (or read
+    # whole-history counters) call this first so they never race a buffered toggle.
+    async with _flush_lock:
+        changes = toggle_buffer.changes()
+        if changes:
+            await run_write(database.apply_toggles, changes)
+            toggle_buffer.committed(changes)
+        return len(changes)
+
+async def _flush_periodically():
+    while True:
+        await asyncio.sleep(TOGGLE_WRITE_BEHIND_INTERVAL)
+        try:
+            await flush_toggles()
+        except Exception as e:
+            logger.error("Error flushing buffered toggles: %s", e)
+
+async def start_write_behind(application=None):
+    global _flusher
+    if toggle_buffer.enabled() and _flusher is None:
+        _flusher = asyncio.create_task(_flush_periodically())
+        logger.info(
+            "Toggle write-behind every %ss, at most %s pending",
+            TOGGLE_WRITE_BEHIND_INTERVAL, TOGGLE_WRITE_BEHIND_MAX_PENDING
+        )
+
+async def save_daily_tasks(user_id, date, tasks, mode=database.SAVE_DIFF):
+    await flush_toggles()
+    return await run_write(database.save_daily_tasks, user_id, date, tasks, mode)
+
+async def get_tasks_by_date(user_id, date):
+    return toggle_buffer.overlay_tasks(await run_read(database.get_tasks_by_date, user_id, date))
+
+async def toggle_task_status(task_id):
+    # False when the task is not in the tasks table (deleted, or its day is archived)
+    if not toggle_buffer.enabled():
+        return await run_write(database.toggle_task_status, task_id)
+
+    if not toggle_buffer.tracks(task_id):
+        state = await run_read(database.get_task_state, task_id)
+        if state is None:
+            return False
+        toggle_buffer.track(task_id, *state)
+    view_cache.invalidate(*toggle_buffer.toggle(task_id))
+    if toggle_buffer.pending_count() >= TOGGLE_WRITE_BEHIND_MAX_PENDING:
+        await flush_toggles()
+    return True
+
+async def restore_archived_day(user_id, date):
+    return await run_write(database.restore_archived_day, user_id, date)
+
+async def mark_all_tasks_done(user_id, date):
+    await flush_toggles()
+    return await run_write(database.mark_all_tasks_done, user_id, date)
+
+async def get_task_summary(user_id, date):
+    total, done, _ = await get_all_task_status(user_id, date)
+    return total, done
+
+async def get_last_n_days(user_id, n=5):
+    await flush_toggles()
+    return await run_read(database.get_last_n_days, user_id, n)
+
+async def get_history(user_id, limit, before=None, after=None):
+    await flush_toggles()
+    return await run_read(database.get_history, user_id, limit, before, after)
+
+async def get_day_range(user_id, first_day, last_day):
+    await flush_toggles()
+    return await run_read(database.get_day_range, user_id, first_day, last_day)
+
+async def has_tasks_for_date(user_id, date):
+    return await run_read(database.has_tasks_for_date, user_id, date)
+
+async def iter_users_without_tasks(user_ids, date, chunk_size=500):
+    rows = database.iter_users_without_tasks(user_ids, date, chunk_size)
+
+    # Runs each step on a reader thread; named so bot_db_seconds and bot_db_rows_total
+    # label it with this function rather than "next"
+    def iter_users_without_tasks(close=False):
+        if close:
+            return rows.close()
+        return next(rows, None)
+
+    try:
+        while True:
+            chunk = await run_read(iter_users_without_tasks)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        await run_read(iter_users_without_tasks, close=True)
+
+async def get_active_users():
+    return await run_read(database.get_active_users)
+
+async def upsert_user(user_id, name, team, is_admin=False):
+    return await run_write(database.upsert_user, user_id, name, team, is_admin)
+
+async def deactivate_user(user_id):
+    return await run_write(database.deactivate_user, user_id)
+
+async def get_reminder_settings(user_ids):
+    return await run_read(database.get_reminder_settings, user_ids)
+
+async def save_reminder_setting(user_id, column, value):
+    return await run_write(database.save_reminder_setting, user_id, column, value)
+
+async def is_daily_completed(user_id, date):
+    return await run_read(database.is_daily_completed, user_id, date)
+
+async def mark_daily_completed(user_id, date):
+    return await run_write(database.mark_daily_completed, user_id, date)
+
+async def get_all_task_status(user_id, date):
+    pending = toggle_buffer.pending_for_day(user_id, date)
+    if pending:
+        return await run_read(database.get_task_status_with_pending, user_id, date, pending)
+    return await run_read(database.get_all_task_status, user_id, date)
+
+async def get_user_stats(user_id, today):
+    await flush_toggles()
+    return await run_read(database.get_user_stats, user_id, today)
+
+async def get_leaderboard(user_ids, period, today):
+    await flush_toggles()
+    return await run_read(database.get_leaderboard, user_ids, period, today)
+
+async def search_tasks(user_id, words, limit, offset=0):
+    await flush_toggles()
+    return await run_read(database.search_tasks, user_id, words, limit, offset)
+
+async def export_history(fileobj, fmt, user_id):
+    await flush_toggles()
+    return await run_read(transfer.export_history, fileobj, fmt, user_id)
+
+async def import_history(fileobj, user_id):
+    await flush_toggles()
+    return await run_write(transfer.import_history, fileobj, user_id)
+
+async def archive_days(before_day, limit):
+    # Buffered toggles of the days being archived must reach the tasks table first
+    await flush_toggles()
+    return await run_write(database.archive_days, before_day, limit)
+
+async def merge_search_index(pages):
+    return await run_write(database.merge_search_index, pages)
+
+async def enable_incremental_vacuum():
+    return await run_write(database.enable_incremental_vacuum)
+
+async def incremental_vacuum(pages):
+    return await run_write(database.incremental_vacuum, pages)
+
+async def check_daily_counters():
+    await flush_toggles()
+    return await run_read(database.check_daily_counters)
+
+async def repair_daily_counters():
+    await flush_toggles()
+    return await run_write(database.repair_daily_counters)
+
+async def get_debug_info(user_id, date):
+    return await run_read(database.get_debug_info, user_id, date)
+
+async def shutdown_database(application=None):
+    if _flusher is not None:
+        _flusher.cancel()
+    try:
+        flushed = await flush_toggles()
+        if flushed:
+            logger.info("Flushed %s buffered toggle(s) on shutdown", flushed)
+    except Exception as e:
+        logger.error("Could not flush %s buffered toggle(s) on shutdown: %s", toggle_buffer.pending_count(), e)
+    logger.info("Shutting down database executors")
+    _write_executor.shutdown(wait=True)
+    _read_executor.shutdown(wait=True)
+    database.close_database()
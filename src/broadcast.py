@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from telegram.error import RetryAfter, NetworkError, TimedOut, BadRequest
+from .config import (BROADCAST_WORKERS, BROADCAST_GLOBAL_RATE, BROADCAST_CHAT_RATE,
+                     BROADCAST_MAX_RETRIES, BROADCAST_MAX_PENDING)
+from . import shards
+
+logger = logging.getLogger(__name__)
+
+# Fire-and-forget outgoing messages. Each chat has its own FIFO; a chat id sits in
+# the ready queue at most once, so one worker at a time sends to a given chat and
+# per-chat order is preserved. Token buckets keep us under Telegram's global and
+# per-chat limits; RetryAfter pauses every worker for the time Telegram asks.
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self):
+        # Takes a token and returns 0, or returns the seconds until one is available
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+MAX_CHAT_BUCKETS = 10000
+
+_bot = None
+_ready = None
+_workers = []
+_chats = {}
+_chat_buckets = {}
+_global_bucket = TokenBucket(BROADCAST_GLOBAL_RATE)
+_paused_until = 0.0
+_pending = 0
+_sent_times = deque()
+_stats = {"enqueued": 0, "sent": 0, "failed": 0, "retried": 0, "dropped": 0, "rate_limited": 0,
+          "forwarded": 0}
+
+def enqueue(chat_id, text, **kwargs):
+    global _pending
+    if not shards.owns_user(chat_id):
+        # Another worker owns this chat and its rate limits; hand the message over
+        forwarded = shards.forward_message(chat_id, text, kwargs)
+        _stats["forwarded" if forwarded else "dropped"] += 1
+        return forwarded
+    if _ready is None:
+        logger.error("Broadcast queue not started, dropping message to %s", chat_id)
+        _stats["dropped"] += 1
+        return False
+    if _pending >= BROADCAST_MAX_PENDING:
+        logger.error("Broadcast queue full (%s), dropping message to %s", _pending, chat_id)
+        _stats["dropped"] += 1
+        return False
+
+    messages = _chats.get(chat_id)
+    if messages is None:
+        messages = _chats[chat_id] = deque()
+        _ready.put_nowait(chat_id)
+    messages.append([text, kwargs, 0])
+    _pending += 1
+    _stats["enqueued"] += 1
+    return True
+
+def _reschedule(chat_id, delay):
+    if delay > 0:
+        asyncio.get_running_loop().call_later(delay, _ready.put_nowait, chat_id)
+    else:
+        _ready.put_nowait(chat_id)
+
+def _finish(chat_id):
+    global _pending
+    messages = _chats[chat_id]
+    messages.popleft()
+    _pending -= 1
+    if messages:
+        _ready.put_nowait(chat_id)
+    else:
+        del _chats[chat_id]
+
+async def _worker():
+    global _paused_until
+    while True:
+        chat_id = await _ready.get()
+        messages = _chats[chat_id]
+
+        bucket = _chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = _chat_buckets[chat_id] = TokenBucket(BROADCAST_CHAT_RATE, 1)
+        delay = bucket.try_acquire()
+        if delay:
+            _reschedule(chat_id, delay)
+            continue
+
+        while True:
+            pause = _paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            wait = _global_bucket.try_acquire()
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+
+        entry = messages[0]
+        text, kwargs, attempts = entry
+        try:
+            await _bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            _stats["sent"] += 1
+            _sent_times.append(time.monotonic())
+            _finish(chat_id)
+        except RetryAfter as e:
+            _stats["rate_limited"] += 1
+            _paused_until = max(_paused_until, time.monotonic() + e.retry_after)
+            logger.warning("Rate limited sending to %s, pausing %ss", chat_id, e.retry_after)
+            _reschedule(chat_id, e.retry_after)
+        except (TimedOut, NetworkError) as e:
+            if isinstance(e, BadRequest) or attempts >= BROADCAST_MAX_RETRIES:
+                _stats["failed"] += 1
+                logger.error("Giving up on message to %s after %s attempt(s): %s", chat_id, attempts + 1, e)
+                _finish(chat_id)
+            else:
+                _stats["retried"] += 1
+                entry[2] = attempts + 1
+                _reschedule(chat_id, min(60, 2 ** attempts))
+        except Exception as e:
+            _stats["failed"] += 1
+            logger.error("Error sending message to %s: %s", chat_id, e)
+            _finish(chat_id)
+
+        if len(_chat_buckets) > MAX_CHAT_BUCKETS:
+            cutoff = time.monotonic() - 60
+            for idle in [cid for cid, b in _chat_buckets.items() if b.updated < cutoff and cid not in _chats]:
+                del _chat_buckets[idle]
+
+def stats():
+    now = time.monotonic()
+    while _sent_times and _sent_times[0] < now - 60:
+        _sent_times.popleft()
+    return dict(_stats, pending=_pending, chats_waiting=len(_chats), sent_per_sec_1m=len(_sent_times) / 60)
+
+async def start(application):
+    global _bot, _ready, _global_bucket
+    _bot = application.bot
+    # The global limit is per bot; sharded workers each send for their own users
+    _global_bucket = TokenBucket(BROADCAST_GLOBAL_RATE / shards.shard_count())
+    _ready = asyncio.Queue()
+    for _ in range(BROADCAST_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+    logger.info("Broadcast queue started with %s workers", BROADCAST_WORKERS)
+
+async def stop(application=None, timeout=10):
+    deadline = time.monotonic() + timeout
+    while _pending and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    if _pending:
+        logger.warning("Broadcast queue stopped with %s undelivered message(s)", _pending)
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    logger.info("Broadcast queue stopped: %s", stats())
@@ -0,0 +1,77 @@
+import base64
+from .dates import date_to_day
+
+# Compact callback_data codec. Telegram allows 64 bytes per button; the old
+# "toggle:{task_id}:{date}" strings spent most of that on the date. A payload is
+#
+#   version byte | action byte | unsigned LEB128 varints ...
+#
+# encoded as unpadded base64url, e.g. a toggle of task 123456 on some day and page
+# 2 is 11 characters. Dates travel as day numbers (see dates.py). Strings with a
+# ':' are buttons rendered before this codec existed and are still understood.
+
+VERSION = 1
+
+ACTIONS = (
+    "toggle",                # task_id, day, page
+    "page",                  # day, page
+    "complete_day_confirm",  # day, page
+    "cancel_complete",       # day, page
+    "complete_with_all",     # day, page
+    "complete_day_only",     # day, page
+    "completed",             # day, page
+    "history_older",         # limit, day
+    "history_newer",         # limit, day
+    "noop",                  #
+    "search_page",           # search id, page
+)
+_codes = {name: code for code, name in enumerate(ACTIONS)}
+
+def _write_varint(out, value):
+    if value < 0:
+        raise ValueError(f"Callback values must be non-negative, got {value}")
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def encode(action, *values):
+    out = bytearray((VERSION, _codes[action]))
+    for value in values:
+        _write_varint(out, value)
+    return base64.urlsafe_b64encode(bytes(out)).rstrip(b"=").decode("ascii")
+
+def decode(data):
+    # Returns (action, values); raises ValueError for anything malformed
+    if ":" in data:
+        return _decode_legacy(data)
+
+    try:
+        raw = base64.b64decode(data + "=" * (-len(data) % 4), altchars=b"-_", validate=True)
+    except Exception:
+        raise ValueError(f"Malformed callback data: {data!r}")
+    if len(raw) < 2 or raw[0] != VERSION or raw[1] >= len(ACTIONS):
+        raise ValueError(f"Unsupported callback data: {data!r}")
+
+    values = []
+    value = shift = 0
+    for byte in raw[2:]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    if shift:
+        raise ValueError(f"Truncated callback data: {data!r}")
+    return ACTIONS[raw[1]], tuple(values)
+
+def _decode_legacy(data):
+    action, *params = data.split(":")
+    if action == "toggle":
+        return action, (int(params[0]), date_to_day(params[1]), 0)
+    if action in ("history_older", "history_newer"):
+        return action, (int(params[0]), date_to_day(params[1]))
+    if action in _codes:
+        return action, (date_to_day(params[0]), 0)
+    raise ValueError(f"Unknown callback action: {action}")
@@ -2,23 +2,129 @@ import os
 import logging
 import jdatetime
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler('/app/logs/bot.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# Logging (see logs.py). LOG_LEVELS overrides the level of single loggers, e.g.
+# "src.database=DEBUG,httpx=WARNING" (httpx logs every Bot API request at INFO).
+# An empty LOG_FILE logs to the console only.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "httpx=WARNING")
+LOG_FILE = os.getenv("LOG_FILE", "/app/logs/bot.log")
+# One JSON object per line instead of plain text
+LOG_JSON = os.getenv("LOG_JSON", "").lower() in ("1", "true", "yes")
+# The log file rotates at LOG_MAX_BYTES, or on a schedule when LOG_ROTATE_WHEN is set
+# (a TimedRotatingFileHandler interval such as "midnight"); LOG_BACKUP_COUNT old
+# files are kept
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN")
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+
 # Bot token from environment variable
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
+# Webhook mode is used when WEBHOOK_URL (the public https base URL) is set;
+# otherwise the bot falls back to long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8000"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+# Required in webhook mode: Telegram sends it with every update and PTB rejects
+# requests without it. Empty (as docker-compose passes an unset one) means unset.
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+
+# Updates processed at the same time (updates from one chat always run in order)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))
+
+# Number of worker processes; above 1 the bot runs sharded by user id (see shard_runner.py)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+
+# Bot API server; only changed to point the bot at a local stand-in for load tests
+BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
+
+# Prometheus metrics at http://METRICS_LISTEN:METRICS_PORT/metrics (0 disables;
+# sharded workers use METRICS_PORT + their index)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+
+# Sampling profiler for the admin /profile command: off unless enabled, samples
+# every PROFILER_INTERVAL seconds for at most PROFILER_MAX_SECONDS per run
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "60"))
+
 # Sleep reminder URL
 SLEEP_REMINDER_URL = "https://shealth.samsung.com/deepLink?sc_id=tracker.medication&action=view&destination=home.sleep"
 
+# Admins may manage users with /adduser, /removeuser and /reloadusers.
+# Defaults to the first user configured in the environment.
+ADMIN_IDS = {int(uid) for uid in os.getenv("ADMIN_IDS", "").replace(",", " ").split() if uid.isdigit()}
+
+# Team assigned to users that are added without one (including all env users)
+DEFAULT_TEAM = os.getenv("DEFAULT_TEAM", "default")
+
+# Reminder defaults for users who have not set their own with /remind
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Asia/Tehran")
+DEFAULT_TASK_REMINDER_TIME = os.getenv("DEFAULT_TASK_REMINDER_TIME", "09:00")
+DEFAULT_SLEEP_REMINDER_TIME = os.getenv("DEFAULT_SLEEP_REMINDER_TIME", "10:00")
+
+# Jalali years covered by the date conversion table in dates.py (others fall back
+# to jdatetime), as "FIRST-LAST"
+DATE_TABLE_YEARS = tuple(int(year) for year in os.getenv("DATE_TABLE_YEARS", "1300-1500").split("-", 1))
+
+# /history page size
+HISTORY_DEFAULT_DAYS = 7
+HISTORY_MAX_DAYS = 60
+
+# Task buttons shown per page of a day's task list
+TASKS_PER_PAGE = int(os.getenv("TASKS_PER_PAGE", "8"))
+
+# /search results per page
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+
+# Number of rendered task views kept in memory
+VIEW_CACHE_SIZE = int(os.getenv("VIEW_CACHE_SIZE", "1024"))
+
+# Checkbox taps on one message within this many seconds are merged into one edit
+TOGGLE_EDIT_DELAY = float(os.getenv("TOGGLE_EDIT_DELAY", "0.8"))
+
+# Write-behind for checkbox toggles: when the interval (seconds) is above 0, toggles
+# are kept in memory and written in one transaction per interval. At most
+# TOGGLE_WRITE_BEHIND_MAX_PENDING changed tasks are held; reaching it forces a flush,
+# so that is also the most a crash can lose.
+TOGGLE_WRITE_BEHIND_INTERVAL = float(os.getenv("TOGGLE_WRITE_BEHIND_INTERVAL", "0"))
+TOGGLE_WRITE_BEHIND_MAX_PENDING = int(os.getenv("TOGGLE_WRITE_BEHIND_MAX_PENDING", "200"))
+
+# Outgoing notification queue (Telegram allows ~30 messages/s per bot, ~1/s per chat)
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", "25"))
+BROADCAST_CHAT_RATE = float(os.getenv("BROADCAST_CHAT_RATE", "1"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "5"))
+BROADCAST_MAX_PENDING = int(os.getenv("BROADCAST_MAX_PENDING", "100000"))
+
+# Reminder recipients are fetched and queued in chunks of this size
+REMINDER_CHUNK_SIZE = int(os.getenv("REMINDER_CHUNK_SIZE", "500"))
+
+# Number of threads serving database reads (writes always go through a single thread)
+DB_READ_WORKERS = int(os.getenv("DB_READ_WORKERS", "4"))
+
+# Completed days older than this many days move from tasks to tasks_archive every
+# night at ARCHIVE_TIME (in DEFAULT_TIMEZONE); 0 disables archiving
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_TIME = os.getenv("ARCHIVE_TIME", "03:30")
+# Days archived per write transaction, and pages per search index merge and
+# incremental VACUUM step
+ARCHIVE_BATCH_DAYS = int(os.getenv("ARCHIVE_BATCH_DAYS", "500"))
+ARCHIVE_VACUUM_PAGES = int(os.getenv("ARCHIVE_VACUUM_PAGES", "2000"))
+
+# Rows per fetch and per executemany when exporting and importing task history
+TRANSFER_BATCH_ROWS = int(os.getenv("TRANSFER_BATCH_ROWS", "1000"))
+
+# SQLite connection tuning
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "128"))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+
 # Configure users from environment variables
 def load_users_from_env():
     users = {}
@@ -35,11 +141,13 @@ def load_users_from_env():
                 users[int(user_id)] = user_name
                 i += 1
             except ValueError:
-                logger.error(f"Invalid user ID format for {user_id_key}: {user_id}")
+                logger.error("Invalid user ID format for %s: %s", user_id_key, user_id)
                 break
         else:
             break
     
     return users
 
+# Seeded from the environment; replaced in place by the users table once the
+# database is open (see users.py)
 USERS = load_users_from_env()
\ No newline at end of file
@@ -1,182 +1,714 @@
 import os
+import json
+import queue
 import sqlite3
 import logging
-from .config import logger
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from .config import (DB_READ_WORKERS, DB_CACHE_SIZE_KB, DB_MMAP_SIZE,
+                     DB_STATEMENT_CACHE, DB_BUSY_TIMEOUT, TRANSFER_BATCH_ROWS)
+from .migrations import migrate, REBUILD_DAILY_COUNTERS
+from .dates import date_to_day, day_to_date
+from .search import match_expression
+from . import view_cache, search
 
-DB_FILE = "/app/data/tasks.db"
+logger = logging.getLogger(__name__)
+
+DB_FILE = os.getenv("DB_FILE", "/app/data/tasks.db")
+
+class ConnectionPool:
+    def __init__(self, path, readers=DB_READ_WORKERS):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        # Only takes effect on a new database (existing ones are converted once by
+        # enable_incremental_vacuum); must come before WAL writes the header
+        self._writer.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self._writer.execute('PRAGMA journal_mode=WAL')
+        self._readers = queue.Queue()
+        self._all = [self._writer]
+        for _ in range(max(1, readers)):
+            conn = self._connect()
+            self._readers.put(conn)
+            self._all.append(conn)
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE,
+        )
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        search.register(conn)
+        return conn
+
+    @contextmanager
+    def write(self):
+        with self._write_lock:
+            with self._writer:
+                yield self._writer
+
+    @contextmanager
+    def read(self):
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def close(self):
+        with self._write_lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_FILE)
+    return _pool
+
+def write_connection():
+    return get_pool().write()
+
+def read_connection():
+    return get_pool().read()
+
+def close_database():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
 
 def init_database():
     os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
-    
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            date TEXT,
-            task_text TEXT,
-            is_done INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS daily_entries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            date TEXT,
-            total_tasks INTEGER,
-            is_completed INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(user_id, date)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
 
-def save_daily_tasks(user_id, date, tasks):
+    with write_connection() as conn:
+        version = migrate(conn)
+
+    logger.info("Database ready at schema version %s", version)
+
+SAVE_REPLACE = "replace"
+SAVE_DIFF = "diff"
+SAVE_APPEND = "append"
+
+def _diff_tasks(existing, tasks):
+    # existing: [(id, task_text, position)] in display order. Unchanged lines keep their
+    # row (and therefore id and done state); duplicates are matched in order.
+    unused = {}
+    for task_id, text, position in existing:
+        unused.setdefault(text, []).append((task_id, position))
+
+    inserts, moves = [], []
+    for position, text in enumerate(tasks):
+        if unused.get(text):
+            task_id, old_position = unused[text].pop(0)
+            if old_position != position:
+                moves.append((position, task_id))
+        else:
+            inserts.append((position, text))
+
+    deletes = [(task_id,) for rows in unused.values() for task_id, _ in rows]
+    return inserts, deletes, moves
+
+def save_daily_tasks(user_id, date, tasks, mode=SAVE_DIFF):
+    # Returns (added, removed, kept) task counts
+    tasks = [task.strip() for task in tasks if task.strip()]
+    day = date_to_day(date)
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        logger.info(f"Saving {len(tasks)} tasks for user {user_id} on {date}")
-        
-        cursor.execute('DELETE FROM tasks WHERE user_id = ? AND date = ?', (user_id, date))
-        deleted_count = cursor.rowcount
-        logger.info(f"Deleted {deleted_count} existing tasks")
-        
-        for i, task in enumerate(tasks):
-            if task.strip():
-                cursor.execute(
-                    'INSERT INTO tasks (user_id, date, task_text, is_done) VALUES (?, ?, ?, 0)',
-                    (user_id, date, task.strip())
+        with write_connection() as conn:
+            _restore_day(conn, user_id, day)
+            if mode == SAVE_REPLACE:
+                removed = conn.execute('DELETE FROM tasks WHERE user_id = ? AND day = ?', (user_id, day)).rowcount
+                inserts, deletes, moves = list(enumerate(tasks)), [], []
+            else:
+                existing = conn.execute(
+                    'SELECT id, task_text, position FROM tasks WHERE user_id = ? AND day = ? ORDER BY position, id',
+                    (user_id, day)
+                ).fetchall()
+                if mode == SAVE_APPEND:
+                    start = max((row[2] for row in existing), default=-1) + 1
+                    inserts, deletes, moves = list(enumerate(tasks, start)), [], []
+                else:
+                    inserts, deletes, moves = _diff_tasks(existing, tasks)
+                removed = len(deletes)
+
+            conn.executemany('DELETE FROM tasks WHERE id = ?', deletes)
+            conn.executemany('UPDATE tasks SET position = ? WHERE id = ?', moves)
+            conn.executemany(
+                'INSERT INTO tasks (user_id, date, day, task_text, is_done, position) VALUES (?, ?, ?, ?, 0, ?)',
+                [(user_id, date, day, text, position) for position, text in inserts]
+            )
+
+            # total_tasks/done_tasks are maintained by the tasks triggers; a day with new
+            # tasks is no longer complete
+            if inserts:
+                conn.execute(
+                    'UPDATE daily_entries SET is_completed = 0 WHERE user_id = ? AND day = ?',
+                    (user_id, day)
                 )
-                logger.info(f"Inserted task {i+1}: {task.strip()[:50]}...")
-        
-        cursor.execute(
-            'INSERT OR REPLACE INTO daily_entries (user_id, date, total_tasks, is_completed) VALUES (?, ?, ?, 0)',
-            (user_id, date, len([t for t in tasks if t.strip()]))
+
+        view_cache.invalidate(user_id, date)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for position, text in inserts:
+                logger.debug("Inserted task %s: %s", position + 1, text[:50])
+        kept = len(tasks) - len(inserts)
+        logger.info(
+            "Saved tasks for user %s on %s (%s): %s added, %s removed, %s moved",
+            user_id, date, mode, len(inserts), removed, len(moves)
         )
-        
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"Successfully saved {len(tasks)} tasks for user {user_id} on {date}")
-        
+        return len(inserts), removed, kept
+
     except Exception as e:
-        logger.error(f"Error saving daily tasks: {e}")
+        logger.error("Error saving daily tasks: %s", e)
         raise
 
 def get_tasks_by_date(user_id, date):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT id, task_text, is_done FROM tasks WHERE user_id = ? AND date = ? ORDER BY id',
-            (user_id, date)
-        )
-        
-        tasks = cursor.fetchall()
-        conn.close()
-        
-        logger.info(f"Found {len(tasks)} tasks for user {user_id} on {date}")
+        with read_connection() as conn:
+            day = date_to_day(date)
+            tasks = conn.execute(
+                'SELECT id, task_text, is_done FROM tasks WHERE user_id = ? AND day = ? ORDER BY position, id',
+                (user_id, day)
+            ).fetchall()
+            if not tasks:
+                tasks = _archived_tasks(conn, user_id, day)
+
+        logger.debug("Found %s tasks for user %s on %s", len(tasks), user_id, date)
         return tasks
-        
+
     except Exception as e:
-        logger.error(f"Error getting tasks by date: {e}")
+        logger.error("Error getting tasks by date: %s", e)
         return []
 
 def toggle_task_status(task_id):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('UPDATE tasks SET is_done = NOT is_done WHERE id = ?', (task_id,))
-    conn.commit()
-    conn.close()
+    with write_connection() as conn:
+        row = conn.execute(
+            'UPDATE tasks SET is_done = NOT is_done WHERE id = ? RETURNING user_id, date', (task_id,)
+        ).fetchone()
+
+    if row is not None:
+        view_cache.invalidate(*row)
+    return row is not None
+
+def get_task_state(task_id):
+    with read_connection() as conn:
+        return conn.execute('SELECT user_id, date, is_done FROM tasks WHERE id = ?', (task_id,)).fetchone()
+
+def apply_toggles(changes):
+    # changes: [(is_done, task_id)] from the write-behind buffer; deleted tasks are skipped
+    with write_connection() as conn:
+        conn.executemany('UPDATE tasks SET is_done = ? WHERE id = ?', changes)
 
 def mark_all_tasks_done(user_id, date):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('UPDATE tasks SET is_done = 1 WHERE user_id = ? AND date = ?', (user_id, date))
-    conn.commit()
-    conn.close()
+    day = date_to_day(date)
+    with write_connection() as conn:
+        _restore_day(conn, user_id, day)
+        conn.execute('UPDATE tasks SET is_done = 1 WHERE user_id = ? AND day = ?', (user_id, day))
+    view_cache.invalidate(user_id, date)
 
 def get_task_summary(user_id, date):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        'SELECT COUNT(*) as total, SUM(is_done) as done FROM tasks WHERE user_id = ? AND date = ?',
-        (user_id, date)
-    )
-    
-    result = cursor.fetchone()
-    conn.close()
-    return result[0], result[1] or 0
+    total, done, _ = get_all_task_status(user_id, date)
+    return total, done
 
 def get_last_n_days(user_id, n=5):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT date, COUNT(*) as total, SUM(is_done) as done 
-        FROM tasks 
-        WHERE user_id = ? 
-        GROUP BY date 
-        ORDER BY date DESC 
-        LIMIT ?
-    ''', (user_id, n))
-    
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    with read_connection() as conn:
+        return conn.execute('''
+            SELECT date, total_tasks, done_tasks
+            FROM daily_entries
+            WHERE user_id = ? AND total_tasks > 0
+            ORDER BY day DESC
+            LIMIT ?
+        ''', (user_id, n)).fetchall()
+
+HISTORY_QUERY = '''
+    SELECT date, total_tasks, done_tasks, is_completed
+    FROM daily_entries
+    WHERE user_id = ? AND total_tasks > 0 {condition}
+    ORDER BY day {order}
+    LIMIT ?
+'''
+
+def get_history(user_id, limit, before=None, after=None):
+    # Keyset pagination: `before` pages towards older days, `after` towards newer ones.
+    # Rows are (date, total, done, is_completed), newest first; has_more tells whether
+    # another page exists in the requested direction.
+    if after is not None:
+        sql = HISTORY_QUERY.format(condition='AND day > ?', order='ASC')
+        params = (user_id, date_to_day(after), limit + 1)
+    elif before is not None:
+        sql = HISTORY_QUERY.format(condition='AND day < ?', order='DESC')
+        params = (user_id, date_to_day(before), limit + 1)
+    else:
+        sql = HISTORY_QUERY.format(condition='', order='DESC')
+        params = (user_id, limit + 1)
+
+    with read_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+    return rows, has_more
+
+def get_day_range(user_id, first_day, last_day):
+    # Days with tasks in [first_day, last_day] (day numbers, see dates.py), oldest first:
+    # (date, total, done, is_completed)
+    with read_connection() as conn:
+        return conn.execute('''
+            SELECT date, total_tasks, done_tasks, is_completed
+            FROM daily_entries
+            WHERE user_id = ? AND day BETWEEN ? AND ? AND total_tasks > 0
+            ORDER BY day
+        ''', (user_id, first_day, last_day)).fetchall()
 
 def has_tasks_for_date(user_id, date):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*) FROM tasks WHERE user_id = ? AND date = ?', (user_id, date))
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count > 0
+    total, _, _ = get_all_task_status(user_id, date)
+    return total > 0
+
+def iter_users_without_tasks(user_ids, date, chunk_size=500):
+    # One query for the whole candidate set; each candidate is probed through the
+    # daily_entries (user_id, date) index. Yields lists of at most chunk_size ids.
+    with read_connection() as conn:
+        cursor = conn.execute('''
+            SELECT u.value
+            FROM json_each(?) AS u
+            WHERE NOT EXISTS (
+                SELECT 1 FROM daily_entries d
+                WHERE d.user_id = u.value AND d.day = ? AND d.total_tasks > 0
+            )
+        ''', (json.dumps(list(user_ids)), date_to_day(date)))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [row[0] for row in rows]
+
+def get_active_users():
+    with read_connection() as conn:
+        return conn.execute(
+            'SELECT user_id, name, team, is_admin FROM users WHERE active = 1'
+        ).fetchall()
+
+def upsert_user(user_id, name, team, is_admin=False):
+    with write_connection() as conn:
+        conn.execute('''
+            INSERT INTO users (user_id, name, team, is_admin, active) VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT(user_id) DO UPDATE SET
+                name = excluded.name,
+                team = excluded.team,
+                is_admin = MAX(users.is_admin, excluded.is_admin),
+                active = 1
+        ''', (user_id, name, team, int(is_admin)))
+
+def deactivate_user(user_id):
+    with write_connection() as conn:
+        return conn.execute('UPDATE users SET active = 0 WHERE user_id = ?', (user_id,)).rowcount > 0
+
+def seed_users(users, admin_ids, team):
+    # Env-configured users are (re)activated on every start; existing team and
+    # admin assignments made through the bot are kept.
+    with write_connection() as conn:
+        conn.executemany('''
+            INSERT INTO users (user_id, name, team, is_admin, active) VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT(user_id) DO UPDATE SET
+                name = excluded.name,
+                is_admin = MAX(users.is_admin, excluded.is_admin),
+                active = 1
+        ''', [(user_id, name, team, int(user_id in admin_ids)) for user_id, name in users.items()])
+
+REMINDER_SETTING_COLUMNS = ("task_time", "sleep_time", "timezone")
+
+def get_reminder_settings(user_ids):
+    # Returns {user_id: (task_time, sleep_time, timezone)} for users with a saved row
+    with read_connection() as conn:
+        rows = conn.execute('''
+            SELECT r.user_id, r.task_time, r.sleep_time, r.timezone
+            FROM json_each(?) AS u
+            JOIN reminder_settings r ON r.user_id = u.value
+        ''', (json.dumps(list(user_ids)),)).fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+def save_reminder_setting(user_id, column, value):
+    if column not in REMINDER_SETTING_COLUMNS:
+        raise ValueError(f"Unknown reminder setting: {column}")
+    with write_connection() as conn:
+        conn.execute(
+            f'INSERT INTO reminder_settings (user_id, {column}) VALUES (?, ?) '
+            f'ON CONFLICT(user_id) DO UPDATE SET {column} = excluded.{column}',
+            (user_id, value)
+        )
 
 def is_daily_completed(user_id, date):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT is_completed FROM daily_entries WHERE user_id = ? AND date = ?', (user_id, date))
-    result = cursor.fetchone()
-    conn.close()
+    with read_connection() as conn:
+        result = conn.execute(
+            'SELECT is_completed FROM daily_entries WHERE user_id = ? AND day = ?', (user_id, date_to_day(date))
+        ).fetchone()
     return result and result[0] == 1
 
 def mark_daily_completed(user_id, date):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('UPDATE daily_entries SET is_completed = 1 WHERE user_id = ? AND date = ?', (user_id, date))
-    conn.commit()
-    conn.close()
+    with write_connection() as conn:
+        conn.execute(
+            'UPDATE daily_entries SET is_completed = 1 WHERE user_id = ? AND day = ?', (user_id, date_to_day(date))
+        )
+    view_cache.invalidate(user_id, date)
 
 def get_all_task_status(user_id, date):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        'SELECT COUNT(*) as total, SUM(is_done) as done FROM tasks WHERE user_id = ? AND date = ?',
-        (user_id, date)
+    with read_connection() as conn:
+        result = conn.execute(
+            'SELECT total_tasks, done_tasks, is_completed FROM daily_entries WHERE user_id = ? AND day = ?',
+            (user_id, date_to_day(date))
+        ).fetchone()
+
+    if result is None:
+        return 0, 0, False
+    return result[0] or 0, result[1] or 0, result[2] == 1
+
+def get_task_status_with_pending(user_id, date, pending):
+    # Like get_all_task_status, with done_tasks adjusted for toggles not yet written
+    # (pending: {task_id: is_done}). The stored values of those tasks are read in the
+    # same statement as the counters so both come from one snapshot.
+    with read_connection() as conn:
+        result = conn.execute('''
+            SELECT d.total_tasks, d.done_tasks, d.is_completed, (
+                SELECT json_group_object(t.id, t.is_done) FROM tasks t
+                WHERE t.id IN (SELECT value FROM json_each(?))
+            )
+            FROM daily_entries d
+            WHERE d.user_id = ? AND d.day = ?
+        ''', (json.dumps(list(pending)), user_id, date_to_day(date))).fetchone()
+
+    if result is None:
+        return 0, 0, False
+    stored = json.loads(result[3] or '{}')
+    done = (result[1] or 0) + sum(pending[int(task_id)] - (is_done or 0) for task_id, is_done in stored.items())
+    return result[0] or 0, done, result[2] == 1
+
+# /stats reads only the rollup tables kept by the migration 8 triggers, so its cost
+# does not grow with a user's history. Periods map to (table, key column); a week
+# is keyed by its Saturday's day number, a month by its Jalali "YYYY-MM".
+STATS_PERIODS = {"week": ("stats_weekly", "week_start"), "month": ("stats_monthly", "month")}
+
+def stats_period_key(period, day):
+    if period == "week":
+        return day - (day - 6) % 7
+    return day_to_date(day)[:7]
+
+def _current_streak(first_day, last_day, today):
+    # The run through today, or through yesterday while today is still open
+    if first_day is None or last_day < today - 1:
+        return 0
+    return min(last_day, today) - first_day + 1
+
+def get_user_stats(user_id, today):
+    # Returns (week, month, current_streak, longest_streak) where week and month are
+    # (total, done, active_days, completed_days) of the periods containing `today`
+    periods = []
+    with read_connection() as conn:
+        for period, (table, column) in STATS_PERIODS.items():
+            row = conn.execute(
+                f'SELECT total_tasks, done_tasks, active_days, completed_days FROM {table} '
+                f'WHERE user_id = ? AND {column} = ?',
+                (user_id, stats_period_key(period, today))
+            ).fetchone()
+            periods.append(tuple(row) if row else (0, 0, 0, 0))
+        run = conn.execute(
+            'SELECT first_day, last_day FROM stats_streaks WHERE user_id = ? AND first_day <= ? '
+            'ORDER BY first_day DESC LIMIT 1',
+            (user_id, today)
+        ).fetchone()
+        longest = conn.execute(
+            'SELECT MAX(last_day - first_day) + 1 FROM stats_streaks WHERE user_id = ?', (user_id,)
+        ).fetchone()[0]
+
+    current = _current_streak(*run, today) if run else 0
+    return periods[0], periods[1], current, longest or 0
+
+def get_leaderboard(user_ids, period, today):
+    # One row per user id: (user_id, total, done, completed_days, current_streak) for
+    # the period containing `today`, zeros for users without activity in it
+    table, column = STATS_PERIODS[period]
+    with read_connection() as conn:
+        rows = conn.execute(f'''
+            SELECT u.value, COALESCE(s.total_tasks, 0), COALESCE(s.done_tasks, 0),
+                   COALESCE(s.completed_days, 0), r.first_day, r.last_day
+            FROM json_each(?) AS u
+            LEFT JOIN {table} s ON s.user_id = u.value AND s.{column} = ?
+            LEFT JOIN stats_streaks r ON r.user_id = u.value AND r.first_day = (
+                SELECT MAX(first_day) FROM stats_streaks WHERE user_id = u.value AND first_day <= ?
+            )
+        ''', (json.dumps(list(user_ids)), stats_period_key(period, today), today)).fetchall()
+    return [(user_id, total, done, completed, _current_streak(first, last, today))
+            for user_id, total, done, completed, first, last in rows]
+
+# bm25 weights: the owner column only scopes the match and does not rank. Archived
+# tasks are indexed under negative rowids (search.archived_rowid) and read from
+# their tasks_archive row.
+SEARCH_QUERY = '''
+    WITH matches AS MATERIALIZED (
+        SELECT rowid AS id, bm25(tasks_fts, 0.0, 1.0) AS score FROM tasks_fts WHERE tasks_fts MATCH ?
+    )
+    SELECT date, task_text, is_done, COUNT(*) OVER ()
+    FROM (
+        SELECT m.score, t.day, t.position, t.date, t.task_text, t.is_done
+        FROM matches m
+        JOIN tasks t ON t.id = m.id
+        UNION ALL
+        SELECT m.score, a.day, -m.id & 65535, a.date,
+               a.tasks -> (-m.id & 65535) ->> 1, a.tasks -> (-m.id & 65535) ->> 2
+        FROM matches m
+        JOIN tasks_archive a ON a.id = -m.id >> 16
+        WHERE m.id < 0
+    )
+    ORDER BY score, day DESC, position
+    LIMIT ? OFFSET ?
+'''
+
+def search_tasks(user_id, words, limit, offset=0):
+    # Tasks whose text contains every word (see search.py), best bm25 match first and
+    # newest first among equal ones. Returns ([(date, task_text, is_done)], total).
+    if not words:
+        return [], 0
+    with read_connection() as conn:
+        rows = conn.execute(SEARCH_QUERY, (match_expression(user_id, words), limit, offset)).fetchall()
+    total = rows[0][3] if rows else 0
+    return [row[:3] for row in rows], total
+
+# Tiering: the tasks of completed days older than ARCHIVE_AFTER_DAYS move out of the
+# hot tasks table (and its indexes) into one tasks_archive row per day, a JSON list
+# of [id, task_text, is_done] in display order. daily_entries and the stats rollups
+# stay as they are, so every per-day counter, /history, /month and /stats read is
+# unchanged; get_tasks_by_date falls back to the archive. Any write to an archived
+# day first moves it back (_restore_day), keeping the task ids its buttons carry.
+#
+# Deleting or inserting tasks fires the counter triggers, so both directions write
+# the day's counters back afterwards; the stats rollups see a net change of zero.
+
+def _archived_tasks(conn, user_id, day):
+    row = conn.execute('SELECT tasks FROM tasks_archive WHERE user_id = ? AND day = ?', (user_id, day)).fetchone()
+    return [tuple(task) for task in json.loads(row[0])] if row else []
+
+def _search_rows(archive_id, user_id, tasks):
+    return [(search.archived_rowid(archive_id, index), f"u{user_id}", search.normalize(text))
+            for index, (_, text, _) in enumerate(tasks)]
+
+def _restore_day(conn, user_id, day):
+    row = conn.execute(
+        'DELETE FROM tasks_archive WHERE user_id = ? AND day = ? RETURNING id, date, tasks', (user_id, day)
+    ).fetchone()
+    if row is None:
+        return False
+    archive_id, date, tasks = row[0], row[1], json.loads(row[2])
+    conn.executemany(
+        "INSERT INTO tasks_fts (tasks_fts, rowid, owner, body) VALUES ('delete', ?, ?, ?)",
+        _search_rows(archive_id, user_id, tasks)
     )
-    
-    result = cursor.fetchone()
-    total, done = result[0], result[1] or 0
-    
-    cursor.execute('SELECT is_completed FROM daily_entries WHERE user_id = ? AND date = ?', (user_id, date))
-    completed_result = cursor.fetchone()
-    is_completed = completed_result and completed_result[0] == 1
-    
-    conn.close()
-    return total, done, is_completed
\ No newline at end of file
+    conn.executemany(
+        'INSERT INTO tasks (id, user_id, date, day, task_text, is_done, position) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(task_id, user_id, date, day, text, is_done, position)
+         for position, (task_id, text, is_done) in enumerate(tasks)]
+    )
+    conn.execute(
+        'UPDATE daily_entries SET total_tasks = ?, done_tasks = ? WHERE user_id = ? AND day = ?',
+        (len(tasks), sum(is_done for _, _, is_done in tasks), user_id, day)
+    )
+    logger.info("Restored archived day %s of user %s", date, user_id)
+    return True
+
+def restore_archived_day(user_id, date):
+    with write_connection() as conn:
+        return _restore_day(conn, user_id, date_to_day(date))
+
+def archive_days(before_day, limit):
+    # Archives up to `limit` completed days before `before_day`; returns how many
+    with write_connection() as conn:
+        days = conn.execute('''
+            SELECT d.user_id, d.day FROM daily_entries d
+            WHERE d.is_completed = 1 AND d.day < ?
+              AND EXISTS (SELECT 1 FROM tasks t WHERE t.user_id = d.user_id AND t.day = d.day)
+            LIMIT ?
+        ''', (before_day, limit)).fetchall()
+        for user_id, day in days:
+            rows = conn.execute(
+                'SELECT id, task_text, is_done, date FROM tasks WHERE user_id = ? AND day = ? ORDER BY position, id',
+                (user_id, day)
+            ).fetchall()
+            tasks = [(task_id, text, is_done or 0) for task_id, text, is_done, _ in rows]
+            archive_id = conn.execute(
+                'INSERT INTO tasks_archive (user_id, day, date, tasks) VALUES (?, ?, ?, ?)',
+                (user_id, day, rows[0][3], json.dumps(tasks, ensure_ascii=False, separators=(",", ":")))
+            ).lastrowid
+            conn.execute('DELETE FROM tasks WHERE user_id = ? AND day = ?', (user_id, day))
+            conn.execute(
+                'UPDATE daily_entries SET total_tasks = ?, done_tasks = ? WHERE user_id = ? AND day = ?',
+                (len(tasks), sum(is_done for _, _, is_done in tasks), user_id, day)
+            )
+            conn.executemany('INSERT INTO tasks_fts (rowid, owner, body) VALUES (?, ?, ?)',
+                             _search_rows(archive_id, user_id, tasks))
+    return len(days)
+
+def merge_search_index(pages):
+    # Moving tasks between tiers leaves delete markers in tasks_fts that are only
+    # dropped when the segments holding them are merged; a negative page count makes
+    # every segment eligible, so repeated steps end in one segment (an incremental
+    # 'optimize'). Returns whether the step did any work.
+    with write_connection() as conn:
+        changes = conn.total_changes
+        conn.execute("INSERT INTO tasks_fts (tasks_fts, rank) VALUES ('merge', ?)", (-int(pages),))
+        return conn.total_changes - changes > 1
+
+def enable_incremental_vacuum():
+    # One-time conversion of a database created before auto_vacuum was set: a full
+    # VACUUM that rewrites the file. Returns False when nothing had to be done.
+    with write_connection() as conn:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            return False
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+    return True
+
+def incremental_vacuum(pages):
+    # Returns the free pages left. executescript steps the pragma to completion;
+    # execute() would free a single page.
+    with write_connection() as conn:
+        conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free:
+            # The file only shrinks once the WAL is checkpointed
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return free
+
+# Export reads one row per day, in (user_id, day) index order, with the day's tasks
+# as a JSON list in the tasks_archive format; a join with all_tasks would have to
+# materialize the view. Being one statement, it reads a single snapshot.
+EXPORT_QUERY = '''
+    SELECT d.user_id, d.date, d.is_completed, COALESCE(
+        (SELECT a.tasks FROM tasks_archive a WHERE a.user_id = d.user_id AND a.day = d.day),
+        (SELECT json_group_array(json_array(t.id, t.task_text, COALESCE(t.is_done, 0))) FROM (
+            SELECT id, task_text, is_done FROM tasks
+            WHERE user_id = d.user_id AND day = d.day ORDER BY position, id
+        ) t)
+    )
+    FROM daily_entries d
+    WHERE d.total_tasks > 0 {condition}
+    ORDER BY d.user_id, d.day
+'''
+
+def iter_history(user_id=None):
+    # Yields (user_id, date, position, task_text, is_done, is_completed) for every
+    # task of one user (or all users), oldest day first, fetching a batch of days at
+    # a time so memory does not grow with the history
+    if user_id is None:
+        sql, params = EXPORT_QUERY.format(condition=''), ()
+    else:
+        sql, params = EXPORT_QUERY.format(condition='AND d.user_id = ?'), (user_id,)
+    with read_connection() as conn:
+        cursor = conn.execute(sql, params)
+        while True:
+            days = cursor.fetchmany(TRANSFER_BATCH_ROWS)
+            if not days:
+                break
+            for uid, date, is_completed, tasks in days:
+                for position, (_, text, is_done) in enumerate(json.loads(tasks)):
+                    yield uid, date, position, text, is_done, is_completed or 0
+
+def import_history(rows):
+    # Bulk load of (user_id, date, position, task_text, is_done, is_completed) rows in
+    # one transaction, TRANSFER_BATCH_ROWS per executemany. Every day in the rows
+    # replaces that day in the database (archived or not); other days are kept. The
+    # counters follow through the tasks triggers and is_completed is written per
+    # day, so daily_entries and the stats rollups end up as the file describes.
+    # Rows must come grouped by user and day in ascending order, as iter_history
+    # writes them; that keeps memory constant. Returns (days, tasks).
+    days = tasks = 0
+    previous = None
+    rows = iter(rows)
+    with write_connection() as conn:
+        while True:
+            batch = list(islice(rows, TRANSFER_BATCH_ROWS))
+            if not batch:
+                break
+            new_days, inserts, completed = [], [], []
+            for user_id, date, position, text, is_done, is_completed in batch:
+                day = date_to_day(date)
+                key = (user_id, day)
+                if key != previous:
+                    if previous is not None and key < previous:
+                        raise ValueError(f"Rows are not sorted by user and date at {user_id} {date}")
+                    new_days.append(key)
+                    completed.append((is_completed, user_id, day))
+                    previous = key
+                inserts.append((user_id, day_to_date(day), day, text, is_done, position))
+
+            for user_id, day in new_days:
+                _restore_day(conn, user_id, day)
+            conn.executemany('DELETE FROM tasks WHERE user_id = ? AND day = ?', new_days)
+            conn.executemany(
+                'INSERT INTO tasks (user_id, date, day, task_text, is_done, position) VALUES (?, ?, ?, ?, ?, ?)',
+                inserts
+            )
+            conn.executemany('UPDATE daily_entries SET is_completed = ? WHERE user_id = ? AND day = ?', completed)
+            days += len(new_days)
+            tasks += len(inserts)
+
+    view_cache.clear()
+    logger.info("Imported %s task(s) on %s day(s)", tasks, days)
+    return days, tasks
+
+COUNTER_MISMATCH_QUERY = '''
+    SELECT d.user_id, d.date, d.total_tasks, d.done_tasks, COUNT(t.id), COALESCE(SUM(t.is_done), 0)
+    FROM daily_entries d
+    LEFT JOIN all_tasks t ON t.user_id = d.user_id AND t.day = d.day
+    GROUP BY d.id
+    HAVING COALESCE(d.total_tasks, 0) != COUNT(t.id) OR COALESCE(d.done_tasks, 0) != COALESCE(SUM(t.is_done), 0)
+    UNION ALL
+    SELECT t.user_id, MIN(t.date), NULL, NULL, COUNT(*), COALESCE(SUM(t.is_done), 0)
+    FROM all_tasks t
+    WHERE NOT EXISTS (SELECT 1 FROM daily_entries d WHERE d.user_id = t.user_id AND d.day = t.day)
+    GROUP BY t.user_id, t.day
+'''
+
+def check_daily_counters():
+    # Rows are (user_id, date, stored_total, stored_done, actual_total, actual_done)
+    with read_connection() as conn:
+        return conn.execute(COUNTER_MISMATCH_QUERY).fetchall()
+
+def repair_daily_counters():
+    with write_connection() as conn:
+        mismatches = conn.execute(COUNTER_MISMATCH_QUERY).fetchall()
+        if mismatches:
+            for statement in REBUILD_DAILY_COUNTERS:
+                conn.execute(statement)
+
+    if mismatches:
+        view_cache.clear()
+        logger.warning("Repaired daily counters for %s day(s)", len(mismatches))
+    return mismatches
+
+def get_debug_info(user_id, date):
+    with read_connection() as conn:
+        total_tasks = conn.execute('SELECT COUNT(*) FROM all_tasks WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+        today_tasks = conn.execute(
+            'SELECT COUNT(*) FROM all_tasks WHERE user_id = ? AND day = ?', (user_id, date_to_day(date))
+        ).fetchone()[0]
+
+        recent_tasks = conn.execute(
+            'SELECT date, task_text FROM tasks WHERE user_id = ? ORDER BY created_at DESC LIMIT 5',
+            (user_id,)
+        ).fetchall()
+
+    return os.path.exists(DB_FILE), total_tasks, today_tasks, recent_tasks
@@ -0,0 +1,144 @@
+import re
+from array import array
+from bisect import bisect_right
+from datetime import date as gregorian_date
+from functools import lru_cache
+import jdatetime
+from .config import DATE_TABLE_YEARS
+
+# Dates are stored and displayed as Jalali "YYYY-MM-DD" strings. Where a compact
+# form is needed (callback data, the day columns) a date is its day number: the
+# proleptic Gregorian ordinal of the same day, so consecutive days are consecutive
+# integers.
+#
+# Conversions go through a table of the day number of the first day of every
+# Jalali month in DATE_TABLE_YEARS (plus one sentinel), so Jalali -> day is an
+# index and day -> Jalali a bisect. Dates outside the table fall back to jdatetime.
+
+DATE_FORMAT = "%Y-%m-%d"
+
+MONTH_NAMES = ("فروردین", "اردیبهشت", "خرداد", "تیر", "مرداد", "شهریور",
+               "مهر", "آبان", "آذر", "دی", "بهمن", "اسفند")
+
+def _build_month_starts(first_year, last_year):
+    starts = array("l")
+    day = jdatetime.date(first_year, 1, 1).togregorian().toordinal()
+    for year in range(first_year, last_year + 1):
+        leap = jdatetime.date(year, 1, 1).isleap()
+        for month in range(1, 13):
+            starts.append(day)
+            day += 31 if month <= 6 else 30 if month <= 11 else 30 if leap else 29
+    starts.append(day)
+    return starts
+
+_first_year, _last_year = DATE_TABLE_YEARS
+_month_starts = _build_month_starts(_first_year, _last_year)
+
+def jalali_to_day(year, month, day):
+    if not 1 <= month <= 12 or day < 1:
+        raise ValueError(f"Invalid Jalali date {year}-{month}-{day}")
+    if _first_year <= year <= _last_year:
+        index = (year - _first_year) * 12 + month - 1
+        start = _month_starts[index]
+        if day > _month_starts[index + 1] - start:
+            raise ValueError(f"Invalid Jalali date {year}-{month}-{day}")
+        return start + day - 1
+    return jdatetime.date(year, month, day).togregorian().toordinal()
+
+def day_to_jalali(day):
+    # Returns (year, month, day)
+    if _month_starts[0] <= day < _month_starts[-1]:
+        index = bisect_right(_month_starts, day) - 1
+        return _first_year + index // 12, index % 12 + 1, day - _month_starts[index] + 1
+    converted = jdatetime.date.fromgregorian(date=gregorian_date.fromordinal(day))
+    return converted.year, converted.month, converted.day
+
+def date_to_day(date):
+    year, month, day = date.split("-")
+    return jalali_to_day(int(year), int(month), int(day))
+
+@lru_cache(maxsize=4096)
+def day_to_date(day):
+    return "%04d-%02d-%02d" % day_to_jalali(day)
+
+def today_day():
+    return gregorian_date.today().toordinal()
+
+def today():
+    return day_to_date(today_day())
+
+@lru_cache(maxsize=4096)
+def display_date(date):
+    # Stored dates are zero-padded, so display needs no parsing
+    return date.replace("-", "/")
+
+@lru_cache(maxsize=256)
+def month_title(year, month):
+    return f"{MONTH_NAMES[month - 1]} {year}"
+
+# Ranges are inclusive (first_day, last_day) pairs of day numbers
+
+def jalali_month_range(year, month):
+    first = jalali_to_day(year, month, 1)
+    following = jalali_to_day(year + 1, 1, 1) if month == 12 else jalali_to_day(year, month + 1, 1)
+    return first, following - 1
+
+# Parsing dates typed by users (e.g. the first line of /tasks)
+
+_DIGITS = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+
+# YYYY-MM-DD or DD-MM-YYYY with '-' or '/' used consistently. Years 1300-1699 are
+# Jalali, anything else Gregorian (so both 1404-07-01 and 2025-09-23 work)
+NUMERIC_DATE = re.compile(r'(\d{4})([/-])(\d{1,2})\2(\d{1,2})|(\d{1,2})([/-])(\d{1,2})\6(\d{4})')
+
+# Relative words are only recognised alone on the first line, so tasks such as
+# "call Ali tomorrow" or "شنبه جلسه تیم" are left alone. Weekdays mean the next
+# such day (today if it matches).
+RELATIVE_OFFSETS = {
+    "today": 0, "امروز": 0,
+    "tomorrow": 1, "فردا": 1,
+    "yesterday": -1, "دیروز": -1,
+    "پس‌فردا": 2, "پسفردا": 2, "پس فردا": 2,
+}
+WEEKDAYS = {
+    # Python weekday numbers: Monday is 0
+    "شنبه": 5, "یکشنبه": 6, "دوشنبه": 0, "سه‌شنبه": 1, "سه شنبه": 1, "سهشنبه": 1,
+    "چهارشنبه": 2, "پنجشنبه": 3, "پنج‌شنبه": 3, "پنج شنبه": 3, "جمعه": 4,
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+}
+_RELATIVE_WORDS = {**{word: ("offset", value) for word, value in RELATIVE_OFFSETS.items()},
+                   **{word: ("weekday", value) for word, value in WEEKDAYS.items()}}
+RELATIVE_DATE = re.compile(
+    r'\s*(' + '|'.join(re.escape(word) for word in sorted(_RELATIVE_WORDS, key=len, reverse=True)) + r')[^\S\n]*(?:\n|$)',
+    re.IGNORECASE,
+)
+
+def _numeric_to_day(match):
+    if match.group(1):
+        year, month, day = int(match.group(1)), int(match.group(3)), int(match.group(4))
+    else:
+        day, month, year = int(match.group(5)), int(match.group(7)), int(match.group(8))
+    if 1300 <= year < 1700:
+        return jalali_to_day(year, month, day)
+    return gregorian_date(year, month, day).toordinal()
+
+def parse_date(text, today=None):
+    # Finds a date in text. Returns (jalali_date, text_without_it), or (None, text)
+    # when there is no (valid) date.
+    today = today_day() if today is None else today
+
+    match = RELATIVE_DATE.match(text)
+    if match:
+        kind, value = _RELATIVE_WORDS[match.group(1).lower()]
+        day = today + value if kind == "offset" else today + (value - gregorian_date.fromordinal(today).weekday()) % 7
+        return day_to_date(day), text[match.end():].strip()
+
+    match = NUMERIC_DATE.search(text.translate(_DIGITS))
+    if match:
+        try:
+            day = _numeric_to_day(match)
+        except ValueError:
+            return None, text
+        return day_to_date(day), (text[:match.start()] + text[match.end():]).strip()
+
+    return None, text
@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from telegram.error import BadRequest, RetryAfter
+from .config import TOGGLE_EDIT_DELAY
+
+logger = logging.getLogger(__name__)
+
+# Hash of the last text/keyboard sent for each (chat_id, message_id), so an edit
+# that would not change anything is never sent to Telegram.
+MAX_TRACKED_MESSAGES = 4096
+_sent_hashes = OrderedDict()
+_pending = {}
+_latest = {}
+_dirty = set()
+
+def content_hash(text, reply_markup=None):
+    markup = json.dumps(reply_markup.to_dict(), sort_keys=True, ensure_ascii=False) if reply_markup else ""
+    return hashlib.blake2b(f"{text}\0{markup}".encode(), digest_size=8).digest()
+
+def remember(chat_id, message_id, text, reply_markup=None):
+    key = (chat_id, message_id)
+    _sent_hashes[key] = content_hash(text, reply_markup)
+    _sent_hashes.move_to_end(key)
+    while len(_sent_hashes) > MAX_TRACKED_MESSAGES:
+        _sent_hashes.popitem(last=False)
+
+async def edit_message(query, text, reply_markup=None):
+    key = (query.message.chat_id, query.message.message_id)
+    digest = content_hash(text, reply_markup)
+    if _sent_hashes.get(key) == digest:
+        return False
+
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+    remember(*key, text, reply_markup)
+    return True
+
+def schedule_edit(context, query, render):
+    # Re-render the message once the debounce window closes. Taps that arrive while
+    # an edit is pending only change the database, replace the render (it may show
+    # another page now) and mark the message dirty; the pending edit renders with the
+    # latest one and repeats if it was dirtied while rendering.
+    key = (query.message.chat_id, query.message.message_id)
+    _latest[key] = (query, render)
+    if key in _pending:
+        _dirty.add(key)
+        return
+    _pending[key] = context.application.create_task(_edit_later(key))
+
+def cancel(query):
+    # Drops a pending re-render of the message, e.g. before another action edits it,
+    # so the delayed render does not overwrite that edit
+    key = (query.message.chat_id, query.message.message_id)
+    task = _pending.pop(key, None)
+    _latest.pop(key, None)
+    _dirty.discard(key)
+    if task is not None:
+        task.cancel()
+
+def pending_count():
+    return len(_pending)
+
+async def _edit_later(key):
+    try:
+        while True:
+            await asyncio.sleep(TOGGLE_EDIT_DELAY)
+            _dirty.discard(key)
+            for attempt in range(3):
+                try:
+                    query, render = _latest[key]
+                    text, reply_markup = await render()
+                    await edit_message(query, text, reply_markup)
+                    break
+                except RetryAfter as e:
+                    logger.warning("Edit of message %s rate limited, retrying in %ss", key, e.retry_after)
+                    await asyncio.sleep(e.retry_after)
+            else:
+                # The message keeps its old checkboxes until the next tap re-renders it
+                logger.warning("Gave up editing message %s after %s rate limits", key, attempt + 1)
+            if key not in _dirty:
+                return
+    except Exception as e:
+        logger.error("Error editing message %s: %s", key, e)
+    finally:
+        # cancel() may already have replaced this task
+        if _pending.get(key) is asyncio.current_task():
+            _pending.pop(key)
+            _latest.pop(key, None)
+            _dirty.discard(key)
@@ -1,16 +1,34 @@
-from telegram.ext import CommandHandler, CallbackQueryHandler
+import asyncio
+import tempfile
+import time
+from telegram.ext import CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from telegram import Update
-from .config import USERS, logger, SLEEP_REMINDER_URL
-from .database import (save_daily_tasks, get_tasks_by_date, toggle_task_status, 
-                     mark_all_tasks_done, mark_daily_completed, get_all_task_status, 
-                     get_last_n_days, has_tasks_for_date, is_daily_completed)
-from .utils import parse_date_from_text, show_tasks_for_date, show_complete_day_confirmation
-from .notifications import notify_task_entry
-import jdatetime
+from .config import (USERS, SLEEP_REMINDER_URL, HISTORY_DEFAULT_DAYS, HISTORY_MAX_DAYS, DEFAULT_TEAM,
+                     PROFILER_ENABLED, PROFILER_INTERVAL, PROFILER_MAX_SECONDS)
+from .async_database import (save_daily_tasks, get_tasks_by_date, toggle_task_status, 
+                             mark_all_tasks_done, mark_daily_completed, get_all_task_status, 
+                             get_history, get_day_range, has_tasks_for_date, get_debug_info,
+                             check_daily_counters, repair_daily_counters,
+                             get_reminder_settings, save_reminder_setting,
+                             upsert_user, deactivate_user, get_user_stats, get_leaderboard,
+                             restore_archived_day, export_history, import_history)
+from .database import SAVE_APPEND, SAVE_DIFF
+from .utils import (show_tasks_for_date, show_complete_day_confirmation,
+                    schedule_tasks_refresh, format_history_line, show_history, show_search)
+from .notifications import notify_task_entry, notify_other_users
+from .scheduler import parse_time, effective_settings, update_user_schedule, refresh_user_schedules
+from .users import TEAMS, team_of, team_members, is_admin, reload_users
+from .dates import (day_to_date, day_to_jalali, jalali_month_range, month_title, parse_date,
+                    today as today_date, today_day)
+from . import view_cache, broadcast, shards, toggle_buffer, callbacks, metrics, profiler, search, transfer, edits
+import logging
+import pytz
+
+logger = logging.getLogger(__name__)
 
 async def start(update, context):
     user_id = update.message.chat_id
-    logger.info(f"User {user_id} started the bot")
+    logger.info("User %s started the bot", user_id)
     
     if user_id not in USERS:
         await update.message.reply_text(
@@ -28,10 +46,16 @@ async def start(update, context):
 /today - نمایش تسک‌های امروز
 /date - نمایش تسک‌های روز مشخص
 /last5 - نمایش 5 روز گذشته
+/history - تاریخچه روزها (مثال: /history 30)
+/stats - آمار هفته و ماه، رکورد روزهای پیاپی و جدول تیم
+/search - جستجو در تسک‌های گذشته (مثال: /search خرید کتاب)
+/export - دریافت فایل کل تاریخچه (CSV یا JSONL)
+/import - بازگرداندن تاریخچه از فایل خروجی
 
 ⏰ یادآوری‌ها:
 • ساعت 9 صبح: یادآوری ثبت تسک‌ها (فقط اگر ثبت نکرده باشید)
 • ساعت 10 صبح: یادآوری خواب
+• با /remind می‌توانید ساعت‌ها و منطقه زمانی خود را تغییر دهید
 
 💡 نکته: در انتهای لیست تسک‌های هر روز، گزینه "✅ اتمام روز" برای تکمیل روز وجود دارد.
 
@@ -54,17 +78,25 @@ async def tasks(update, context):
             "مثال:\n"
             "/tasks تمرین ورزشی\nخرید مواد غذایی\nمطالعه کتاب\n\n"
             "یا برای روز مشخص:\n"
-            "/tasks 2024-01-15\nتمرین ورزشی\nخرید مواد غذایی"
+            "/tasks 2024-01-15\nتمرین ورزشی\nخرید مواد غذایی\n\n"
+            "یا با روز نسبی (فردا، دیروز، نام روز هفته):\n"
+            "/tasks فردا\nتمرین ورزشی\n\n"
+            "برای افزودن به لیست فعلی:\n"
+            "/tasks +\nتسک جدید"
         )
         return
 
-    date_from_text, remaining_text = parse_date_from_text(update.message.text)
+    append = task_text.startswith("+")
+    if append:
+        task_text = task_text[1:].strip()
+
+    date_from_text, remaining_text = parse_date(task_text)
     
     if date_from_text:
         target_date = date_from_text
         task_content = remaining_text
     else:
-        target_date = jdatetime.date.today().strftime("%Y-%m-%d")
+        target_date = today_date()
         task_content = task_text
 
     if not task_content.strip():
@@ -73,17 +105,28 @@ async def tasks(update, context):
 
     task_list = [task.strip() for task in task_content.split("\n") if task.strip()]
 
-    logger.info(f"User {user_id} ({USERS[user_id]}) adding {len(task_list)} tasks for {target_date}")
+    logger.info(
+        "User %s (%s) %s %s tasks for %s",
+        user_id, USERS[user_id], "appending" if append else "saving", len(task_list), target_date
+    )
 
-    save_daily_tasks(user_id, target_date, task_list)
+    mode = SAVE_APPEND if append else SAVE_DIFF
+    added, removed, kept = await save_daily_tasks(user_id, target_date, task_list, mode)
     
-    await update.message.reply_text(f"✅ {len(task_list)} تسک برای تاریخ {target_date} ثبت شد.")
-    await notify_task_entry(context, user_id, target_date, len(task_list))
+    if append:
+        await update.message.reply_text(f"➕ {added} تسک به تاریخ {target_date} اضافه شد.")
+    else:
+        await update.message.reply_text(
+            f"✅ {len(task_list)} تسک برای تاریخ {target_date} ثبت شد.\n"
+            f"({added} جدید، {kept} بدون تغییر، {removed} حذف شده)"
+        )
+    if added:
+        await notify_task_entry(context, user_id, target_date, added)
     await show_tasks_for_date(update, context, user_id, target_date)
 
 async def today(update, context):
     user_id = update.message.chat_id
-    today = jdatetime.date.today().strftime("%Y-%m-%d")
+    today = today_date()
     
     if user_id not in USERS:
         await update.message.reply_text("❌ شما مجاز به استفاده از این ربات نیستید.")
@@ -103,10 +146,8 @@ async def date_tasks(update, context):
         await update.message.reply_text("❌ لطفاً تاریخ را به فرمت YYYY-MM-DD (جلالی) وارد کنید.\n\nمثال:\n/date 1404-07-01")
         return
     
-    date_str = args[0]
-    try:
-        jdatetime.datetime.strptime(date_str, "%Y-%m-%d")
-    except ValueError:
+    date_str, _ = parse_date(" ".join(args))
+    if date_str is None:
         await update.message.reply_text("❌ فرمت تاریخ اشتباه است. لطفاً به فرمت YYYY-MM-DD (جلالی) وارد کنید.\n\nمثال: 1404-07-01")
         return
     
@@ -119,7 +160,7 @@ async def last5_days(update, context):
         await update.message.reply_text("❌ شما مجاز به استفاده از این ربات نیستید.")
         return
     
-    results = get_last_n_days(user_id, 5)
+    results, _ = await get_history(user_id, 5)
     
     if not results:
         await update.message.reply_text("❌ هیچ تسکی در 5 روز گذشته ثبت نشده.")
@@ -127,25 +168,203 @@ async def last5_days(update, context):
     
     message = "📊 گزارش 5 روز گذشته:\n\n"
     
-    for date, total, done in results:
-        percentage = int((done / total) * 100) if total > 0 else 0
-        is_completed = is_daily_completed(user_id, date)
-        
-        if is_completed:
-            status_emoji = "🎉"
-        else:
-            status_emoji = "🟢" if percentage >= 80 else "🟡" if percentage >= 50 else "🔴"
-        
+    for date, total, done, is_completed in results:
+        message += format_history_line(date, total, done, is_completed)
+    
+    await update.message.reply_text(message)
+
+async def history(update, context):
+    user_id = update.message.chat_id
+    
+    if user_id not in USERS:
+        await update.message.reply_text("❌ شما مجاز به استفاده از این ربات نیستید.")
+        return
+    
+    limit = HISTORY_DEFAULT_DAYS
+    if context.args:
         try:
-            persian_date = jdatetime.datetime.strptime(date, "%Y-%m-%d").strftime("%Y/%m/%d")
-        except:
-            persian_date = date
-            
-        completion_text = " (تکمیل شده)" if is_completed else ""
-        message += f"{status_emoji} {persian_date}: {done}/{total} تسک ({percentage}%){completion_text}\n"
+            limit = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("❌ تعداد روزها باید عدد باشد.\n\nمثال:\n/history 30")
+            return
+    limit = max(1, min(limit, HISTORY_MAX_DAYS))
+    
+    await show_history(update, context, user_id, limit)
+
+async def month(update, context):
+    user_id = update.message.chat_id
+    
+    if user_id not in USERS:
+        await update.message.reply_text("❌ شما مجاز به استفاده از این ربات نیستید.")
+        return
+    
+    year, month_number, _ = day_to_jalali(today_day())
+    if context.args:
+        parts = context.args[0].replace("/", "-").split("-")
+        try:
+            if len(parts) == 2:
+                year, month_number = int(parts[0]), int(parts[1])
+            elif len(parts) == 1:
+                month_number = int(parts[0])
+            else:
+                raise ValueError(context.args[0])
+            if not 1 <= month_number <= 12:
+                raise ValueError(month_number)
+            first_day, last_day = jalali_month_range(year, month_number)
+        except ValueError:
+            await update.message.reply_text("❌ فرمت ماه اشتباه است.\n\nمثال:\n/month\n/month 7\n/month 1404-07")
+            return
+    else:
+        first_day, last_day = jalali_month_range(year, month_number)
+    
+    rows = await get_day_range(user_id, first_day, last_day)
+    title = month_title(year, month_number)
+    
+    if not rows:
+        await update.message.reply_text(f"❌ هیچ تسکی در ماه {title} ثبت نشده.")
+        return
+    
+    total = sum(row[1] for row in rows)
+    done = sum(row[2] for row in rows)
+    completed_days = sum(1 for row in rows if row[3])
+    percentage = int((done / total) * 100) if total > 0 else 0
+    
+    message = (
+        f"📅 گزارش ماه {title}:\n"
+        f"{len(rows)} روز فعال، {completed_days} روز تکمیل شده، "
+        f"{done}/{total} تسک ({percentage}%)\n\n"
+    )
+    for date, day_total, day_done, is_completed in rows:
+        message += format_history_line(date, day_total, day_done, is_completed)
     
     await update.message.reply_text(message)
 
+STATS_PERIOD_ARGS = {"week": "week", "هفته": "week", "month": "month", "ماه": "month"}
+LEADERBOARD_SIZE = 10
+
+def format_rate(total, done):
+    percentage = int((done / total) * 100) if total > 0 else 0
+    return f"{done}/{total} تسک ({percentage}%)"
+
+async def stats(update, context):
+    user_id = update.message.chat_id
+    
+    if user_id not in USERS:
+        await update.message.reply_text("❌ شما مجاز به استفاده از این ربات نیستید.")
+        return
+    
+    period = "week"
+    if context.args:
+        period = STATS_PERIOD_ARGS.get(context.args[0].lower())
+        if period is None:
+            await update.message.reply_text("❌ بازه نامعتبر است.\n\nمثال:\n/stats\n/stats month")
+            return
+    
+    today = today_day()
+    week, month_stats, current_streak, longest_streak = await get_user_stats(user_id, today)
+    year, month_number, _ = day_to_jalali(today)
+    
+    message = (
+        f"📈 آمار شما:\n\n"
+        f"این هفته: {format_rate(week[0], week[1])}، {week[3]}/{week[2]} روز تکمیل شده\n"
+        f"{month_title(year, month_number)}: {format_rate(month_stats[0], month_stats[1])}، "
+        f"{month_stats[3]}/{month_stats[2]} روز تکمیل شده\n"
+        f"🔥 روزهای پیاپی تکمیل شده: {current_streak} (بهترین: {longest_streak})\n"
+    )
+    
+    members = team_members(user_id) or {user_id}
+    rows = await get_leaderboard(members, period, today)
+    # Completion rate first; ties go to more done tasks, completed days and streak
+    rows.sort(key=lambda row: (row[2] / row[1] if row[1] else 0, row[2], row[3], row[4]), reverse=True)
+    
+    title = "این هفته" if period == "week" else "این ماه"
+    message += f"\n🏆 جدول تیم #{team_of(user_id) or DEFAULT_TEAM} ({title}):\n"
+    for rank, (member, total, done, completed_days, streak) in enumerate(rows, 1):
+        if rank > LEADERBOARD_SIZE and member != user_id:
+            continue
+        marker = " 👈" if member == user_id else ""
+        streak_text = f" 🔥{streak}" if streak else ""
+        message += f"{rank}. {USERS.get(member, member)}: {format_rate(total, done)}{streak_text}{marker}\n"
+    
+    await update.message.reply_text(message[:4000])
+
+async def search_command(update, context):
+    user_id = update.message.chat_id
+    
+    if user_id not in USERS:
+        await update.message.reply_text("❌ شما مجاز به استفاده از این ربات نیستید.")
+        return
+    
+    text = " ".join(context.args)
+    if not search.query_words(text):
+        await update.message.reply_text(
+            "❌ عبارت جستجو را بعد از دستور بنویسید.\n\n"
+            "مثال:\n/search خرید کتاب\n\n"
+            "تسک‌هایی پیدا می‌شوند که همه کلمه‌ها را (یا کلمه‌هایی که با آن‌ها شروع می‌شوند) داشته باشند."
+        )
+        return
+    
+    await show_search(update, context, user_id, search.save(user_id, text), text)
+
+async def export_command(update, context):
+    user_id = update.message.chat_id
+    
+    if user_id not in USERS:
+        await update.message.reply_text("❌ شما مجاز به استفاده از این ربات نیستید.")
+        return
+    
+    fmt = context.args[0].lower() if context.args else "csv"
+    if fmt not in transfer.FORMATS:
+        await update.message.reply_text("❌ قالب باید csv یا jsonl باشد.\n\nمثال:\n/export jsonl")
+        return
+    
+    # The file is written in the database thread and only held on disk until sent
+    with tempfile.TemporaryFile() as file:
+        count = await export_history(file, fmt, user_id)
+        if not count:
+            await update.message.reply_text("📭 هنوز تسکی ثبت نکرده‌اید.")
+            return
+        if file.tell() > transfer.UPLOAD_LIMIT:
+            await update.message.reply_text("❌ فایل تاریخچه از حد مجاز تلگرام (50MB) بزرگ‌تر است.")
+            return
+        file.seek(0)
+        await update.message.reply_document(
+            document=file,
+            filename=f"tasks-{today_date()}.{fmt}.gz",
+            caption=f"📦 {count} تسک. برای بازگرداندن، فایل را با کپشن /import بفرستید.",
+        )
+
+async def import_command(update, context):
+    user_id = update.message.chat_id
+    
+    if user_id not in USERS:
+        await update.message.reply_text("❌ شما مجاز به استفاده از این ربات نیستید.")
+        return
+    
+    document = update.message.document
+    if document is None:
+        await update.message.reply_text(
+            "📥 فایلی را که با /export گرفته‌اید با کپشن /import بفرستید.\n\n"
+            "روزهای داخل فایل جایگزین همان روزها می‌شوند و بقیه روزها دست نمی‌خورند."
+        )
+        return
+    if document.file_size and document.file_size > transfer.DOWNLOAD_LIMIT:
+        await update.message.reply_text("❌ فایل از حد مجاز تلگرام (20MB) بزرگ‌تر است.")
+        return
+    
+    with tempfile.TemporaryFile() as file:
+        await (await document.get_file()).download_to_memory(file)
+        file.seek(0)
+        try:
+            days, count = await import_history(file, user_id)
+        except ValueError as e:
+            logger.warning("Import from user %s rejected: %s", user_id, e)
+            await update.message.reply_text(f"❌ فایل قابل خواندن نیست و چیزی تغییر نکرد.\n{str(e)[:300]}")
+            return
+    shards.broadcast_control("clear_view_cache")
+    
+    await update.message.reply_text(f"✅ {count} تسک در {days} روز وارد شد.")
+
 async def debug_info(update, context):
     user_id = update.message.chat_id
     
@@ -154,25 +373,8 @@ async def debug_info(update, context):
         return
     
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        db_exists = os.path.exists(DB_FILE)
-        
-        cursor.execute('SELECT COUNT(*) FROM tasks WHERE user_id = ?', (user_id,))
-        total_tasks = cursor.fetchone()[0]
-        
-        today = jdatetime.date.today().strftime("%Y-%m-%d")
-        cursor.execute('SELECT COUNT(*) FROM tasks WHERE user_id = ? AND date = ?', (user_id, today))
-        today_tasks = cursor.fetchone()[0]
-        
-        cursor.execute(
-            'SELECT date, task_text FROM tasks WHERE user_id = ? ORDER BY created_at DESC LIMIT 5',
-            (user_id,)
-        )
-        recent_tasks = cursor.fetchall()
-        
-        conn.close()
+        today = today_date()
+        db_exists, total_tasks, today_tasks, recent_tasks = await get_debug_info(user_id, today)
         
         message = f"🔧 اطلاعات دیباگ:\n\n"
         message += f"📁 دیتابیس موجود: {'✅' if db_exists else '❌'}\n"
@@ -185,12 +387,184 @@ async def debug_info(update, context):
                 message += f"• {date}: {task_text[:30]}...\n"
         else:
             message += "❌ هیچ تسکی یافت نشد\n"
+        
+        outbox = broadcast.stats()
+        message += (
+            f"\n📤 صف ارسال: {outbox['pending']} در انتظار، {outbox['sent']} ارسال، "
+            f"{outbox['failed']} ناموفق، {outbox['rate_limited']} محدودیت نرخ "
+            f"({outbox['sent_per_sec_1m']:.2f}/s)\n"
+        )
+        
+        cache = view_cache.stats()
+        message += (
+            f"\n🗂 کش نمایش: {cache['size']}/{cache['capacity']} "
+            f"(hit {cache['hits']}, miss {cache['misses']}, invalidate {cache['invalidations']})\n"
+        )
+        
+        if toggle_buffer.enabled():
+            buffered = toggle_buffer.stats()
+            message += (
+                f"\n☑️ تیک‌های ذخیره‌نشده: {buffered['pending']} "
+                f"({buffered['toggles']} تیک، {buffered['flushes']} ذخیره)\n"
+            )
             
         await update.message.reply_text(message)
         
     except Exception as e:
         await update.message.reply_text(f"❌ خطا در دیباگ: {str(e)}")
 
+async def check_counters(update, context):
+    user_id = update.message.chat_id
+    
+    if not is_admin(user_id):
+        await update.message.reply_text("❌ این دستور فقط برای مدیر ربات است.")
+        return
+    
+    fix = bool(context.args) and context.args[0] == "fix"
+    mismatches = await repair_daily_counters() if fix else await check_daily_counters()
+    if fix and mismatches:
+        # The other workers cached views built from the old counters
+        shards.broadcast_control("clear_view_cache")
+    
+    if not mismatches:
+        await update.message.reply_text("✅ شمارنده‌های روزانه با تسک‌ها هماهنگ هستند.")
+        return
+    
+    message = f"⚠️ {len(mismatches)} روز با شمارنده نادرست:\n\n"
+    for uid, date, stored_total, stored_done, total, done in mismatches[:20]:
+        message += f"• {uid} {date}: {stored_done or 0}/{stored_total or 0} ← {done}/{total}\n"
+    if len(mismatches) > 20:
+        message += "...\n"
+    message += "\n🔧 شمارنده‌ها بازسازی شدند." if fix else "\nبرای اصلاح: /checkdb fix"
+    
+    await update.message.reply_text(message)
+
+async def remind(update, context):
+    user_id = update.message.chat_id
+    
+    if user_id not in USERS:
+        await update.message.reply_text("❌ شما مجاز به استفاده از این ربات نیستید.")
+        return
+    
+    if context.args:
+        kind = context.args[0].lower()
+        value = context.args[1] if len(context.args) > 1 else ""
+        if kind in ("task", "sleep") and (value.lower() == "off" or parse_time(value)):
+            column, value = f"{kind}_time", value.lower()
+        elif kind == "tz" and value in pytz.all_timezones_set:
+            column = "timezone"
+        else:
+            await update.message.reply_text(
+                "❌ استفاده:\n"
+                "/remind task 08:30 - ساعت یادآوری ثبت تسک\n"
+                "/remind sleep 10:00 - ساعت یادآوری خواب\n"
+                "/remind task off - غیرفعال کردن یادآوری\n"
+                "/remind tz Asia/Tehran - منطقه زمانی"
+            )
+            return
+        
+        await save_reminder_setting(user_id, column, value)
+        saved = await get_reminder_settings([user_id])
+        update_user_schedule(context.job_queue, user_id, saved.get(user_id))
+    
+    task_time, sleep_time, tz_name = effective_settings(user_id)
+    await update.message.reply_text(
+        f"⏰ یادآوری‌های شما:\n\n"
+        f"📝 ثبت تسک‌ها: {task_time}\n"
+        f"😴 خواب: {sleep_time}\n"
+        f"🌍 منطقه زمانی: {tz_name}\n\n"
+        f"برای تغییر: /remind task 08:30"
+    )
+
+async def list_users(update, context):
+    user_id = update.message.chat_id
+    
+    if user_id not in USERS:
+        await update.message.reply_text("❌ شما مجاز به استفاده از این ربات نیستید.")
+        return
+    
+    if is_admin(user_id):
+        teams = sorted(TEAMS.items())
+    else:
+        teams = [(team_of(user_id), team_members(user_id))]
+    
+    message = f"👥 کاربران ({len(USERS)} نفر):\n"
+    for team, members in teams:
+        message += f"\n#{team}:\n"
+        for member in sorted(members)[:50]:
+            admin_mark = " ⭐" if is_admin(member) else ""
+            message += f"• {USERS[member]} ({member}){admin_mark}\n"
+        if len(members) > 50:
+            message += f"... و {len(members) - 50} نفر دیگر\n"
+    
+    await update.message.reply_text(message[:4000])
+
+async def add_user(update, context):
+    user_id = update.message.chat_id
+    
+    if not is_admin(user_id):
+        await update.message.reply_text("❌ این دستور فقط برای مدیر ربات است.")
+        return
+    
+    args = context.args
+    team = next((arg[1:] for arg in args[1:] if arg.startswith("#") and len(arg) > 1), None)
+    name = " ".join(arg for arg in args[1:] if not arg.startswith("#"))
+    if not args or not args[0].lstrip("-").isdigit() or not name:
+        await update.message.reply_text(
+            "❌ استفاده: /adduser <chat_id> <نام> [#تیم]\n\n"
+            "مثال:\n/adduser 123456789 Ali #backend"
+        )
+        return
+    
+    new_user = int(args[0])
+    team = team or team_of(new_user) or team_of(user_id) or DEFAULT_TEAM
+    await upsert_user(new_user, name, team)
+    added, removed = await reload_users()
+    await refresh_user_schedules(context.job_queue, added, removed)
+    shards.broadcast_control("reload_users")
+    
+    await update.message.reply_text(f"✅ {name} ({new_user}) در تیم #{team} ثبت شد.")
+
+async def remove_user(update, context):
+    user_id = update.message.chat_id
+    
+    if not is_admin(user_id):
+        await update.message.reply_text("❌ این دستور فقط برای مدیر ربات است.")
+        return
+    
+    if not context.args or not context.args[0].lstrip("-").isdigit():
+        await update.message.reply_text("❌ استفاده: /removeuser <chat_id>")
+        return
+    
+    target = int(context.args[0])
+    if not await deactivate_user(target):
+        await update.message.reply_text("❌ کاربری با این شناسه پیدا نشد.")
+        return
+    added, removed = await reload_users()
+    await refresh_user_schedules(context.job_queue, added, removed)
+    shards.broadcast_control("reload_users")
+    
+    await update.message.reply_text(f"🗑 کاربر {target} غیرفعال شد.")
+
+async def reload_users_command(update, context):
+    user_id = update.message.chat_id
+    
+    if not is_admin(user_id):
+        await update.message.reply_text("❌ این دستور فقط برای مدیر ربات است.")
+        return
+    
+    added, removed = await reload_users()
+    await refresh_user_schedules(context.job_queue, added, removed)
+    shards.broadcast_control("reload_users")
+    
+    await update.message.reply_text(
+        f"🔄 لیست کاربران بارگذاری شد: {len(USERS)} کاربر در {len(TEAMS)} تیم "
+        f"({len(added)} جدید، {len(removed)} حذف شده)."
+    )
+
+# Callback actions that replace the task view message immediately
+TASK_VIEW_EDITS = ("page", "complete_day_confirm", "cancel_complete", "complete_with_all", "complete_day_only")
+
 async def handle_callback(update, context):
     query = update.callback_query
     await query.answer()
@@ -202,86 +576,168 @@ async def handle_callback(update, context):
         return
 
     try:
-        action, *params = query.data.split(":")
+        action, values = callbacks.decode(query.data)
+        if action in TASK_VIEW_EDITS:
+            # The message is edited right away; a pending toggle re-render must not
+            # overwrite it
+            edits.cancel(query)
         
         if action == "toggle":
-            task_id, date = int(params[0]), params[1]
-            toggle_task_status(task_id)
-            await show_tasks_for_date(query, context, user_id, date)
+            task_id, day, page = values
+            if not await toggle_task_status(task_id) and await restore_archived_day(user_id, day_to_date(day)):
+                await toggle_task_status(task_id)
+            schedule_tasks_refresh(query, context, user_id, day_to_date(day), page)
+            
+        elif action == "page":
+            day, page = values
+            await show_tasks_for_date(query, context, user_id, day_to_date(day), page)
             
         elif action == "complete_day_confirm":
-            date = params[0]
-            await show_complete_day_confirmation(query, date)
+            day, page = values
+            await show_complete_day_confirmation(query, day_to_date(day), page)
             
         elif action == "cancel_complete":
-            date = params[0]
-            await show_tasks_for_date(query, context, user_id, date)
+            day, page = values
+            await show_tasks_for_date(query, context, user_id, day_to_date(day), page)
             
         elif action == "complete_with_all":
-            date = params[0]
-            mark_all_tasks_done(user_id, date)
-            mark_daily_completed(user_id, date)
-            total, done_count, _ = get_all_task_status(user_id, date)
+            day, page = values
+            date = day_to_date(day)
+            await mark_all_tasks_done(user_id, date)
+            await mark_daily_completed(user_id, date)
+            total, done_count, _ = await get_all_task_status(user_id, date)
             percentage = int((done_count / total) * 100) if total > 0 else 0
             
-            await show_tasks_for_date(query, context, user_id, date)
+            await show_tasks_for_date(query, context, user_id, date, page)
             await query.message.reply_text(
                 f"🎉 روز {date} با انتخاب همه تسک‌ها تکمیل شد!\n"
                 f"تعداد {done_count} از {total} تسک انجام شد ({percentage}%)."
             )
 
-            other_users = [uid for uid in USERS if uid != user_id]
-            for other_user in other_users:
-                try:
-                    await context.bot.send_message(
-                        chat_id=other_user,
-                        text=f"📢 {USERS[user_id]} روز {date} خودش رو با انتخاب همه تسک‌ها تکمیل کرد!\n"
-                             f"تعداد {done_count} از {total} تسک انجام داد ({percentage}%)."
-                    )
-                except Exception as e:
-                    logger.error(f"Error sending completion notification to {other_user}: {e}")
+            notify_other_users(
+                user_id,
+                f"📢 {USERS[user_id]} روز {date} خودش رو با انتخاب همه تسک‌ها تکمیل کرد!\n"
+                f"تعداد {done_count} از {total} تسک انجام داد ({percentage}%)."
+            )
                     
         elif action == "complete_day_only":
-            date = params[0]
-            mark_daily_completed(user_id, date)
-            total, done_count, _ = get_all_task_status(user_id, date)
+            day, page = values
+            date = day_to_date(day)
+            await mark_daily_completed(user_id, date)
+            total, done_count, _ = await get_all_task_status(user_id, date)
             percentage = int((done_count / total) * 100) if total > 0 else 0
             
-            await show_tasks_for_date(query, context, user_id, date)
+            await show_tasks_for_date(query, context, user_id, date, page)
             status_emoji = "🎉" if percentage >= 80 else "👍" if percentage >= 50 else "💪"
             await query.message.reply_text(
                 f"{status_emoji} روز {date} تکمیل شد!\n"
                 f"تعداد {done_count} از {total} تسک انجام شد ({percentage}%)."
             )
 
-            other_users = [uid for uid in USERS if uid != user_id]
-            for other_user in other_users:
-                try:
-                    await context.bot.send_message(
-                        chat_id=other_user,
-                        text=f"📢 {USERS[user_id]} روز {date} خودش رو تکمیل کرد!\n"
-                             f"تعداد {done_count} از {total} تسک انجام داد ({percentage}%)."
-                    )
-                except Exception as e:
-                    logger.error(f"Error sending completion notification to {other_user}: {e}")
+            notify_other_users(
+                user_id,
+                f"📢 {USERS[user_id]} روز {date} خودش رو تکمیل کرد!\n"
+                f"تعداد {done_count} از {total} تسک انجام داد ({percentage}%)."
+            )
                     
+        elif action == "history_older":
+            limit, day = values
+            await show_history(query, context, user_id, min(limit, HISTORY_MAX_DAYS), before=day_to_date(day))
+            
+        elif action == "history_newer":
+            limit, day = values
+            await show_history(query, context, user_id, min(limit, HISTORY_MAX_DAYS), after=day_to_date(day))
+            
+        elif action == "search_page":
+            search_id, page = values
+            text = search.saved(search_id, user_id)
+            if text is None:
+                await query.message.reply_text("⌛ این جستجو منقضی شده است. دوباره با /search جستجو کنید.")
+            else:
+                await show_search(query, context, user_id, search_id, text, page)
+            
         elif action == "completed":
             await query.answer("این روز قبلاً تکمیل شده است! 🎉")
             
     except (ValueError, IndexError) as e:
-        logger.error(f"Error parsing callback data: {query.data}, error: {e}")
+        logger.error("Error parsing callback data: %s, error: %s", query.data, e)
         await query.edit_message_text("❌ خطا در پردازش درخواست.")
         return
 
+async def profile(update, context):
+    user_id = update.message.chat_id
+    
+    if not is_admin(user_id):
+        await update.message.reply_text("❌ این دستور فقط برای مدیر ربات است.")
+        return
+    
+    if not PROFILER_ENABLED:
+        await update.message.reply_text("❌ پروفایلر غیرفعال است (PROFILER_ENABLED).")
+        return
+    
+    seconds = 10
+    if context.args:
+        try:
+            seconds = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("❌ مدت باید عدد (ثانیه) باشد.\n\nمثال:\n/profile 30")
+            return
+    seconds = max(1, min(seconds, PROFILER_MAX_SECONDS))
+    
+    await update.message.reply_text(f"⏱ نمونه‌برداری به مدت {seconds} ثانیه...")
+    stacks = await asyncio.to_thread(profiler.sample, seconds, PROFILER_INTERVAL)
+    if stacks is None:
+        await update.message.reply_text("❌ یک پروفایل دیگر در حال اجراست.")
+        return
+    
+    busy, idle = profiler.split_idle(stacks)
+    message = f"📊 پروفایل {seconds} ثانیه: {sum(busy.values())} نمونه فعال، {sum(idle.values())} نمونه بیکار\n\n"
+    for function, own, total in profiler.top_functions(busy):
+        message += f"{own} / {total}  {function}\n"
+    
+    await update.message.reply_text(message[:4000])
+    await update.message.reply_document(
+        document=profiler.collapsed(stacks).encode(),
+        filename=f"profile-{int(time.time())}.txt",
+        caption="collapsed stacks (flamegraph.pl / speedscope)",
+    )
+
 async def error_handler(update, context) -> None:
-    logger.error(f"Exception while handling an update: {context.error}")
+    logger.error("Exception while handling an update: %s", context.error)
+
+COMMANDS = [
+    ("start", start),
+    ("tasks", tasks),
+    ("today", today),
+    ("date", date_tasks),
+    ("last5", last5_days),
+    ("history", history),
+    ("month", month),
+    ("stats", stats),
+    ("search", search_command),
+    ("export", export_command),
+    ("import", import_command),
+    ("debug", debug_info),
+    ("checkdb", check_counters),
+    ("remind", remind),
+    ("users", list_users),
+    ("adduser", add_user),
+    ("removeuser", remove_user),
+    ("reloadusers", reload_users_command),
+    ("profile", profile),
+]
 
 def setup_handlers(app):
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("tasks", tasks))
-    app.add_handler(CommandHandler("today", today))
-    app.add_handler(CommandHandler("date", date_tasks))
-    app.add_handler(CommandHandler("last5", last5_days))
-    app.add_handler(CommandHandler("debug", debug_info))
-    app.add_handler(CallbackQueryHandler(handle_callback))
+    # Every handler is timed into bot_handler_seconds (see metrics.py); button taps
+    # are also broken down by callback action
+    for command, callback in COMMANDS:
+        app.add_handler(CommandHandler(command, metrics.instrument(command, callback)))
+    # A file sent with the caption /import
+    app.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r"^/import(@\w+)?(\s|$)"),
+        metrics.instrument("import", import_command)
+    ))
+    app.add_handler(CallbackQueryHandler(
+        metrics.instrument("callback", handle_callback, action_of=metrics.callback_action)
+    ))
     app.add_error_handler(error_handler)
\ No newline at end of file
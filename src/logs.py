@@ -0,0 +1,116 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from .config import (LOG_LEVEL, LOG_LEVELS, LOG_FILE, LOG_JSON, LOG_MAX_BYTES, LOG_ROTATE_WHEN,
+                     LOG_BACKUP_COUNT)
+
+# Logging calls only put records on a queue; a QueueListener thread formats them
+# and writes to the console and the rotating log file, so no formatting or disk
+# I/O happens on the event loop or the database threads. Records below a logger's
+# level are dropped at the call site before their %-arguments are ever formatted.
+#
+# In sharded mode the dispatcher's listener reads a multiprocessing queue that the
+# workers log to as well (share_with_processes), so one process owns the file and
+# its rotation.
+
+TEXT_FORMAT = '%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    # The listener runs in this process, so the record can be queued as is and
+    # formatted there (the stock prepare() formats it in the calling thread)
+    def prepare(self, record):
+        return record
+
+def _output_handlers():
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        os.makedirs(os.path.dirname(LOG_FILE) or ".", exist_ok=True)
+        if LOG_ROTATE_WHEN:
+            handlers.append(logging.handlers.TimedRotatingFileHandler(
+                LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+            ))
+        else:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+            ))
+    formatter = JsonFormatter() if LOG_JSON else logging.Formatter(TEXT_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+def parse_levels(spec):
+    # "name=LEVEL,name=LEVEL" -> [(name, level)]
+    levels = []
+    for item in spec.replace(" ", "").split(","):
+        if item:
+            name, _, level = item.partition("=")
+            levels.append((name, level.upper()))
+    return levels
+
+def _install(handler):
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    if handler is not None:
+        root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in parse_levels(LOG_LEVELS):
+        logging.getLogger(name).setLevel(level)
+
+def setup_logging(log_queue=None):
+    # log_queue: in a sharded worker, the queue returned by share_with_processes
+    # in the dispatcher; the worker then only enqueues
+    global _listener
+    if log_queue is not None:
+        _install(logging.handlers.QueueHandler(log_queue))
+        return
+    stop_logging()
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, *_output_handlers(), respect_handler_level=True)
+    _install(_LocalQueueHandler(records))
+    _listener.start()
+
+def share_with_processes(context):
+    # Moves the listener onto a queue of the given multiprocessing context and
+    # returns it for the child processes; None when logging was not set up
+    global _listener
+    if _listener is None:
+        return None
+    handlers = _listener.handlers
+    _listener.stop()
+    records = context.Queue()
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _install(logging.handlers.QueueHandler(records))
+    _listener.start()
+    return records
+
+@atexit.register
+def stop_logging():
+    # Writes out everything still queued; later records go to Python's last-resort
+    # stderr handler
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _install(None)
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
@@ -1,32 +1,100 @@
-import os
+import logging
 from telegram.ext import Application
-from .config import BOT_TOKEN, USERS, logger
+from .config import (BOT_TOKEN, USERS, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT,
+                     WEBHOOK_PATH, WEBHOOK_SECRET, UPDATE_CONCURRENCY, SHARD_COUNT, BOT_API_BASE_URL)
 from .database import init_database
+from .users import load_users
+from .async_database import shutdown_database, start_write_behind
 from .handlers import setup_handlers
 from .scheduler import setup_scheduler
+from .archive import setup_archive
 from .notifications import set_bot_commands
+from .update_processor import PerChatUpdateProcessor
+from .shard_runner import run_sharded
+from .logs import setup_logging
+from . import broadcast, metrics, shards, toggle_buffer, edits, scheduler, async_database
+
+logger = logging.getLogger(__name__)
+
+def queue_depths(application):
+    return {
+        "updates": application.update_queue.qsize(),
+        "broadcast": broadcast.stats()["pending"],
+        "toggles": toggle_buffer.pending_count(),
+        "edits": edits.pending_count(),
+        **async_database.queue_depths(),
+    }
+
+async def on_startup(application):
+    await broadcast.start(application)
+    await start_write_behind(application)
+    metrics.gauge("bot_queue_depth", "Items waiting in internal queues", "queue", lambda: queue_depths(application))
+    metrics.gauge("bot_reminders_scheduled", "Users with a pending reminder", "kind",
+                  scheduler.scheduled_counts)
+    await metrics.start_server(shards.shard_index() or 0)
+
+async def on_stop(application):
+    await metrics.stop_server()
+    await broadcast.stop(application)
+
+def build_application(updater=True):
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(PerChatUpdateProcessor(UPDATE_CONCURRENCY))
+        .request(metrics.InstrumentedRequest(connection_pool_size=256))
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(shutdown_database)
+    )
+    if BOT_API_BASE_URL:
+        builder.base_url(BOT_API_BASE_URL)
+    if not updater:
+        builder.updater(None)
+    app = builder.build()
+    setup_handlers(app)
+    return app
 
 def main():
+    setup_logging()
     if not BOT_TOKEN:
         logger.error("Please set BOT_TOKEN environment variable!")
         return
     
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        # Without it anyone who finds the port can post updates as any user
+        logger.error("Webhook mode needs WEBHOOK_SECRET (letters, digits, _ and -)")
+        return
+    
+    init_database()
+    load_users()
+
     if not USERS:
         logger.error("No users configured! Please set USER1_ID, USER1_NAME, etc. environment variables")
         return
 
-    logger.info(f"Loaded {len(USERS)} users: {list(USERS.values())}")
-
-    os.makedirs('/app/logs', exist_ok=True)
-    init_database()
+    if SHARD_COUNT > 1:
+        run_sharded(SHARD_COUNT, build_application)
+        return
 
-    app = Application.builder().token(BOT_TOKEN).build()
-    setup_handlers(app)
+    app = build_application()
     app.job_queue.run_once(set_bot_commands, when=1)
     setup_scheduler(app)
+    setup_archive(app)
 
-    logger.info(f"Starting bot with {len(USERS)} configured users...")
-    app.run_polling(drop_pending_updates=True)
+    logger.info("Starting bot with %s configured users...", len(USERS))
+    if WEBHOOK_URL:
+        logger.info("Serving webhook on %s:%s/%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            drop_pending_updates=True,
+        )
+    else:
+        app.run_polling(drop_pending_updates=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
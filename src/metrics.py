@@ -0,0 +1,216 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from telegram.request import HTTPXRequest
+from .config import METRICS_PORT, METRICS_LISTEN
+from . import callbacks
+
+logger = logging.getLogger(__name__)
+
+# In-process metrics in the Prometheus text format, served on METRICS_LISTEN:METRICS_PORT
+# at /metrics when the port is set. Counters and histograms are updated from the
+# event loop and the database threads, so they share one lock; gauges are read
+# when scraped. Each sharded worker serves its own metrics on METRICS_PORT + index.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_metrics = []
+_gauges = []
+_server = None
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, labels
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with _lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.label_names, self.buckets = name, help, labels, buckets
+        # labels -> [count per bucket (not cumulative), ..., count above the last, sum]
+        self._values = {}
+        _metrics.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with _lock:
+            values = [(labels, list(entry)) for labels, entry in self._values.items()]
+        for labels, entry in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), entry):
+                cumulative += count
+                bucket_labels = _labels(self.label_names, labels, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {entry[-1]}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+def gauge(name, help, label, read):
+    # read() returns {label value: number}, evaluated on every scrape
+    _gauges.append((name, help, label, read))
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for name, help, label, read in _gauges:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        try:
+            values = read()
+        except Exception as e:
+            logger.error("Could not read gauge %s: %s", name, e)
+            continue
+        for value_label, value in values.items():
+            lines.append(f"{name}{_labels((label,), (value_label,))} {value}")
+    return "\n".join(lines) + "\n"
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Time spent in update handlers", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Update handlers that raised", ("handler",))
+CALLBACK_SECONDS = Histogram("bot_callback_seconds", "Time spent per inline button action", ("action",))
+DB_SECONDS = Histogram("bot_db_seconds", "Time spent running database.py functions", ("function", "kind"))
+DB_ROWS = Counter("bot_db_rows_total", "Rows returned by database.py functions", ("function",))
+API_SECONDS = Histogram("bot_telegram_api_seconds", "Bot API request latency", ("method",))
+API_ERRORS = Counter("bot_telegram_api_errors_total", "Failed Bot API requests", ("method", "reason"))
+JOB_SECONDS = Histogram("bot_job_seconds", "Duration of scheduled and background jobs", ("job",))
+
+def instrument(name, callback, action_of=None):
+    # Wraps a PTB handler callback; action_of(update) labels bot_callback_seconds
+    @functools.wraps(callback)
+    async def timed(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            HANDLER_SECONDS.observe(elapsed, name)
+            if action_of is not None:
+                CALLBACK_SECONDS.observe(elapsed, action_of(update))
+    return timed
+
+def callback_action(update):
+    try:
+        return callbacks.decode(update.callback_query.data)[0]
+    except (ValueError, AttributeError, TypeError):
+        return "invalid"
+
+def timed_job(name):
+    def decorate(func):
+        @functools.wraps(func)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                JOB_SECONDS.observe(time.perf_counter() - start, name)
+        return timed
+    return decorate
+
+def _row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])
+    return None
+
+def timed_call(func, kind):
+    # Wraps a database function for the executor threads, so the time measured is
+    # the time the query ran, not the time it waited for a thread
+    name = getattr(func, "__name__", "call")
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - start, name, kind)
+        rows = _row_count(result)
+        if rows:
+            DB_ROWS.inc(name, amount=rows)
+        return result
+    return timed
+
+class InstrumentedRequest(HTTPXRequest):
+    # Every Bot API call of an Application goes through do_request
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            status, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception as e:
+            API_ERRORS.inc(endpoint, type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, endpoint)
+        if status >= 400:
+            API_ERRORS.inc(endpoint, str(status))
+        return status, payload
+
+async def _serve(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def start_server(port_offset=0):
+    global _server
+    if not METRICS_PORT or _server is not None:
+        return
+    port = METRICS_PORT + port_offset
+    _server = await asyncio.start_server(_serve, METRICS_LISTEN, port)
+    logger.info("Serving metrics on %s:%s/metrics", METRICS_LISTEN, port)
+
+async def stop_server(application=None):
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
@@ -0,0 +1,482 @@
+import logging
+from .dates import date_to_day
+from . import search
+
+logger = logging.getLogger(__name__)
+
+# Recomputes daily_entries.total_tasks/done_tasks from all_tasks (hot and archived
+# tasks, see migration 10). Used by the consistency repair in database.py.
+REBUILD_DAILY_COUNTERS = [
+    '''
+    INSERT INTO daily_entries (user_id, date, day, total_tasks, done_tasks)
+    SELECT user_id, MIN(date), day, COUNT(*), COALESCE(SUM(is_done), 0)
+    FROM all_tasks
+    WHERE true
+    GROUP BY user_id, day
+    ON CONFLICT(user_id, day) DO UPDATE SET
+        total_tasks = excluded.total_tasks,
+        done_tasks = excluded.done_tasks
+    ''',
+    '''
+    UPDATE daily_entries SET total_tasks = 0, done_tasks = 0
+    WHERE (total_tasks != 0 OR done_tasks != 0)
+      AND NOT EXISTS (
+          SELECT 1 FROM all_tasks t WHERE t.user_id = daily_entries.user_id AND t.day = daily_entries.day
+      )
+    ''',
+]
+
+# The same rebuild keyed by the text date, as shipped in migration 3 (before the
+# day column existed)
+_REBUILD_DAILY_COUNTERS_BY_DATE = [
+    '''
+    INSERT INTO daily_entries (user_id, date, total_tasks, done_tasks)
+    SELECT user_id, date, COUNT(*), COALESCE(SUM(is_done), 0)
+    FROM tasks
+    WHERE true
+    GROUP BY user_id, date
+    ON CONFLICT(user_id, date) DO UPDATE SET
+        total_tasks = excluded.total_tasks,
+        done_tasks = excluded.done_tasks
+    ''',
+    '''
+    UPDATE daily_entries SET total_tasks = 0, done_tasks = 0
+    WHERE (total_tasks != 0 OR done_tasks != 0)
+      AND NOT EXISTS (
+          SELECT 1 FROM tasks t WHERE t.user_id = daily_entries.user_id AND t.date = daily_entries.date
+      )
+    ''',
+]
+
+def _day_or_none(date):
+    try:
+        return date_to_day(date)
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+def _backfill_days(conn):
+    conn.create_function("jalali_day", 1, _day_or_none, deterministic=True)
+    conn.execute('UPDATE tasks SET day = jalali_day(date)')
+    conn.execute('UPDATE daily_entries SET day = jalali_day(date)')
+    unparsed = conn.execute(
+        'SELECT (SELECT COUNT(*) FROM tasks WHERE day IS NULL) + (SELECT COUNT(*) FROM daily_entries WHERE day IS NULL)'
+    ).fetchone()[0]
+    if unparsed:
+        logger.warning("%s row(s) have an unparseable date and no day number", unparsed)
+
+# Rollups for /stats, kept by triggers on daily_entries (which the tasks triggers
+# keep current), so reading a user's stats never touches their tasks rows.
+# stats_weekly/stats_monthly hold per-period sums keyed by the week's Saturday
+# (day number) and the Jalali "YYYY-MM" prefix of the date; stats_streaks holds
+# one row per run of consecutive completed days. A daily_entries row never changes
+# its day, so updates apply as deltas to the same period rows.
+
+def _rollup_upserts(row, total, done, active, completed):
+    # The four deltas are SQL expressions; `row` is NEW or OLD and supplies the keys
+    return [
+        f'''
+            INSERT INTO stats_{table} (user_id, {column}, total_tasks, done_tasks, active_days, completed_days)
+            VALUES ({row}.user_id, {key}, {total}, {done}, {active}, {completed})
+            ON CONFLICT(user_id, {column}) DO UPDATE SET
+                total_tasks = total_tasks + excluded.total_tasks,
+                done_tasks = done_tasks + excluded.done_tasks,
+                active_days = active_days + excluded.active_days,
+                completed_days = completed_days + excluded.completed_days;
+        '''
+        for table, column, key in (
+            ("weekly", "week_start", f"{row}.day - ({row}.day - 6) % 7"),
+            ("monthly", "month", f"substr({row}.date, 1, 7)"),
+        )
+    ]
+
+def _streak_add(row):
+    # Day completed: extend the run ending the day before (or start one), then
+    # absorb the run starting the day after
+    return f'''
+            UPDATE stats_streaks SET last_day = {row}.day
+            WHERE user_id = {row}.user_id AND last_day = {row}.day - 1;
+            INSERT INTO stats_streaks (user_id, first_day, last_day)
+            SELECT {row}.user_id, {row}.day, {row}.day
+            WHERE NOT EXISTS (SELECT 1 FROM stats_streaks WHERE user_id = {row}.user_id AND last_day = {row}.day);
+            UPDATE stats_streaks SET last_day = (
+                SELECT s.last_day FROM stats_streaks s WHERE s.user_id = {row}.user_id AND s.first_day = {row}.day + 1
+            )
+            WHERE user_id = {row}.user_id AND last_day = {row}.day
+              AND EXISTS (SELECT 1 FROM stats_streaks s WHERE s.user_id = {row}.user_id AND s.first_day = {row}.day + 1);
+            DELETE FROM stats_streaks WHERE user_id = {row}.user_id AND first_day = {row}.day + 1;
+    '''
+
+def _streak_remove(row):
+    # Day no longer completed: split the run containing it
+    containing = (
+        f"(SELECT MAX(s.first_day) FROM stats_streaks s WHERE s.user_id = {row}.user_id AND s.first_day <= {row}.day)"
+    )
+    return f'''
+            INSERT INTO stats_streaks (user_id, first_day, last_day)
+            SELECT user_id, {row}.day + 1, last_day FROM stats_streaks
+            WHERE user_id = {row}.user_id AND first_day = {containing} AND last_day > {row}.day;
+            DELETE FROM stats_streaks WHERE user_id = {row}.user_id AND first_day = {row}.day;
+            UPDATE stats_streaks SET last_day = {row}.day - 1
+            WHERE user_id = {row}.user_id AND first_day = {containing} AND last_day >= {row}.day;
+    '''
+
+def _trigger(name, event, when, statements):
+    return f"CREATE TRIGGER {name} {event} ON daily_entries WHEN {when}\nBEGIN\n{''.join(statements)}\nEND"
+
+_ACTIVE = "(COALESCE({row}.total_tasks, 0) > 0)"
+_COMPLETED = "(COALESCE({row}.is_completed, 0) = 1)"
+
+STATS_TRIGGERS = [
+    _trigger(
+        "trg_stats_insert", "AFTER INSERT", "NEW.day IS NOT NULL",
+        _rollup_upserts(
+            "NEW", "COALESCE(NEW.total_tasks, 0)", "COALESCE(NEW.done_tasks, 0)",
+            _ACTIVE.format(row="NEW"), _COMPLETED.format(row="NEW"),
+        ),
+    ),
+    _trigger(
+        "trg_stats_delete", "AFTER DELETE", "OLD.day IS NOT NULL",
+        _rollup_upserts(
+            "OLD", "-COALESCE(OLD.total_tasks, 0)", "-COALESCE(OLD.done_tasks, 0)",
+            "-" + _ACTIVE.format(row="OLD"), "-" + _COMPLETED.format(row="OLD"),
+        ),
+    ),
+    _trigger(
+        "trg_stats_update", "AFTER UPDATE OF total_tasks, done_tasks, is_completed", "NEW.day IS NOT NULL",
+        _rollup_upserts(
+            "NEW", "COALESCE(NEW.total_tasks, 0) - COALESCE(OLD.total_tasks, 0)",
+            "COALESCE(NEW.done_tasks, 0) - COALESCE(OLD.done_tasks, 0)",
+            _ACTIVE.format(row="NEW") + " - " + _ACTIVE.format(row="OLD"),
+            _COMPLETED.format(row="NEW") + " - " + _COMPLETED.format(row="OLD"),
+        ),
+    ),
+    _trigger("trg_streaks_insert", "AFTER INSERT", f"NEW.day IS NOT NULL AND {_COMPLETED.format(row='NEW')}",
+             [_streak_add("NEW")]),
+    _trigger("trg_streaks_delete", "AFTER DELETE", f"OLD.day IS NOT NULL AND {_COMPLETED.format(row='OLD')}",
+             [_streak_remove("OLD")]),
+    _trigger("trg_streaks_complete", "AFTER UPDATE OF is_completed",
+             f"NEW.day IS NOT NULL AND {_COMPLETED.format(row='NEW')} AND NOT {_COMPLETED.format(row='OLD')}",
+             [_streak_add("NEW")]),
+    _trigger("trg_streaks_uncomplete", "AFTER UPDATE OF is_completed",
+             f"NEW.day IS NOT NULL AND {_COMPLETED.format(row='OLD')} AND NOT {_COMPLETED.format(row='NEW')}",
+             [_streak_remove("NEW")]),
+]
+
+# Recomputes all rollups from daily_entries (the migration backfill; also a manual
+# repair if the rollups are ever suspected to drift)
+REBUILD_STATS = [
+    'DELETE FROM stats_weekly',
+    'DELETE FROM stats_monthly',
+    'DELETE FROM stats_streaks',
+    '''
+    INSERT INTO stats_weekly (user_id, week_start, total_tasks, done_tasks, active_days, completed_days)
+    SELECT user_id, day - (day - 6) % 7, SUM(COALESCE(total_tasks, 0)), SUM(COALESCE(done_tasks, 0)),
+           SUM(COALESCE(total_tasks, 0) > 0), SUM(COALESCE(is_completed, 0) = 1)
+    FROM daily_entries
+    WHERE day IS NOT NULL
+    GROUP BY 1, 2
+    ''',
+    '''
+    INSERT INTO stats_monthly (user_id, month, total_tasks, done_tasks, active_days, completed_days)
+    SELECT user_id, substr(date, 1, 7), SUM(COALESCE(total_tasks, 0)), SUM(COALESCE(done_tasks, 0)),
+           SUM(COALESCE(total_tasks, 0) > 0), SUM(COALESCE(is_completed, 0) = 1)
+    FROM daily_entries
+    WHERE day IS NOT NULL
+    GROUP BY 1, 2
+    ''',
+    '''
+    INSERT INTO stats_streaks (user_id, first_day, last_day)
+    SELECT user_id, MIN(day), MAX(day)
+    FROM (
+        SELECT user_id, day, day - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day) AS run
+        FROM daily_entries
+        WHERE day IS NOT NULL AND COALESCE(is_completed, 0) = 1
+    )
+    GROUP BY user_id, run
+    ''',
+]
+
+# tasks_fts (see search.py) is contentless, so a row can only be removed by
+# repeating the values it was indexed with; both come from the tasks row.
+_SEARCH_VALUES = "{row}.id, 'u' || {row}.user_id, search_normalize(COALESCE({row}.task_text, ''))"
+
+SEARCH_TRIGGERS = [
+    f'''
+    CREATE TRIGGER trg_tasks_search_insert AFTER INSERT ON tasks
+    BEGIN
+        INSERT INTO tasks_fts (rowid, owner, body) VALUES ({_SEARCH_VALUES.format(row="NEW")});
+    END
+    ''',
+    f'''
+    CREATE TRIGGER trg_tasks_search_delete AFTER DELETE ON tasks
+    BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, owner, body) VALUES ('delete', {_SEARCH_VALUES.format(row="OLD")});
+    END
+    ''',
+    f'''
+    CREATE TRIGGER trg_tasks_search_update AFTER UPDATE OF task_text, user_id ON tasks
+    BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, owner, body) VALUES ('delete', {_SEARCH_VALUES.format(row="OLD")});
+        INSERT INTO tasks_fts (rowid, owner, body) VALUES ({_SEARCH_VALUES.format(row="NEW")});
+    END
+    ''',
+]
+
+# Indexes every task in the tasks table (the migration backfill)
+REBUILD_SEARCH = [
+    "INSERT INTO tasks_fts (tasks_fts) VALUES ('delete-all')",
+    f"INSERT INTO tasks_fts (rowid, owner, body) SELECT {_SEARCH_VALUES.format(row='tasks')} FROM tasks",
+    "INSERT INTO tasks_fts (tasks_fts) VALUES ('optimize')",
+]
+
+# Each entry upgrades the schema by one version. The index of an entry plus one is
+# the version it produces, which is stored in PRAGMA user_version. Entries are
+# lists of SQL statements or callables taking the connection. Never edit an entry
+# that has shipped; append a new one instead.
+MIGRATIONS = [
+    # 1: original schema (no-op on databases created before migrations existed)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            date TEXT,
+            task_text TEXT,
+            is_done INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS daily_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            date TEXT,
+            total_tasks INTEGER,
+            is_completed INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, date)
+        )
+        ''',
+    ],
+    # 2: covering index for the per-user/per-day task queries; daily_entries lookups
+    # are already served by its UNIQUE(user_id, date) index
+    [
+        'CREATE INDEX IF NOT EXISTS idx_tasks_user_date_done ON tasks (user_id, date, is_done)',
+    ],
+    # 3: per-day counters kept in daily_entries by triggers, so status reads are one row
+    [
+        'ALTER TABLE daily_entries ADD COLUMN done_tasks INTEGER DEFAULT 0',
+        *_REBUILD_DAILY_COUNTERS_BY_DATE,
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_counters_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT INTO daily_entries (user_id, date, total_tasks, done_tasks)
+            VALUES (NEW.user_id, NEW.date, 1, COALESCE(NEW.is_done, 0))
+            ON CONFLICT(user_id, date) DO UPDATE SET
+                total_tasks = total_tasks + 1,
+                done_tasks = done_tasks + excluded.done_tasks;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_counters_delete AFTER DELETE ON tasks
+        BEGIN
+            UPDATE daily_entries SET
+                total_tasks = total_tasks - 1,
+                done_tasks = done_tasks - COALESCE(OLD.is_done, 0)
+            WHERE user_id = OLD.user_id AND date = OLD.date;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_counters_update AFTER UPDATE OF is_done ON tasks
+        WHEN COALESCE(OLD.is_done, 0) != COALESCE(NEW.is_done, 0)
+        BEGIN
+            UPDATE daily_entries SET
+                done_tasks = done_tasks + COALESCE(NEW.is_done, 0) - COALESCE(OLD.is_done, 0)
+            WHERE user_id = NEW.user_id AND date = NEW.date;
+        END
+        ''',
+    ],
+    # 4: explicit display order so edited task lists can keep their rows
+    [
+        'ALTER TABLE tasks ADD COLUMN position INTEGER DEFAULT 0',
+        '''
+        UPDATE tasks SET position = (
+            SELECT COUNT(*) FROM tasks t
+            WHERE t.user_id = tasks.user_id AND t.date = tasks.date AND t.id < tasks.id
+        )
+        ''',
+    ],
+    # 5: per-user reminder times; NULL means the configured default, 'off' disables
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS reminder_settings (
+            user_id INTEGER PRIMARY KEY,
+            task_time TEXT,
+            sleep_time TEXT,
+            timezone TEXT
+        )
+        ''',
+    ],
+    # 6: user registry with team membership (previously only USERn_ID env vars)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            team TEXT NOT NULL DEFAULT 'default',
+            is_admin INTEGER NOT NULL DEFAULT 0,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ],
+    # 7: integer day numbers (dates.date_to_day) next to the display strings; every
+    # lookup, range scan and ordering now goes through the day column
+    [
+        'ALTER TABLE tasks ADD COLUMN day INTEGER',
+        'ALTER TABLE daily_entries ADD COLUMN day INTEGER',
+        _backfill_days,
+        'DROP INDEX IF EXISTS idx_tasks_user_date_done',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_user_day_done ON tasks (user_id, day, is_done)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_daily_entries_user_day ON daily_entries (user_id, day)',
+        'DROP TRIGGER IF EXISTS trg_tasks_counters_insert',
+        'DROP TRIGGER IF EXISTS trg_tasks_counters_delete',
+        'DROP TRIGGER IF EXISTS trg_tasks_counters_update',
+        '''
+        CREATE TRIGGER trg_tasks_require_day BEFORE INSERT ON tasks
+        WHEN NEW.day IS NULL
+        BEGIN
+            SELECT RAISE(ABORT, 'tasks.day is required');
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_tasks_counters_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT INTO daily_entries (user_id, date, day, total_tasks, done_tasks)
+            VALUES (NEW.user_id, NEW.date, NEW.day, 1, COALESCE(NEW.is_done, 0))
+            ON CONFLICT(user_id, day) DO UPDATE SET
+                total_tasks = total_tasks + 1,
+                done_tasks = done_tasks + excluded.done_tasks;
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_tasks_counters_delete AFTER DELETE ON tasks
+        BEGIN
+            UPDATE daily_entries SET
+                total_tasks = total_tasks - 1,
+                done_tasks = done_tasks - COALESCE(OLD.is_done, 0)
+            WHERE user_id = OLD.user_id AND day = OLD.day;
+        END
+        ''',
+        '''
+        CREATE TRIGGER trg_tasks_counters_update AFTER UPDATE OF is_done ON tasks
+        WHEN COALESCE(OLD.is_done, 0) != COALESCE(NEW.is_done, 0)
+        BEGIN
+            UPDATE daily_entries SET
+                done_tasks = done_tasks + COALESCE(NEW.is_done, 0) - COALESCE(OLD.is_done, 0)
+            WHERE user_id = NEW.user_id AND day = NEW.day;
+        END
+        ''',
+    ],
+    # 8: /stats rollups (see STATS_TRIGGERS)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS stats_weekly (
+            user_id INTEGER NOT NULL,
+            week_start INTEGER NOT NULL,
+            total_tasks INTEGER NOT NULL DEFAULT 0,
+            done_tasks INTEGER NOT NULL DEFAULT 0,
+            active_days INTEGER NOT NULL DEFAULT 0,
+            completed_days INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, week_start)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS stats_monthly (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            total_tasks INTEGER NOT NULL DEFAULT 0,
+            done_tasks INTEGER NOT NULL DEFAULT 0,
+            active_days INTEGER NOT NULL DEFAULT 0,
+            completed_days INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS stats_streaks (
+            user_id INTEGER NOT NULL,
+            first_day INTEGER NOT NULL,
+            last_day INTEGER NOT NULL,
+            PRIMARY KEY (user_id, first_day)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_stats_streaks_user_last ON stats_streaks (user_id, last_day)',
+        # Longest streak is MAX() over this index instead of a scan of the user's runs
+        'CREATE INDEX IF NOT EXISTS idx_stats_streaks_user_length ON stats_streaks (user_id, last_day - first_day)',
+        *REBUILD_STATS,
+        *STATS_TRIGGERS,
+    ],
+    # 9: full-text index for /search (see search.py)
+    [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            owner, body, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        *REBUILD_SEARCH,
+        *SEARCH_TRIGGERS,
+    ],
+    # 10: archive of old completed days, one row per day (see database.archive_days),
+    # and all_tasks for queries that must see both tiers
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS tasks_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            tasks TEXT NOT NULL,
+            UNIQUE (user_id, day)
+        )
+        ''',
+        '''
+        CREATE VIEW IF NOT EXISTS all_tasks (id, user_id, date, day, task_text, is_done, position) AS
+        SELECT id, user_id, date, day, task_text, is_done, position FROM tasks
+        UNION ALL
+        SELECT t.value ->> 0, a.user_id, a.date, a.day, t.value ->> 1, t.value ->> 2, t.key
+        FROM tasks_archive a, json_each(a.tasks) t
+        ''',
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    # The tasks triggers from migration 9 on call search_normalize
+    search.register(conn)
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this bot supports ({SCHEMA_VERSION})"
+        )
+
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        logger.info("Applying database migration %s", number)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for step in MIGRATIONS[number - 1]:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error("Database migration %s failed, schema left at version %s", number, number - 1)
+            raise
+
+    return SCHEMA_VERSION
@@ -1,44 +1,39 @@
+import logging
 from telegram import BotCommand
-import jdatetime
-from .config import logger, USERS, SLEEP_REMINDER_URL
-from .database import has_tasks_for_date
+from .config import USERS, SLEEP_REMINDER_URL, REMINDER_CHUNK_SIZE
+from .async_database import iter_users_without_tasks
+from .users import team_members
+from . import broadcast, metrics
 
-async def notify_task_entry(context, user_id, date, task_count):
-    other_users = [uid for uid in USERS if uid != user_id]
-    for other_user in other_users:
-        try:
-            await context.bot.send_message(
-                chat_id=other_user,
-                text=f"📝 {USERS[user_id]} برای تاریخ {date} تعداد {task_count} تسک ثبت کرد."
-            )
-        except Exception as e:
-            logger.error(f"Error sending task entry notification to {other_user}: {e}")
+logger = logging.getLogger(__name__)
 
-async def send_daily_task_reminder(context):
-    today = jdatetime.date.today().strftime("%Y-%m-%d")
-    
-    for user_id in USERS:
-        if not has_tasks_for_date(user_id, today):
-            try:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=f"⏰ صبح بخیر {USERS[user_id]}!\n\n"
-                         f"هنوز تسک‌های امروزت رو وارد نکردی. "
-                         f"لطفاً با دستور /tasks تسک‌هات رو ثبت کن."
-                )
-            except Exception as e:
-                logger.error(f"Error sending daily reminder to {user_id}: {e}")
+def notify_other_users(user_id, text):
+    for other_user in team_members(user_id):
+        if other_user != user_id:
+            broadcast.enqueue(other_user, text)
 
-async def send_sleep_reminder(context):
-    for user_id in USERS:
-        try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=f"😴 {USERS[user_id]} عزیز، وقت ثبت ساعات خوابت رسیده!\n\n{SLEEP_REMINDER_URL}"
+async def notify_task_entry(context, user_id, date, task_count):
+    notify_other_users(user_id, f"📝 {USERS[user_id]} برای تاریخ {date} تعداد {task_count} تسک ثبت کرد.")
+
+async def send_task_reminders(user_ids, date):
+    sent = 0
+    async for chunk in iter_users_without_tasks(user_ids, date, REMINDER_CHUNK_SIZE):
+        for user_id in chunk:
+            broadcast.enqueue(
+                user_id,
+                f"⏰ صبح بخیر {USERS[user_id]}!\n\n"
+                f"هنوز تسک‌های امروزت رو وارد نکردی. "
+                f"لطفاً با دستور /tasks تسک‌هات رو ثبت کن."
             )
-        except Exception as e:
-            logger.error(f"Error sending sleep reminder to {user_id}: {e}")
+        sent += len(chunk)
+    return sent
+
+def send_sleep_reminders(user_ids):
+    for user_id in user_ids:
+        broadcast.enqueue(user_id, f"😴 {USERS[user_id]} عزیز، وقت ثبت ساعات خوابت رسیده!\n\n{SLEEP_REMINDER_URL}")
+    return len(user_ids)
 
+@metrics.timed_job("set_bot_commands")
 async def set_bot_commands(application):
     commands = [
         BotCommand("start", "شروع و راهنما"),
@@ -46,6 +41,14 @@ async def set_bot_commands(application):
         BotCommand("today", "نمایش تسک‌های امروز"),
         BotCommand("date", "نمایش تسک‌های روز مشخص"),
         BotCommand("last5", "نمایش 5 روز گذشته"),
+        BotCommand("history", "تاریخچه روزها با صفحه‌بندی"),
+        BotCommand("month", "گزارش ماه جاری یا ماه مشخص"),
+        BotCommand("stats", "آمار، رکورد و جدول تیم"),
+        BotCommand("search", "جستجو در تسک‌های گذشته"),
+        BotCommand("export", "دریافت فایل تاریخچه"),
+        BotCommand("import", "بازگرداندن تاریخچه از فایل"),
+        BotCommand("remind", "تنظیم ساعت یادآوری‌ها"),
+        BotCommand("users", "اعضای تیم"),
     ]
     
     await application.bot.set_my_commands(commands)
\ No newline at end of file
@@ -0,0 +1,79 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+# Sampling profiler behind the admin /profile command (enabled by PROFILER_ENABLED).
+# A thread records the stack of every other thread every `interval` seconds; a
+# function's share of the samples approximates its share of wall time, including
+# the event loop. Nothing is instrumented, so the bot runs at full speed between
+# samples. Results are collapsed stacks ("outer;inner;leaf count"), the input
+# format of flamegraph.pl and speedscope.
+
+# Leaf frames of threads that are waiting for work rather than running: the event
+# loop's select and the idle executor and log listener threads
+IDLE_FUNCTIONS = {
+    "selectors.select",
+    "threading.wait",
+    "concurrent.futures.thread._worker",
+    "logging.handlers.dequeue",
+}
+
+_running = threading.Lock()
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{code.co_name}:{frame.f_lineno}"
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+def sample(seconds, interval):
+    # Blocks for `seconds`; returns a Counter of collapsed stacks, or None when a
+    # profile is already being taken
+    if not _running.acquire(blocking=False):
+        return None
+    try:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    stacks[f"{names.get(ident, ident)};{_stack(frame)}"] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _running.release()
+
+def _leaf(stack):
+    return stack.rsplit(";", 1)[-1].rsplit(":", 1)[0]
+
+def split_idle(stacks):
+    # (busy, idle) Counters, by the leaf frame of each stack
+    busy, idle = Counter(), Counter()
+    for stack, count in stacks.items():
+        (idle if _leaf(stack) in IDLE_FUNCTIONS else busy)[stack] += count
+    return busy, idle
+
+def top_functions(stacks, limit=15):
+    # [(function, leaf samples, samples anywhere on the stack)] by leaf samples.
+    # The first element of every stack is the thread name, not a function.
+    leaf, inclusive = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]
+        if frames:
+            leaf[frames[-1].rsplit(":", 1)[0]] += count
+        for function in {frame.rsplit(":", 1)[0] for frame in frames}:
+            inclusive[function] += count
+    return [(function, count, inclusive[function]) for function, count in leaf.most_common(limit)]
+
+def collapsed(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
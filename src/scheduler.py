@@ -1,22 +1,160 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-from datetime import time
-from pytz import timezone
-from .notifications import send_daily_task_reminder, send_sleep_reminder
+import heapq
+import logging
+import re
+import time as clock
+from datetime import datetime, time, timedelta
+from apscheduler.jobstores.base import JobLookupError
+from pytz import timezone, utc
+from .config import (USERS, DEFAULT_TIMEZONE, DEFAULT_TASK_REMINDER_TIME,
+                     DEFAULT_SLEEP_REMINDER_TIME)
+from .database import get_reminder_settings
+from . import async_database, metrics
+from .shards import owns_user
+from .dates import day_to_date
+from .notifications import send_task_reminders, send_sleep_reminders
 
-scheduler = AsyncIOScheduler(timezone=timezone('Asia/Tehran'))
+logger = logging.getLogger(__name__)
 
-def setup_scheduler(app):
-    iran_tz = timezone('Asia/Tehran')
-    
-    app.job_queue.run_daily(
-        send_daily_task_reminder,
-        time=time(hour=9, minute=0, tzinfo=iran_tz),
-        name="daily_task_reminder"
+# All per-user reminders live in one min-heap of (fire_at, user_id, kind) and a
+# single job-queue job is armed for the earliest entry. Changing a user's schedule
+# pushes a new entry; the old one stays in the heap and is skipped when popped
+# because it no longer matches _due. Each user fires at a fixed second within the
+# minute (derived from the id) so a popular time is spread over the minute.
+
+TASK_REMINDER = "task"
+SLEEP_REMINDER = "sleep"
+TIME_PATTERN = re.compile(r'^([01]?\d|2[0-3]):([0-5]\d)$')
+DISPATCH_SLACK = 0.5
+
+_heap = []
+_due = {}
+_settings = {}
+_job = None
+_job_at = None
+
+def parse_time(value):
+    match = TIME_PATTERN.match(value or "")
+    if not match:
+        return None
+    return time(hour=int(match.group(1)), minute=int(match.group(2)))
+
+def spread_seconds(user_id):
+    return (user_id * 2654435761) % 60
+
+def effective_settings(user_id):
+    task_time, sleep_time, tz_name = _settings.get(user_id) or (None, None, None)
+    return (
+        task_time or DEFAULT_TASK_REMINDER_TIME,
+        sleep_time or DEFAULT_SLEEP_REMINDER_TIME,
+        tz_name or DEFAULT_TIMEZONE,
     )
-    
-    app.job_queue.run_daily(
-        send_sleep_reminder,
-        time=time(hour=10, minute=0, tzinfo=iran_tz),
-        name="sleep_reminder"
-    )
\ No newline at end of file
+
+def next_fire_time(user_id, at, tz_name, after):
+    tz = timezone(tz_name)
+    day = after.astimezone(tz).date()
+    while True:
+        fire = tz.localize(datetime.combine(day, at)) + timedelta(seconds=spread_seconds(user_id))
+        if fire > after:
+            return fire.astimezone(utc)
+        day += timedelta(days=1)
+
+def _push(user_id, kind, after):
+    task_time, sleep_time, tz_name = effective_settings(user_id)
+    value = task_time if kind == TASK_REMINDER else sleep_time
+    key = (user_id, kind)
+    at = parse_time(value)
+    if at is None:
+        _due.pop(key, None)
+        return
+    fire_at = next_fire_time(user_id, at, tz_name, after).timestamp()
+    _due[key] = fire_at
+    heapq.heappush(_heap, (fire_at, user_id, kind))
+
+def schedule_user(user_id, settings=None):
+    _settings[user_id] = settings
+    now = datetime.now(utc)
+    _push(user_id, TASK_REMINDER, now)
+    _push(user_id, SLEEP_REMINDER, now)
+
+def unschedule_user(user_id):
+    _settings.pop(user_id, None)
+    _due.pop((user_id, TASK_REMINDER), None)
+    _due.pop((user_id, SLEEP_REMINDER), None)
+
+def _arm(job_queue):
+    global _job, _job_at
+    while _heap and _due.get((_heap[0][1], _heap[0][2])) != _heap[0][0]:
+        heapq.heappop(_heap)
+    if not _heap:
+        return
+
+    next_at = _heap[0][0]
+    if _job is not None:
+        if _job_at <= next_at:
+            return
+        try:
+            _job.schedule_removal()
+        except JobLookupError:
+            pass
+    _job = job_queue.run_once(_dispatch, when=datetime.fromtimestamp(next_at, utc), name="reminder_dispatcher")
+    _job_at = next_at
+
+@metrics.timed_job("reminder_dispatcher")
+async def _dispatch(context):
+    global _job
+    _job = None
+    now = clock.time()
+    batches = {}
+
+    while _heap and _heap[0][0] <= now + DISPATCH_SLACK:
+        fire_at, user_id, kind = heapq.heappop(_heap)
+        if _due.get((user_id, kind)) != fire_at or user_id not in USERS or not owns_user(user_id):
+            continue
+        fired = datetime.fromtimestamp(fire_at, utc)
+        if kind == TASK_REMINDER:
+            tz = timezone(effective_settings(user_id)[2])
+            date = day_to_date(fired.astimezone(tz).date().toordinal())
+        else:
+            date = None
+        batches.setdefault((kind, date), []).append(user_id)
+        _push(user_id, kind, fired)
+
+    for (kind, date), user_ids in batches.items():
+        try:
+            if kind == TASK_REMINDER:
+                sent = await send_task_reminders(user_ids, date)
+            else:
+                sent = send_sleep_reminders(user_ids)
+            logger.info("Reminder batch %s: %s/%s user(s) notified", kind, sent, len(user_ids))
+        except Exception as e:
+            logger.error("Error sending %s reminders: %s", kind, e)
+
+    _arm(context.job_queue)
+
+def scheduled_counts():
+    # {kind: number of users with a pending reminder of that kind}
+    counts = {}
+    for _, kind in _due:
+        counts[kind] = counts.get(kind, 0) + 1
+    return counts
+
+def update_user_schedule(job_queue, user_id, settings):
+    schedule_user(user_id, settings)
+    _arm(job_queue)
+
+async def refresh_user_schedules(job_queue, added, removed):
+    added = [user_id for user_id in added if owns_user(user_id)]
+    for user_id in removed:
+        unschedule_user(user_id)
+    saved = await async_database.get_reminder_settings(added) if added else {}
+    for user_id in added:
+        schedule_user(user_id, saved.get(user_id))
+    _arm(job_queue)
+
+def setup_scheduler(app):
+    user_ids = [user_id for user_id in USERS if owns_user(user_id)]
+    saved = get_reminder_settings(user_ids)
+    for user_id in user_ids:
+        schedule_user(user_id, saved.get(user_id))
+    _arm(app.job_queue)
+    logger.info("Scheduled reminders for %s user(s)", len(user_ids))
@@ -0,0 +1,76 @@
+import re
+from collections import OrderedDict
+from itertools import count
+
+# Full-text search over task text (/search). tasks_fts is a contentless FTS5 index
+# kept by triggers on tasks (migration 9): each row is the task id with two
+# columns, owner ("u<user_id>", so a query only walks its user's postings) and
+# body (the normalized text). Text goes through normalize() both when indexed (the
+# triggers call it as the SQL function search_normalize) and when searched, so
+# Arabic and Persian spellings, zero-width non-joiners and diacritics do not matter.
+#
+# Every connection that writes tasks needs the function (see register); changing
+# FOLD or DROP needs a migration that rebuilds the index (REBUILD_SEARCH). Tasks of
+# archived days stay indexed under negative rowids (archived_rowid, database.py).
+
+FOLD = [
+    (0x064A, 0x06CC),  # Arabic yeh -> Persian yeh
+    (0x0649, 0x06CC),  # alef maksura -> Persian yeh
+    (0x0643, 0x06A9),  # Arabic kaf -> Persian kaf
+    *((0x06F0 + digit, 0x30 + digit) for digit in range(10)),  # Persian digits
+    *((0x0660 + digit, 0x30 + digit) for digit in range(10)),  # Arabic-Indic digits
+]
+DROP = [
+    0x200C, 0x200D, 0x200E, 0x200F,  # ZWNJ, ZWJ and direction marks: "می‌روم" == "میروم"
+    0x0640,                          # tatweel
+    *range(0x064B, 0x0656),          # harakat (fathatan ... hamza below)
+    0x0670,                          # superscript alef
+]
+
+_table = {**{source: target for source, target in FOLD}, **{char: None for char in DROP}}
+
+# Words beyond this are ignored, which bounds the cost of a query
+MAX_QUERY_WORDS = 8
+
+def normalize(text):
+    return text.translate(_table)
+
+def register(conn):
+    conn.create_function("search_normalize", 1, normalize, deterministic=True)
+
+def archived_rowid(archive_id, index):
+    # Rowid of the index-th task of a tasks_archive row; tasks keep their own
+    # (positive) ids while they are in the tasks table
+    return -(archive_id << 16 | index)
+
+def query_words(text):
+    # Split like FTS5's unicode61 tokenizer: runs of letters and digits
+    return re.findall(r"[^\W_]+", normalize(text))[:MAX_QUERY_WORDS]
+
+def match_expression(user_id, words):
+    # Every word must match, as a prefix ("کتاب" finds "کتاب‌ها"). Single letters
+    # match only themselves: as a prefix they would merge the postings of a large
+    # part of the vocabulary (tasks_fts keeps prefix indexes from two letters up).
+    terms = " ".join(f'"{word}"*' if len(word) > 1 else f'"{word}"' for word in words)
+    return f"owner:u{user_id} AND body:({terms})"
+
+# Searches behind the result pages on screen, so a page button carries a small id
+# instead of the query text (which rarely fits in 64 bytes of callback data). A
+# button whose search was forgotten, e.g. after a restart, asks for a new search.
+MAX_SAVED_SEARCHES = 1024
+_saved = OrderedDict()
+_ids = count(1)
+
+def save(user_id, text):
+    search_id = next(_ids)
+    _saved[search_id] = (user_id, text)
+    while len(_saved) > MAX_SAVED_SEARCHES:
+        _saved.popitem(last=False)
+    return search_id
+
+def saved(search_id, user_id):
+    entry = _saved.get(search_id)
+    if entry is None or entry[0] != user_id:
+        return None
+    _saved.move_to_end(search_id)
+    return entry[1]
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+from telegram import Bot, Update
+from telegram.ext import Updater
+from .config import (BOT_TOKEN, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+                     WEBHOOK_SECRET, BOT_API_BASE_URL)
+from .database import close_database
+from .users import load_users, reload_users
+from .scheduler import setup_scheduler, refresh_user_schedules
+from .archive import setup_archive
+from .notifications import set_bot_commands
+from .logs import setup_logging, share_with_processes
+from . import broadcast, shards, view_cache
+
+logger = logging.getLogger(__name__)
+
+# Sharded mode: the parent process is a thin dispatcher that receives updates (long
+# polling or webhook) and routes each one to the worker that owns its user, chosen
+# by shards.shard_for. Every worker runs a full Application without an updater, so
+# handlers, the broadcast queue and the reminder scheduler work unchanged, but only
+# for its own users. Parent and workers talk over one-way pipes:
+#
+#   parent -> worker  ("update", update_dict)        an update for this shard
+#                     ("send", chat_id, text, kwargs) a message another shard queued
+#                     ("control", origin, command)   reload the users table or clear
+#                                                    the view cache
+#                     ("stop",)
+#   worker -> parent  ("send", ...) addressed to its shard, passed on as is
+#                     ("control", ...) relayed to every other shard
+#
+# Both directions are non-blocking (shards.PipeWriter / PipeReader).
+
+def _update_owner(update):
+    chat = update.effective_chat
+    if chat is not None:
+        return chat.id
+    user = update.effective_user
+    return user.id if user is not None else None
+
+async def _run_worker(index, build_application, inbox):
+    app = build_application(updater=False)
+    setup_scheduler(app)
+    if index == 0:
+        app.job_queue.run_once(set_bot_commands, when=1)
+        setup_archive(app)
+
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stopping.set)
+
+    async def reload():
+        added, removed = await reload_users()
+        await refresh_user_schedules(app.job_queue, added, removed)
+
+    def handle(message):
+        if message is None or message[0] == "stop":
+            stopping.set()
+        elif message[0] == "update":
+            app.update_queue.put_nowait(Update.de_json(message[1], app.bot))
+        elif message[0] == "send":
+            _, chat_id, text, kwargs = message
+            broadcast.enqueue(chat_id, text, **kwargs)
+        elif message[0] == "control" and message[2] == "reload_users":
+            app.create_task(reload())
+        elif message[0] == "control" and message[2] == "clear_view_cache":
+            view_cache.clear()
+
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    loop.add_reader(inbox.fileno(), shards.PipeReader(inbox, handle))
+    logger.info("Shard %s started", index)
+
+    await stopping.wait()
+    loop.remove_reader(inbox.fileno())
+    await app.stop()
+    await app.post_stop(app)
+    await app.shutdown()
+    await app.post_shutdown(app)
+    logger.info("Shard %s stopped", index)
+
+def _worker_main(index, count, build_application, inbox, outbox, log_queue):
+    # Ctrl+C reaches the whole process group; only the dispatcher reacts to it and
+    # then stops the workers in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if log_queue is not None:
+        setup_logging(log_queue)
+    shards.configure(index, count, shards.PipeWriter(outbox))
+    load_users()
+    asyncio.run(_run_worker(index, build_application, inbox))
+
+async def _dispatch(inboxes, outboxes):
+    count = len(inboxes)
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    def route(message):
+        if message is None:
+            logger.error("A shard closed its pipe, shutting down")
+            stopping.set()
+        elif message[0] == "control":
+            for index, inbox in enumerate(inboxes):
+                if index != message[1]:
+                    inbox.send(message)
+
+    def forward(target, frame):
+        inboxes[target].send_frame(frame)
+
+    for outbox in outboxes:
+        loop.add_reader(outbox.fileno(), shards.PipeReader(outbox, route, forward))
+
+    bot = Bot(BOT_TOKEN, base_url=BOT_API_BASE_URL) if BOT_API_BASE_URL else Bot(BOT_TOKEN)
+    updates = asyncio.Queue()
+    updater = Updater(bot, updates)
+    routed = [0] * count
+
+    async def forward_updates():
+        while True:
+            update = await updates.get()
+            user_id = _update_owner(update)
+            if user_id is None:
+                continue
+            shard = shards.shard_for(user_id, count)
+            inboxes[shard].send(("update", update.to_dict()))
+            routed[shard] += 1
+
+    async with updater:
+        if WEBHOOK_URL:
+            logger.info("Dispatcher serving webhook on %s:%s/%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+            await updater.start_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                drop_pending_updates=True,
+            )
+        else:
+            await updater.start_polling(drop_pending_updates=True)
+        forwarder = asyncio.create_task(forward_updates())
+
+        await stopping.wait()
+        await updater.stop()
+        forwarder.cancel()
+
+    for outbox in outboxes:
+        loop.remove_reader(outbox.fileno())
+    logger.info("Dispatcher stopped, updates routed per shard: %s", routed)
+
+def run_sharded(count, build_application):
+    # The parent has already migrated the database; its connections must not be
+    # shared with the workers
+    close_database()
+    context = multiprocessing.get_context("spawn")
+    log_queue = share_with_processes(context)
+    inboxes, outboxes, workers = [], [], []
+    for index in range(count):
+        inbox_reader, inbox_writer = context.Pipe(duplex=False)
+        outbox_reader, outbox_writer = context.Pipe(duplex=False)
+        worker = context.Process(
+            target=_worker_main,
+            args=(index, count, build_application, inbox_reader, outbox_writer, log_queue),
+            name=f"shard-{index}",
+        )
+        worker.start()
+        inboxes.append(shards.PipeWriter(inbox_writer))
+        outboxes.append(outbox_reader)
+        workers.append(worker)
+    logger.info("Started %s shard worker(s)", count)
+
+    try:
+        asyncio.run(_dispatch(inboxes, outboxes))
+    finally:
+        for inbox in inboxes:
+            try:
+                inbox.close(("stop",))
+            except OSError:
+                pass
+        for worker in workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                logger.warning("%s did not stop in time, terminating", worker.name)
+                worker.terminate()
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import pickle
+import select
+import struct
+import time
+import zlib
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Which users this process is responsible for. In the default single-process mode
+# nothing is configured and every user is owned locally. In sharded mode (see
+# shard_runner.py) each worker owns the users whose id hashes to its index, and
+# messages for users owned by another worker are sent through the dispatcher.
+
+_index = None
+_count = 1
+_outbox = None
+
+def configure(index, count, outbox):
+    global _index, _count, _outbox
+    _index, _count, _outbox = index, count, outbox
+
+def shard_for(user_id, count):
+    return zlib.crc32(str(user_id).encode()) % count
+
+def is_sharded():
+    return _index is not None
+
+def shard_index():
+    return _index
+
+def shard_count():
+    return _count
+
+def owns_user(user_id):
+    return _index is None or shard_for(user_id, _count) == _index
+
+# Messages between the dispatcher and the workers travel over pipes in both
+# directions, so neither side may block on a write: a dispatcher stuck on a full
+# worker inbox while that worker is stuck on its full outbox would deadlock (team
+# notifications fan out across shards in bursts). Both ends are non-blocking and
+# driven by the event loop. A frame is the payload length, the shard the message
+# is for (-1: for whoever reads it) and the pickled message; the dispatcher passes
+# frames for a shard on without unpickling them.
+_HEADER = struct.Struct("!Ii")
+
+def _frame(message, target):
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(len(data), target) + data
+
+class PipeWriter:
+    # Writes what the pipe takes now and keeps the rest in memory until the loop
+    # reports the pipe writable again. send() must be called on the event loop.
+    def __init__(self, conn):
+        self._conn = conn
+        self._fd = conn.fileno()
+        os.set_blocking(self._fd, False)
+        self._pending = deque()
+        self._loop = None
+
+    def pending_bytes(self):
+        return sum(len(chunk) for chunk in self._pending)
+
+    def send(self, message, target=-1):
+        self.send_frame(_frame(message, target))
+
+    def send_frame(self, frame):
+        self._pending.append(memoryview(frame))
+        if len(self._pending) == 1:
+            self._write()
+
+    def _write(self):
+        try:
+            while self._pending:
+                chunk = self._pending[0]
+                written = os.write(self._fd, chunk)
+                if written < len(chunk):
+                    self._pending[0] = chunk[written:]
+                    break
+                self._pending.popleft()
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            # The other end is gone; its EOF stops the process that reads it
+            logger.error("Dropping %s message(s) for a closed pipe: %s", len(self._pending), e)
+            self._pending.clear()
+        if self._pending and self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop.add_writer(self._fd, self._write)
+        elif not self._pending and self._loop is not None:
+            self._loop.remove_writer(self._fd)
+            self._loop = None
+
+    def close(self, message=None, timeout=5):
+        # Outside the event loop (at shutdown): writes what is queued, then
+        # `message`, giving up after `timeout` seconds of a pipe nobody reads
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.remove_writer(self._fd)
+        self._loop = None
+        if message is not None:
+            self._pending.append(memoryview(_frame(message, -1)))
+        deadline = time.monotonic() + timeout
+        try:
+            while self._pending:
+                try:
+                    written = os.write(self._fd, self._pending[0])
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        raise OSError(f"pipe still full after {timeout}s")
+                    select.select([], [self._fd], [], 0.1)
+                    continue
+                if written < len(self._pending[0]):
+                    self._pending[0] = self._pending[0][written:]
+                else:
+                    self._pending.popleft()
+        finally:
+            self._conn.close()
+
+class PipeReader:
+    # add_reader callback: reads what is available and calls handle(message) for
+    # every complete message, or forward(target, frame) for frames addressed to a
+    # shard when forward is given; handle(None) on EOF
+    def __init__(self, conn, handle, forward=None):
+        self._conn = conn
+        self._fd = conn.fileno()
+        os.set_blocking(self._fd, False)
+        self._handle = handle
+        self._forward = forward
+        self._buffer = bytearray()
+
+    def __call__(self):
+        try:
+            while True:
+                data = os.read(self._fd, 1 << 16)
+                if not data:
+                    break
+                self._buffer += data
+        except BlockingIOError:
+            data = None
+        except OSError:
+            data = b""
+
+        start = 0
+        while len(self._buffer) - start >= _HEADER.size:
+            size, target = _HEADER.unpack_from(self._buffer, start)
+            end = start + _HEADER.size + size
+            if len(self._buffer) < end:
+                break
+            if target >= 0 and self._forward is not None:
+                self._forward(target, bytes(self._buffer[start:end]))
+            else:
+                self._handle(pickle.loads(self._buffer[start + _HEADER.size:end]))
+            start = end
+        del self._buffer[:start]
+
+        if data == b"":
+            asyncio.get_running_loop().remove_reader(self._fd)
+            self._handle(None)
+
+def forward_message(chat_id, text, kwargs):
+    try:
+        _outbox.send(("send", chat_id, text, kwargs), shard_for(chat_id, _count))
+        return True
+    except (OSError, ValueError) as e:
+        logger.error("Could not forward message for %s to its shard: %s", chat_id, e)
+        return False
+
+def broadcast_control(command):
+    # Asks every other worker to run a control command (e.g. reload the users table)
+    if _index is None:
+        return
+    try:
+        _outbox.send(("control", _index, command))
+    except (OSError, ValueError) as e:
+        logger.error("Could not send control command %s to other shards: %s", command, e)
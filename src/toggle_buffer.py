@@ -0,0 +1,69 @@
+from .config import TOGGLE_WRITE_BEHIND_INTERVAL
+
+# Write-behind state for checkbox toggles (enabled by TOGGLE_WRITE_BEHIND_INTERVAL).
+# A toggle only flips `current` here; async_database overlays these values on task
+# reads and periodically writes every entry whose current state differs from the
+# last committed one (`base`) in one transaction. Repeated taps on the same task
+# collapse into one entry, so pending_count() is the number of rows at risk.
+
+_entries = {}
+_days = {}
+_stats = {"toggles": 0, "flushes": 0, "flushed_rows": 0}
+
+def enabled():
+    return TOGGLE_WRITE_BEHIND_INTERVAL > 0
+
+def tracks(task_id):
+    return task_id in _entries
+
+def track(task_id, user_id, date, is_done):
+    if task_id not in _entries:
+        _entries[task_id] = [user_id, date, is_done, is_done]
+        _days.setdefault((user_id, date), set()).add(task_id)
+
+def toggle(task_id):
+    entry = _entries[task_id]
+    entry[3] = 0 if entry[3] else 1
+    _stats["toggles"] += 1
+    return entry[0], entry[1]
+
+def overlay_tasks(rows):
+    # rows: [(id, task_text, is_done)]
+    if not _entries:
+        return rows
+    return [
+        (task_id, text, _entries[task_id][3] if task_id in _entries else is_done)
+        for task_id, text, is_done in rows
+    ]
+
+def pending_for_day(user_id, date):
+    # {task_id: current is_done} for tasks of that day with uncommitted toggles
+    task_ids = _days.get((user_id, date))
+    if not task_ids:
+        return {}
+    return {task_id: _entries[task_id][3] for task_id in task_ids if _entries[task_id][3] != _entries[task_id][2]}
+
+def pending_count():
+    return sum(1 for entry in _entries.values() if entry[3] != entry[2])
+
+def changes():
+    # [(is_done, task_id)] ready for executemany
+    return [(entry[3], task_id) for task_id, entry in _entries.items() if entry[3] != entry[2]]
+
+def committed(rows):
+    # Called after rows from changes() were written; only one flush may be in flight.
+    # Entries that match the database again (including ones tapped back) are dropped.
+    for is_done, task_id in rows:
+        if task_id in _entries:
+            _entries[task_id][2] = is_done
+    for task_id in [task_id for task_id, entry in _entries.items() if entry[3] == entry[2]]:
+        user_id, date = _entries.pop(task_id)[:2]
+        day = _days[(user_id, date)]
+        day.discard(task_id)
+        if not day:
+            del _days[(user_id, date)]
+    _stats["flushes"] += 1
+    _stats["flushed_rows"] += len(rows)
+
+def stats():
+    return dict(_stats, pending=pending_count(), tracked=len(_entries))
@@ -0,0 +1,123 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import sys
+from itertools import chain
+from .dates import date_to_day
+from . import database
+
+# Task history files for /export, /import and the admin CLI below: one line per
+# task, oldest day first, as CSV (with a header) or JSON Lines, always gzip
+# compressed on export. Dates are the stored Jalali dates. Import also accepts
+# uncompressed files; whatever the file says about user_id is replaced by the
+# importing user's id, except in the CLI without --user.
+#
+#   python -m src.transfer export [--user ID] [--format csv|jsonl] FILE
+#   python -m src.transfer import [--user ID] FILE
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ("user_id", "date", "position", "task", "done", "completed")
+
+# Bot API limits for files a bot sends and downloads
+UPLOAD_LIMIT = 50 * 1024 * 1024
+DOWNLOAD_LIMIT = 20 * 1024 * 1024
+
+def export_history(fileobj, fmt, user_id=None):
+    # Streams the history into a binary file object; returns the number of tasks
+    count = 0
+    with gzip.GzipFile(fileobj=fileobj, mode="wb") as compressed:
+        out = io.TextIOWrapper(compressed, encoding="utf-8", newline="")
+        if fmt == "csv":
+            writer = csv.writer(out)
+            writer.writerow(FIELDS)
+            for row in database.iter_history(user_id):
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in database.iter_history(user_id):
+                out.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + "\n")
+                count += 1
+        out.flush()
+        out.detach()
+    return count
+
+def _flag(value):
+    value = int(value)
+    if value not in (0, 1):
+        raise ValueError(f"expected 0 or 1, got {value}")
+    return value
+
+def _parse(record):
+    text = str(record["task"]).strip()
+    if not text:
+        raise ValueError("empty task")
+    date = str(record["date"])
+    date_to_day(date)
+    return (int(record["user_id"]), date, int(record["position"]), text,
+            _flag(record["done"]), _flag(record["completed"]))
+
+def read_history(fileobj):
+    # Yields the rows of a seekable binary file object in iter_history's shape;
+    # anything malformed raises ValueError naming the line
+    compressed = fileobj.read(2) == b"\x1f\x8b"
+    fileobj.seek(0)
+    source = gzip.GzipFile(fileobj=fileobj, mode="rb") if compressed else fileobj
+    lines = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    number = 1
+    try:
+        first = lines.readline()
+        if first.lstrip().startswith("{"):
+            records = (json.loads(line) for line in chain([first], lines))
+        else:
+            records = csv.DictReader(chain([first], lines))
+            missing = set(FIELDS) - set(records.fieldnames or ())
+            if missing:
+                raise ValueError(f"missing columns: {', '.join(sorted(missing))}")
+            number = 2
+        for record in records:
+            yield _parse(record)
+            number += 1
+    except (ValueError, KeyError, TypeError, OSError, EOFError, csv.Error) as e:
+        raise ValueError(f"line {number}: {e}") from None
+    finally:
+        lines.detach()
+
+def import_history(fileobj, user_id=None):
+    rows = read_history(fileobj)
+    if user_id is not None:
+        rows = ((user_id, *row[1:]) for row in rows)
+    return database.import_history(rows)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m src.transfer")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write task history to a gzip-compressed file")
+    export.add_argument("--user", type=int, help="only this user (default: everyone)")
+    export.add_argument("--format", choices=FORMATS, default="csv")
+    export.add_argument("file")
+    load = commands.add_parser("import", help="load an exported file; its days replace the stored ones")
+    load.add_argument("--user", type=int, help="import every row as this user")
+    load.add_argument("file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    database.init_database()
+    try:
+        if args.command == "export":
+            with open(args.file, "wb") as out:
+                count = export_history(out, args.format, args.user)
+            print(f"Exported {count} tasks to {args.file}")
+        else:
+            with open(args.file, "rb") as source:
+                days, count = import_history(source, args.user)
+            print(f"Imported {count} tasks on {days} days")
+    except ValueError as e:
+        sys.exit(f"Import failed, nothing was changed: {e}")
+    finally:
+        database.close_database()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    # Runs updates from different chats concurrently while keeping each chat's
+    # updates strictly in arrival order (asyncio.Lock wakes waiters FIFO), so one
+    # user's toggles and /tasks rewrites never interleave.
+    #
+    # PTB holds its own semaphore while do_process_update waits for the chat lock,
+    # so it is sized as a bound on in-flight updates (waiting included) and the
+    # real concurrency limit is applied only once the chat lock is held. Otherwise
+    # one busy chat could occupy every slot while its updates wait on each other.
+
+    def __init__(self, max_concurrent_updates, max_in_flight=None):
+        super().__init__(max_in_flight or max_concurrent_updates * 64)
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chats = {}
+
+    @staticmethod
+    def _chat_key(update):
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, "effective_user", None)
+        return user.id if user is not None else None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def queued_chats(self):
+        return len(self._chats)
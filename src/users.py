@@ -0,0 +1,53 @@
+import logging
+from .config import USERS, ADMIN_IDS, DEFAULT_TEAM, load_users_from_env
+from . import database
+from .async_database import get_active_users
+
+logger = logging.getLogger(__name__)
+
+# In-memory index of the users table. USERS (user_id -> name) is the dict every
+# handler checks for authorization; it is updated in place so modules that
+# imported it keep seeing the current set. TEAMS maps team -> set of user ids and
+# scopes cross-user notifications.
+TEAMS = {}
+_team_of = {}
+_admins = set()
+
+def _apply(rows):
+    users, teams, team_of, admins = {}, {}, {}, set()
+    for user_id, name, team, admin in rows:
+        users[user_id] = name
+        teams.setdefault(team, set()).add(user_id)
+        team_of[user_id] = team
+        if admin:
+            admins.add(user_id)
+
+    added, removed = set(users) - set(USERS), set(USERS) - set(users)
+    USERS.clear()
+    USERS.update(users)
+    TEAMS.clear()
+    TEAMS.update(teams)
+    _team_of.clear()
+    _team_of.update(team_of)
+    _admins.clear()
+    _admins.update(admins)
+    logger.info("Loaded %s users in %s team(s)", len(USERS), len(TEAMS))
+    return added, removed
+
+def load_users():
+    env_users = load_users_from_env()
+    admin_ids = ADMIN_IDS or set(list(env_users)[:1])
+    database.seed_users(env_users, admin_ids, DEFAULT_TEAM)
+    return _apply(database.get_active_users())
+
+async def reload_users():
+    return _apply(await get_active_users())
+
+def team_of(user_id):
+    return _team_of.get(user_id)
+
+def team_members(user_id):
+    return TEAMS.get(_team_of.get(user_id), set())
+
+def is_admin(user_id):
+    return user_id in _admins
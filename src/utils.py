@@ -1,146 +1,186 @@
-import re
-import jdatetime
+import logging
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton, Update
-from .config import logger
-from .database import get_tasks_by_date, get_all_task_status
+from .config import TASKS_PER_PAGE, SEARCH_PAGE_SIZE
+from .async_database import get_tasks_by_date, get_all_task_status, get_history, search_tasks
+from .dates import date_to_day, display_date
+from . import view_cache, edits, callbacks, search
 
-def parse_date_from_text(text):
-    text = text.replace("/tasks", "").strip()
-    
-    date_patterns = [
-        r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',
-        r'(\d{1,2}[/-]\d{1,2}[/-]\d{4})',
-    ]
-    
-    for pattern in date_patterns:
-        match = re.search(pattern, text)
-        if match:
-            date_str = match.group(1)
-            
-            if '/' in date_str:
-                parts = date_str.split('/')
-                separator = '/'
-            else:
-                parts = date_str.split('-')
-                separator = '-'
-            
-            if len(parts) != 3:
-                continue
-                
-            converted_date = convert_date_to_jalali(parts, separator, date_str)
-            
-            if converted_date:
-                remaining_text = re.sub(pattern, '', text).strip()
-                return converted_date, remaining_text
+logger = logging.getLogger(__name__)
+
+async def render_task_view(user_id, date, page=0):
+    requested = page
+    view, epoch = view_cache.lookup(user_id, date, requested)
+    if view is not None:
+        return view
+
+    tasks = await get_tasks_by_date(user_id, date)
     
-    return None, text
+    if not tasks:
+        view = (f"❌ هیچ تسکی برای تاریخ {date} ثبت نشده.", None)
+        view_cache.store(user_id, date, view, epoch, requested)
+        return view
 
-def convert_date_to_jalali(parts, separator, original_date_str):
-    try:
-        if len(parts[0]) == 4:
-            year, month, day = int(parts[0]), int(parts[1]), int(parts[2])
-            if year >= 1300:
-                try:
-                    jalali_date = jdatetime.date(year, month, day)
-                    return jalali_date.strftime("%Y-%m-%d")
-                except (ValueError, jdatetime.InvalidJalaliDate):
-                    return None
-            else:
-                try:
-                    gregorian_date = datetime(year, month, day).date()
-                    jalali_date = jdatetime.date.fromgregorian(date=gregorian_date)
-                    return jalali_date.strftime("%Y-%m-%d")
-                except ValueError:
-                    return None
-        
-        elif len(parts[2]) == 4:
-            day, month, year = int(parts[0]), int(parts[1]), int(parts[2])
-            if year >= 1300:
-                try:
-                    jalali_date = jdatetime.date(year, month, day)
-                    return jalali_date.strftime("%Y-%m-%d")
-                except (ValueError, jdatetime.InvalidJalaliDate):
-                    return None
-            else:
-                try:
-                    gregorian_date = datetime(year, month, day).date()
-                    jalali_date = jdatetime.date.fromgregorian(date=gregorian_date)
-                    return jalali_date.strftime("%Y-%m-%d")
-                except ValueError:
-                    return None
-                    
-    except (ValueError, IndexError):
-        return None
-    
-    return None
+    day = date_to_day(date)
+    pages = (len(tasks) + TASKS_PER_PAGE - 1) // TASKS_PER_PAGE
+    page = min(page, pages - 1)
 
-async def show_tasks_for_date(update_or_callback, context, user_id, date):
-    try:
-        tasks = get_tasks_by_date(user_id, date)
-        logger.info(f"Retrieved {len(tasks)} tasks for user {user_id} on date {date}")
-        
-        if not tasks:
-            message = f"❌ هیچ تسکی برای تاریخ {date} ثبت نشده."
-            if isinstance(update_or_callback, Update):
-                await update_or_callback.message.reply_text(message)
-            else:
-                await update_or_callback.edit_message_text(message)
-            return
+    keyboard = []
+    for task_id, task_text, is_done in tasks[page * TASKS_PER_PAGE:(page + 1) * TASKS_PER_PAGE]:
+        status = "✅" if is_done else "⬜"
+        button_text = f"{status} {task_text}"
+        if len(button_text) > 60:
+            button_text = button_text[:57] + "..."
+        keyboard.append([InlineKeyboardButton(button_text, callback_data=callbacks.encode("toggle", task_id, day, page))])
 
-        keyboard = []
-        for task_id, task_text, is_done in tasks:
-            status = "✅" if is_done else "⬜"
-            button_text = f"{status} {task_text}"
-            if len(button_text) > 60:
-                button_text = button_text[:57] + "..."
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"toggle:{task_id}:{date}")])
+    if pages > 1:
+        noop = callbacks.encode("noop")
+        keyboard.append([
+            InlineKeyboardButton("◀️", callback_data=callbacks.encode("page", day, page - 1)) if page > 0
+            else InlineKeyboardButton(" ", callback_data=noop),
+            InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=noop),
+            InlineKeyboardButton("▶️", callback_data=callbacks.encode("page", day, page + 1)) if page < pages - 1
+            else InlineKeyboardButton(" ", callback_data=noop),
+        ])
 
-        total, done, is_daily_completed = get_all_task_status(user_id, date)
-        
-        if is_daily_completed:
-            keyboard.append([InlineKeyboardButton("🎉 روز تکمیل شده", callback_data=f"completed:{date}")])
-        else:
-            keyboard.append([InlineKeyboardButton("✅ اتمام روز", callback_data=f"complete_day_confirm:{date}")])
+    total, done, is_daily_completed = await get_all_task_status(user_id, date)
+    
+    if is_daily_completed:
+        keyboard.append([InlineKeyboardButton("🎉 روز تکمیل شده", callback_data=callbacks.encode("completed", day, page))])
+    else:
+        keyboard.append([InlineKeyboardButton("✅ اتمام روز", callback_data=callbacks.encode("complete_day_confirm", day, page))])
 
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        percentage = int((done / total) * 100) if total > 0 else 0
-        status_emoji = "🎉" if is_daily_completed else "🟢" if percentage >= 80 else "🟡" if percentage >= 50 else "🔴"
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    percentage = int((done / total) * 100) if total > 0 else 0
+    status_emoji = "🎉" if is_daily_completed else "🟢" if percentage >= 80 else "🟡" if percentage >= 50 else "🔴"
+    
+    persian_date = display_date(date)
         
-        try:
-            persian_date = jdatetime.datetime.strptime(date, "%Y-%m-%d").strftime("%Y/%m/%d")
-        except:
-            persian_date = date
-            
-        message = f"{status_emoji} تسک‌های {persian_date}:\n({done}/{total} تسک - {percentage}%)"
+    message = f"{status_emoji} تسک‌های {persian_date}:\n({done}/{total} تسک - {percentage}%)"
+    view = (message, reply_markup)
+    view_cache.store(user_id, date, view, epoch, page)
+    if requested != page:
+        # A page past the end (e.g. from an old message after tasks were removed)
+        # shows the last page; cache it under the number that was asked for too
+        view_cache.store(user_id, date, view, epoch, requested)
+    return view
+
+async def show_tasks_for_date(update_or_callback, context, user_id, date, page=0):
+    try:
+        message, reply_markup = await render_task_view(user_id, date, page)
 
         if isinstance(update_or_callback, Update):
-            await update_or_callback.message.reply_text(message, reply_markup=reply_markup)
+            sent = await update_or_callback.message.reply_text(message, reply_markup=reply_markup)
+            edits.remember(sent.chat_id, sent.message_id, message, reply_markup)
         else:
-            await update_or_callback.edit_message_text(message, reply_markup=reply_markup)
+            await edits.edit_message(update_or_callback, message, reply_markup)
             
     except Exception as e:
-        logger.error(f"Error in show_tasks_for_date: {e}")
+        logger.error("Error in show_tasks_for_date: %s", e)
         error_message = f"خطا در نمایش تسک‌ها: {str(e)}"
         if isinstance(update_or_callback, Update):
             await update_or_callback.message.reply_text(error_message)
         else:
             await update_or_callback.edit_message_text(error_message)
 
-async def show_complete_day_confirmation(query, date):
+def schedule_tasks_refresh(query, context, user_id, date, page=0):
+    edits.schedule_edit(context, query, lambda: render_task_view(user_id, date, page))
+
+async def show_complete_day_confirmation(query, date, page=0):
+    day = date_to_day(date)
     keyboard = [
-        [InlineKeyboardButton("❌ انصراف", callback_data=f"cancel_complete:{date}")],
-        [InlineKeyboardButton("✅ انتخاب همه تسک‌ها", callback_data=f"complete_with_all:{date}")],
-        [InlineKeyboardButton("🎯 فقط اتمام روز", callback_data=f"complete_day_only:{date}")]
+        [InlineKeyboardButton("❌ انصراف", callback_data=callbacks.encode("cancel_complete", day, page))],
+        [InlineKeyboardButton("✅ انتخاب همه تسک‌ها", callback_data=callbacks.encode("complete_with_all", day, page))],
+        [InlineKeyboardButton("🎯 فقط اتمام روز", callback_data=callbacks.encode("complete_day_only", day, page))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    try:
-        persian_date = jdatetime.datetime.strptime(date, "%Y-%m-%d").strftime("%Y/%m/%d")
-    except:
-        persian_date = date
+    persian_date = display_date(date)
         
     message = f"🤔 نحوه اتمام روز {persian_date} را انتخاب کنید:"
     
-    await query.edit_message_text(message, reply_markup=reply_markup)
\ No newline at end of file
+    await edits.edit_message(query, message, reply_markup)
+
+def format_history_line(date, total, done, is_completed):
+    percentage = int((done / total) * 100) if total > 0 else 0
+    
+    if is_completed:
+        status_emoji = "🎉"
+    else:
+        status_emoji = "🟢" if percentage >= 80 else "🟡" if percentage >= 50 else "🔴"
+    
+    persian_date = display_date(date)
+        
+    completion_text = " (تکمیل شده)" if is_completed else ""
+    return f"{status_emoji} {persian_date}: {done}/{total} تسک ({percentage}%){completion_text}\n"
+
+async def show_history(update_or_callback, context, user_id, limit, before=None, after=None):
+    rows, has_more = await get_history(user_id, limit, before=before, after=after)
+    
+    if after is not None and not has_more:
+        # Reached the newest days: show a full first page instead of a short one
+        rows, has_older = await get_history(user_id, limit)
+        has_newer = False
+    elif after is not None:
+        has_older, has_newer = True, True
+    else:
+        has_older, has_newer = has_more, before is not None
+    
+    if not rows:
+        message = "❌ هیچ تسکی ثبت نشده."
+        if isinstance(update_or_callback, Update):
+            await update_or_callback.message.reply_text(message)
+        else:
+            await update_or_callback.edit_message_text(message)
+        return
+    
+    message = f"📊 تاریخچه ({len(rows)} روز):\n\n"
+    for date, total, done, is_completed in rows:
+        message += format_history_line(date, total, done, is_completed)
+    
+    nav = []
+    if has_older:
+        nav.append(InlineKeyboardButton("⬅️ قدیمی‌تر", callback_data=callbacks.encode("history_older", limit, date_to_day(rows[-1][0]))))
+    if has_newer:
+        nav.append(InlineKeyboardButton("جدیدتر ➡️", callback_data=callbacks.encode("history_newer", limit, date_to_day(rows[0][0]))))
+    reply_markup = InlineKeyboardMarkup([nav]) if nav else None
+    
+    if isinstance(update_or_callback, Update):
+        await update_or_callback.message.reply_text(message, reply_markup=reply_markup)
+    else:
+        await edits.edit_message(update_or_callback, message, reply_markup)
+
+async def show_search(update_or_callback, context, user_id, search_id, text, page=0):
+    words = search.query_words(text)
+    rows, total = await search_tasks(user_id, words, SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
+    if not rows and page > 0:
+        # Tasks were deleted since the page was shown
+        page = 0
+        rows, total = await search_tasks(user_id, words, SEARCH_PAGE_SIZE)
+    
+    reply_markup = None
+    if not rows:
+        message = f"🔍 هیچ تسکی با «{text}» پیدا نشد."
+    else:
+        message = f"🔍 نتایج جستجوی «{text}» ({total} تسک):\n\n"
+        for date, task_text, is_done in rows:
+            if len(task_text) > 120:
+                task_text = task_text[:117] + "..."
+            message += f"{'✅' if is_done else '⬜'} {display_date(date)}: {task_text}\n"
+        
+        pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+        if pages > 1:
+            noop = callbacks.encode("noop")
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("◀️", callback_data=callbacks.encode("search_page", search_id, page - 1)) if page > 0
+                else InlineKeyboardButton(" ", callback_data=noop),
+                InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=noop),
+                InlineKeyboardButton("▶️", callback_data=callbacks.encode("search_page", search_id, page + 1)) if page < pages - 1
+                else InlineKeyboardButton(" ", callback_data=noop),
+            ]])
+    
+    if isinstance(update_or_callback, Update):
+        await update_or_callback.message.reply_text(message, reply_markup=reply_markup)
+    else:
+        await edits.edit_message(update_or_callback, message, reply_markup)
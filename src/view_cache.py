@@ -0,0 +1,50 @@
+import threading
+from collections import OrderedDict
+from .config import VIEW_CACHE_SIZE
+
+# Rendered task views keyed by (user_id, date), one entry per keyboard page under
+# that key. Database writes invalidate the
+# affected key right after they commit. A render that started before an
+# invalidation must not store its (possibly stale) result, so every lookup hands
+# out the current epoch and store() only accepts results from the same epoch.
+_views = OrderedDict()
+_lock = threading.Lock()
+_epoch = 0
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def lookup(user_id, date, page=0):
+    key = (user_id, date)
+    with _lock:
+        view = _views.get(key, {}).get(page)
+        if view is None:
+            _stats["misses"] += 1
+        else:
+            _views.move_to_end(key)
+            _stats["hits"] += 1
+        return view, _epoch
+
+def store(user_id, date, view, epoch, page=0):
+    with _lock:
+        if epoch != _epoch:
+            return
+        _views.setdefault((user_id, date), {})[page] = view
+        _views.move_to_end((user_id, date))
+        while len(_views) > VIEW_CACHE_SIZE:
+            _views.popitem(last=False)
+
+def invalidate(user_id, date):
+    global _epoch
+    with _lock:
+        _epoch += 1
+        _stats["invalidations"] += 1
+        _views.pop((user_id, date), None)
+
+def clear():
+    global _epoch
+    with _lock:
+        _epoch += 1
+        _views.clear()
+
+def stats():
+    with _lock:
+        return dict(_stats, size=len(_views), capacity=VIEW_CACHE_SIZE)
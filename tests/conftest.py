@@ -0,0 +1,12 @@
+import pytest
+
+from src import database, view_cache
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # A fresh database behind the module's connection pool, migrated to the latest schema
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "tasks.db"))
+    database.init_database()
+    view_cache.clear()
+    yield
+    database.close_database()
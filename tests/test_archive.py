@@ -0,0 +1,82 @@
+# Round trip of a completed day through tasks_archive (database.archive_days and
+# _restore_day): every read gives the same answer while the day is archived, and
+# the first write restores it with the same task ids.
+from src import database, search
+from src.dates import day_to_date, jalali_to_day
+
+DAY = jalali_to_day(1404, 7, 1)
+DATE = day_to_date(DAY)
+TASKS = ["خرید کتاب", "ورزش", "خرید نان", "ورزش"]
+
+def snapshot(user_id=1, date=DATE):
+    return (
+        database.get_tasks_by_date(user_id, date),
+        database.search_tasks(user_id, search.query_words("خرید"), 10),
+        database.search_tasks(user_id, search.query_words("ورزش"), 10),
+        database.get_all_task_status(user_id, date),
+        database.get_history(user_id, 10),
+        database.get_user_stats(user_id, DAY + 1),
+    )
+
+def hot_rows(user_id=1, day=DAY):
+    with database.read_connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM tasks WHERE user_id = ? AND day = ?', (user_id, day)).fetchone()[0]
+
+def completed_day(user_id=1, date=DATE):
+    database.save_daily_tasks(user_id, date, TASKS)
+    ids = [task_id for task_id, _, _ in database.get_tasks_by_date(user_id, date)]
+    database.toggle_task_status(ids[1])
+    database.toggle_task_status(ids[2])
+    database.mark_daily_completed(user_id, date)
+    return ids
+
+def test_archived_day_reads_unchanged(db):
+    completed_day()
+    database.save_daily_tasks(1, day_to_date(DAY + 1), ["خرید شیر"])
+    before = snapshot()
+
+    assert database.archive_days(DAY + 1, 10) == 1
+    assert hot_rows() == 0
+    assert snapshot() == before
+    assert database.check_daily_counters() == []
+
+def test_toggle_restores_day(db):
+    ids = completed_day()
+    tasks = database.get_tasks_by_date(1, DATE)
+    database.archive_days(DAY + 1, 10)
+
+    # As the toggle callback does for a task of an archived day
+    assert not database.toggle_task_status(ids[0])
+    assert database.restore_archived_day(1, DATE)
+    assert database.toggle_task_status(ids[0])
+
+    assert hot_rows() == len(TASKS)
+    assert database.get_tasks_by_date(1, DATE) == [(ids[0], TASKS[0], 1)] + tasks[1:]
+    assert database.get_all_task_status(1, DATE) == (4, 3, True)
+    assert database.check_daily_counters() == []
+    # Each task is found once, under its own id again
+    rows, total = database.search_tasks(1, search.query_words("خرید"), 10)
+    assert total == 2 and sorted(text for _, text, _ in rows) == sorted([TASKS[0], TASKS[2]])
+    with database.read_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM tasks_archive').fetchone()[0] == 0
+
+def test_save_restores_day(db):
+    ids = completed_day()
+    database.archive_days(DAY + 1, 10)
+
+    database.save_daily_tasks(1, DATE, TASKS + ["جدید"])
+    tasks = database.get_tasks_by_date(1, DATE)
+    assert [task_id for task_id, _, _ in tasks[:4]] == ids
+    assert [is_done for _, _, is_done in tasks] == [0, 1, 1, 0, 0]
+    assert database.get_all_task_status(1, DATE) == (5, 2, False)
+    assert database.check_daily_counters() == []
+
+def test_only_completed_old_days_archived(db):
+    completed_day()
+    database.save_daily_tasks(1, day_to_date(DAY - 1), ["ورزش"])
+    completed_day(2, day_to_date(DAY + 1))
+
+    assert database.archive_days(DAY + 1, 10) == 1
+    assert hot_rows(1, DAY) == 0
+    assert hot_rows(1, DAY - 1) == 1
+    assert hot_rows(2, DAY + 1) == len(TASKS)
@@ -0,0 +1,75 @@
+# Property tests for the Jalali <-> day-number table in src/dates.py against
+# jdatetime, and for the dates parse_date finds in /tasks and /date.
+import random
+from datetime import date as gregorian_date
+
+import jdatetime
+import pytest
+
+from src import dates
+
+TODAY = gregorian_date(2025, 9, 23).toordinal()
+
+def jalali_of(day):
+    return jdatetime.date.fromgregorian(date=gregorian_date.fromordinal(day))
+
+def test_table_matches_jdatetime():
+    # Every day the table covers, plus a margin on both sides that goes through jdatetime
+    for day in range(dates._month_starts[0] - 400, dates._month_starts[-1] + 400):
+        expected = jalali_of(day)
+        jalali = (expected.year, expected.month, expected.day)
+        assert dates.day_to_jalali(day) == jalali, day
+        assert dates.jalali_to_day(*jalali) == day, jalali
+
+@pytest.mark.parametrize("year", [dates._first_year, 1403, 1404, dates._last_year])
+def test_invalid_dates_rejected(year):
+    leap = jdatetime.date(year, 1, 1).isleap()
+    for month, day in ((12, 31 if leap else 30), (7, 31), (1, 32), (13, 1), (0, 1), (1, 0)):
+        with pytest.raises(ValueError):
+            dates.jalali_to_day(year, month, day)
+
+def test_parse_typed_dates():
+    rng = random.Random(1)
+    for _ in range(2000):
+        day = rng.randrange(dates._month_starts[0], dates._month_starts[-1])
+        jalali, gregorian = jalali_of(day), gregorian_date.fromordinal(day)
+        expected = jalali.strftime("%Y-%m-%d")
+        for text in (
+            f"{jalali.year}-{jalali.month}-{jalali.day}\ntask",
+            f"{jalali.day:02d}/{jalali.month:02d}/{jalali.year} task",
+            f"{gregorian.year}-{gregorian.month:02d}-{gregorian.day:02d}\ntask",
+            f"{gregorian.day}/{gregorian.month}/{gregorian.year}\ntask",
+        ):
+            assert dates.parse_date(text, TODAY) == (expected, "task"), text
+
+@pytest.mark.parametrize("text, offset", [
+    ("فردا\nx", 1), ("tomorrow\nx", 1), ("دیروز\nx", -1), ("امروز\nx", 0), ("پس فردا\nx", 2), ("  Today  \nx", 0),
+])
+def test_parse_relative_offsets(text, offset):
+    assert dates.parse_date(text, TODAY) == (dates.day_to_date(TODAY + offset), "x")
+
+@pytest.mark.parametrize("text, weekday", [
+    ("شنبه\nx", 5), ("سه شنبه\nx", 1), ("سه‌شنبه\nx", 1), ("Friday\nx", 4), ("جمعه", 4),
+])
+def test_parse_weekdays(text, weekday):
+    parsed, _ = dates.parse_date(text, TODAY)
+    day = dates.date_to_day(parsed)
+    assert gregorian_date.fromordinal(day).weekday() == weekday
+    assert 0 <= day - TODAY < 7
+
+@pytest.mark.parametrize("text", [
+    "شنبه جلسه تیم", "tomorrow x", "call Ali tomorrow", "jomeh\nx", "1404-13-01\nx", "31/02/2025 x",
+])
+def test_parse_no_date(text):
+    assert dates.parse_date(text, TODAY) == (None, text)
+
+def test_jalali_month_range():
+    assert dates.jalali_month_range(1404, 7) == (dates.jalali_to_day(1404, 7, 1), dates.jalali_to_day(1404, 7, 30))
+    first, last = dates.jalali_month_range(1403, 12)
+    assert (jalali_of(first).day, jalali_of(last + 1).month) == (1, 1)
+
+@pytest.mark.parametrize("year", [0, 9999])
+def test_jalali_month_range_out_of_range(year):
+    # /month replies with its format error for these
+    with pytest.raises(ValueError):
+        dates.jalali_month_range(year, 7)
@@ -0,0 +1,53 @@
+# Query-plan regression test: builds a scratch database through the migrations and
+# fails if a hot query stops using its index (or falls back to a table scan).
+import sqlite3
+
+import pytest
+
+from src import database, migrations
+from src.search import match_expression
+
+DAY = 739517
+
+HOT_QUERIES = [
+    ('SELECT id, task_text, is_done FROM tasks WHERE user_id = ? AND day = ? ORDER BY position, id',
+     (1, DAY), 'idx_tasks_user_day_done'),
+    ('DELETE FROM tasks WHERE user_id = ? AND day = ?',
+     (1, DAY), 'idx_tasks_user_day_done'),
+    ('SELECT total_tasks, done_tasks, is_completed FROM daily_entries WHERE user_id = ? AND day = ?',
+     (1, DAY), 'idx_daily_entries_user_day'),
+    (database.HISTORY_QUERY.format(condition='AND day < ?', order='DESC'),
+     (1, DAY, 31), 'idx_daily_entries_user_day'),
+    ('SELECT date, total_tasks, done_tasks, is_completed FROM daily_entries '
+     'WHERE user_id = ? AND day BETWEEN ? AND ? AND total_tasks > 0 ORDER BY day',
+     (1, DAY, DAY + 30), 'idx_daily_entries_user_day'),
+    ('SELECT first_day, last_day FROM stats_streaks WHERE user_id = ? AND first_day <= ? '
+     'ORDER BY first_day DESC LIMIT 1',
+     (1, DAY), 'PRIMARY KEY'),
+    ('SELECT MAX(last_day - first_day) + 1 FROM stats_streaks WHERE user_id = ?',
+     (1,), 'idx_stats_streaks_user_length'),
+    ('UPDATE stats_streaks SET last_day = ? WHERE user_id = ? AND last_day = ?',
+     (DAY, 1, DAY - 1), 'idx_stats_streaks_user_last'),
+    ('SELECT tasks FROM tasks_archive WHERE user_id = ? AND day = ?',
+     (1, DAY), 'sqlite_autoindex_tasks_archive_1'),
+    (database.EXPORT_QUERY.format(condition='AND d.user_id = ?'), (1,), 'idx_daily_entries_user_day'),
+    (database.SEARCH_QUERY, (match_expression(1, ["word"]), 10, 0), 'INTEGER PRIMARY KEY'),
+]
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    conn = sqlite3.connect(tmp_path_factory.mktemp("plans") / "plans.db", isolation_level=None)
+    migrations.migrate(conn)
+    yield conn
+    conn.close()
+
+def is_table_scan(step, tables):
+    parts = step.split()
+    return len(parts) >= 2 and parts[0] == 'SCAN' and parts[1] in tables and 'INDEX' not in step
+
+@pytest.mark.parametrize("sql, params, index", HOT_QUERIES, ids=[index for _, _, index in HOT_QUERIES])
+def test_query_uses_index(conn, sql, params, index):
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+    assert any(index in step for step in plan), plan
+    assert not any(is_table_scan(step, tables) for step in plan), plan
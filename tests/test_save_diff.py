@@ -0,0 +1,83 @@
+# save_daily_tasks in SAVE_DIFF mode: a re-sent list keeps the rows (ids and done
+# state) of lines that did not change, whatever their new position; duplicates are
+# matched in order.
+import pytest
+
+from src import database
+from src.database import _diff_tasks, SAVE_DIFF, SAVE_REPLACE, SAVE_APPEND
+
+DATE = "1404-07-01"
+
+def saved(user_id=1):
+    return database.get_tasks_by_date(user_id, DATE)
+
+def toggle(*texts):
+    for task_id, text, _ in saved():
+        if text in texts:
+            database.toggle_task_status(task_id)
+
+@pytest.mark.parametrize("existing, tasks, expected", [
+    # unchanged
+    ([(1, "a", 0), (2, "b", 1)], ["a", "b"], ([], [], [])),
+    # reordered: only positions change
+    ([(1, "a", 0), (2, "b", 1), (3, "c", 2)], ["c", "a", "b"], ([], [], [(0, 3), (1, 1), (2, 2)])),
+    # duplicates are matched first to first, the extra copy is new
+    ([(1, "a", 0), (2, "a", 1)], ["a", "b", "a", "a"], ([(1, "b"), (3, "a")], [], [(2, 2)])),
+    # a dropped duplicate removes the later copy
+    ([(1, "a", 0), (2, "b", 1), (3, "a", 2)], ["a", "b"], ([], [(3,)], [])),
+    # edited line: delete and insert
+    ([(1, "a", 0), (2, "b", 1)], ["a", "b!"], ([(1, "b!")], [(2,)], [])),
+])
+def test_diff_tasks(existing, tasks, expected):
+    assert _diff_tasks(existing, tasks) == expected
+
+def test_resent_list_keeps_done_state(db):
+    assert database.save_daily_tasks(1, DATE, ["a", "b", "c"]) == (3, 0, 0)
+    ids = {text: task_id for task_id, text, _ in saved()}
+    toggle("b")
+
+    assert database.save_daily_tasks(1, DATE, ["c", "b", "d", "a"], SAVE_DIFF) == (1, 0, 3)
+    assert saved() == [(ids["c"], "c", 0), (ids["b"], "b", 1), (saved()[2][0], "d", 0), (ids["a"], "a", 0)]
+    assert database.get_all_task_status(1, DATE) == (4, 1, False)
+
+def test_duplicates_keep_their_own_rows(db):
+    database.save_daily_tasks(1, DATE, ["ورزش", "کتاب", "ورزش"])
+    first, book, second = saved()
+    database.toggle_task_status(second[0])
+
+    # Copies are matched in order, so moving a line only moves the rows, each with its state
+    assert database.save_daily_tasks(1, DATE, ["کتاب", "ورزش", "ورزش"]) == (0, 0, 3)
+    assert saved() == [(book[0], "کتاب", 0), (first[0], "ورزش", 0), (second[0], "ورزش", 1)]
+
+    # Dropping a copy drops the later row
+    assert database.save_daily_tasks(1, DATE, ["کتاب", "ورزش"]) == (0, 1, 2)
+    assert saved() == [(book[0], "کتاب", 0), (first[0], "ورزش", 0)]
+    assert database.get_all_task_status(1, DATE) == (2, 0, False)
+    assert database.check_daily_counters() == []
+
+def test_removed_lines_and_completion(db):
+    database.save_daily_tasks(1, DATE, ["a", "b", "c"])
+    toggle("a", "c")
+    database.mark_daily_completed(1, DATE)
+
+    # Removing lines keeps the day complete, adding one reopens it
+    assert database.save_daily_tasks(1, DATE, ["c"]) == (0, 2, 1)
+    assert saved() == [(saved()[0][0], "c", 1)]
+    assert database.get_all_task_status(1, DATE) == (1, 1, True)
+    database.save_daily_tasks(1, DATE, ["c", "d"])
+    assert database.get_all_task_status(1, DATE) == (2, 1, False)
+
+def test_blank_lines_and_whitespace_ignored(db):
+    database.save_daily_tasks(1, DATE, ["a", "b"])
+    toggle("a")
+    assert database.save_daily_tasks(1, DATE, ["  a ", "", "b", "   "]) == (0, 0, 2)
+    assert [is_done for _, _, is_done in saved()] == [1, 0]
+
+def test_replace_and_append_modes(db):
+    database.save_daily_tasks(1, DATE, ["a", "b"])
+    toggle("a")
+    assert database.save_daily_tasks(1, DATE, ["a"], SAVE_APPEND) == (1, 0, 0)
+    assert [(text, is_done) for _, text, is_done in saved()] == [("a", 1), ("b", 0), ("a", 0)]
+    assert database.save_daily_tasks(1, DATE, ["a", "b"], SAVE_REPLACE) == (2, 3, 0)
+    assert [(text, is_done) for _, text, is_done in saved()] == [("a", 0), ("b", 0)]
+    assert database.check_daily_counters() == []
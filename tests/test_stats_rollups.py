@@ -0,0 +1,101 @@
+# The /stats rollups kept by migrations.STATS_TRIGGERS must always equal what
+# REBUILD_STATS recomputes from daily_entries. Random saves, toggles, removals,
+# completions, archiving, imports and deleted days over days that cross week and
+# month boundaries, checked after every step.
+import random
+
+import pytest
+
+from src import database
+from src.dates import jalali_to_day, day_to_date, date_to_day
+from src.migrations import REBUILD_STATS
+
+USERS = (1, 2)
+FIRST_DAY = jalali_to_day(1404, 6, 20)
+DAYS = range(FIRST_DAY, FIRST_DAY + 24)
+WORDS = ("a", "b", "c", "d")
+
+# A period whose only day was deleted keeps an all-zero row, which /stats reads
+# the same as no row
+NONZERO = "total_tasks != 0 OR done_tasks != 0 OR active_days != 0 OR completed_days != 0"
+
+ROLLUPS = {
+    "stats_weekly": f"SELECT * FROM stats_weekly WHERE {NONZERO} ORDER BY user_id, week_start",
+    "stats_monthly": f"SELECT * FROM stats_monthly WHERE {NONZERO} ORDER BY user_id, month",
+    "stats_streaks": "SELECT user_id, first_day, last_day FROM stats_streaks ORDER BY user_id, first_day",
+}
+
+def rollups(conn):
+    return {table: conn.execute(sql).fetchall() for table, sql in ROLLUPS.items()}
+
+def assert_rollups_match(step):
+    with database.write_connection() as conn:
+        maintained = rollups(conn)
+        for statement in REBUILD_STATS:
+            conn.execute(statement)
+        rebuilt = rollups(conn)
+    assert maintained == rebuilt, step
+
+def task_ids(user_id, date):
+    return [task_id for task_id, _, _ in database.get_tasks_by_date(user_id, date)]
+
+def toggle(user_id, date, task_id):
+    # As the toggle callback does: a task of an archived day is restored first
+    if not database.toggle_task_status(task_id) and database.restore_archived_day(user_id, date):
+        database.toggle_task_status(task_id)
+
+def step(rng, user_id, date):
+    action = rng.choice(("save", "save", "replace", "append", "toggle", "toggle", "all_done",
+                         "complete", "remove", "archive", "import", "drop_entry"))
+    if action in ("save", "replace", "append"):
+        tasks = [rng.choice(WORDS) for _ in range(rng.randint(1, 5))]
+        mode = {"save": database.SAVE_DIFF, "replace": database.SAVE_REPLACE, "append": database.SAVE_APPEND}[action]
+        database.save_daily_tasks(user_id, date, tasks, mode)
+    elif action == "toggle":
+        ids = task_ids(user_id, date)
+        if ids:
+            toggle(user_id, date, rng.choice(ids))
+    elif action == "all_done":
+        database.mark_all_tasks_done(user_id, date)
+    elif action == "complete":
+        database.mark_daily_completed(user_id, date)
+    elif action == "remove":
+        tasks = [text for _, text, _ in database.get_tasks_by_date(user_id, date)]
+        database.save_daily_tasks(user_id, date, rng.sample(tasks, rng.randint(0, len(tasks))))
+    elif action == "archive":
+        database.archive_days(max(DAYS) + 1, rng.randint(1, 3))
+    elif action == "drop_entry":
+        # Nothing in the bot deletes daily_entries rows, but the triggers cover it
+        database.restore_archived_day(user_id, date)
+        with database.write_connection() as conn:
+            for table in ("tasks", "daily_entries"):
+                conn.execute(f'DELETE FROM {table} WHERE user_id = ? AND day = ?', (user_id, date_to_day(date)))
+    else:
+        rows = [(user_id, date, position, rng.choice(WORDS), rng.randint(0, 1), rng.randint(0, 1))
+                for position in range(rng.randint(1, 4))]
+        database.import_history(rows)
+    return action
+
+@pytest.mark.parametrize("seed", range(4))
+def test_rollups_match_rebuild(db, seed):
+    rng = random.Random(seed)
+    for number in range(250):
+        user_id, day = rng.choice(USERS), rng.choice(DAYS)
+        action = step(rng, user_id, day_to_date(day))
+        assert_rollups_match((number, action, user_id, day_to_date(day)))
+
+def test_streaks_join_and_split(db):
+    # Completing the gap between two runs joins them; un-completing a middle day splits it
+    for day in DAYS[:5]:
+        date = day_to_date(day)
+        database.save_daily_tasks(1, date, ["a"])
+        if day != DAYS[2]:
+            database.mark_daily_completed(1, date)
+    assert_rollups_match("two runs")
+    database.mark_daily_completed(1, day_to_date(DAYS[2]))
+    with database.read_connection() as conn:
+        assert rollups(conn)["stats_streaks"] == [(1, DAYS[0], DAYS[4])]
+    database.save_daily_tasks(1, day_to_date(DAYS[3]), ["a", "b"])
+    with database.read_connection() as conn:
+        assert rollups(conn)["stats_streaks"] == [(1, DAYS[0], DAYS[2]), (1, DAYS[4], DAYS[4])]
+    assert_rollups_match("split")